@@ -1,6 +1,44 @@
 """"
     Icontact Adapter
 """
+import hashlib
+import json
+import re
+from json.encoder import encode_basestring_ascii
+
+from icontact.client import IContactException
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+#contact attributes, named after iContact's fields, in the order they are sent
+FIELDS = ('email', 'prefix', 'firstName', 'lastName', 'suffix', 'street',
+    'street2', 'city', 'state', 'postalCode', 'phone', 'fax', 'business',
+    'status')
+STATE_MAX_LENGTH = 10
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+#"field": prefixes of the json members, encoded once
+_KEYS = dict((field, encode_basestring_ascii(field) + ':') for field in FIELDS)
+
+
+def encode(value):
+    """
+        Returns the json of a field value.
+    """
+    if isinstance(value, string_types):
+        return encode_basestring_ascii(value)
+    return json.dumps(value)
+
+
+class InvalidContactData(IContactException):
+    """
+        Raised by IContactData for data iContact would reject.
+    """
+
+
 class IContactData(object):
     """
         Takes all the possible field for creating
@@ -22,12 +60,18 @@ class IContactData(object):
         
         required arguments:
         email: This field is required and it has to be a valid email address
-    """
         
+        custom: dict of iContact custom fields, by their field name.
+
+        Empty fields are left out of the payload. The email and the length of
+        state are checked once, on construction, InvalidContactData is raised
+        for data iContact would reject.
+    """
+    __slots__ = FIELDS + ('custom',)
 
     def __init__(self, email, prefix="", first_name="", last_name="", suffix="",
             street="", street2="", city="", state="", postal_code="", phone="",
-            fax="", business="", status="normal"):
+            fax="", business="", status="normal", custom=None):
         """
             Instantiate an instance of the class.
             
@@ -36,7 +80,11 @@ class IContactData(object):
             Default values:
             status: "normal"   
         """ 
-        
+        if not email or not EMAIL_RE.match(email):
+            raise InvalidContactData('Invalid email address: %r' % email)
+        if state and len(state) > STATE_MAX_LENGTH:
+            raise InvalidContactData('state is longer than %s characters: %r'
+                % (STATE_MAX_LENGTH, state))
         self.email = email
         self.prefix	= prefix #contact's salutation.	Miss
         self.firstName = first_name
@@ -51,14 +99,47 @@ class IContactData(object):
         self.fax = fax	    #contact's fax number.	8668039462
         self.business = business #contact's business phone number.
         self.status	= status    #values normal and donotcontact, pending
+        self.custom = custom or {}
         
     def get_data(self):
         """
-            return a json seriazible object of all the attributes of the class
+            return a json seriazible object of the non empty fields, a new
+            dict on every call
+        """
+        contact = {}
+        for field in FIELDS:
+            value = getattr(self, field)
+            if value is not None and value != '':
+                contact[field] = value
+        for field, value in self.custom.items():
+            if value is not None and value != '':
+                contact[field] = value
+        return {"contact": contact}
+
+    def get_hash(self):
+        """
+            return a digest of the data, equal for contacts with equal data
         """
-        instance_data = self.__dict__
-        icontact_data = {"contact": instance_data}
-        return icontact_data
+        data = json.dumps(self.get_data(), sort_keys=True)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def to_json(self, contact_id=None):
+        """
+            return the json of the contact, as found in get_data, with
+            contact_id added as its contactId if given. Cheaper than
+            json.dumps(get_data()['contact']).
+        """
+        members = []
+        if contact_id is not None:
+            members.append('"contactId":' + encode(contact_id))
+        for field in FIELDS:
+            value = getattr(self, field)
+            if value is not None and value != '':
+                members.append(_KEYS[field] + encode(value))
+        for field, value in self.custom.items():
+            if value is not None and value != '':
+                members.append(encode(field) + ':' + encode(value))
+        return '{' + ','.join(members) + '}'
         
 
 class IContactAdapter(object):
@@ -74,5 +155,134 @@ class IContactAdapter(object):
             instance of IcontactData.
         """
         raise NotImplementedError
-        
-    
+
+    def bulk_queryset(self, queryset):
+        """
+            Returns the queryset bulk syncs read rows from, rows are passed
+            to get_bulk_contact_data and must have a primary key, as pk or
+            ['pk'].
+        """
+        return queryset
+
+    def get_bulk_contact_data(self, row):
+        """
+            Returns the IContactData of a row of bulk_queryset.
+        """
+        return self.get_contact_data(row)
+
+
+class FieldMapAdapter(IContactAdapter):
+    """
+        Adapter declaring which model field each contact field comes from,
+        instead of building IContactData in code::
+
+            class ContactAdapter(FieldMapAdapter):
+                fields = {'email': 'email', 'first_name': 'user__first_name',
+                    'city': 'address__city'}
+                custom = {'plan': 'account__plan__name'}
+
+        fields maps IContactData arguments, custom maps custom fields, to
+        field paths that follow foreign keys with '__' like queryset lookups.
+
+        Saved instances are read attribute by attribute, bulk syncs read
+        plain rows with values() so only the mapped columns are fetched,
+        related ones joined in the same query.
+    """
+    fields = None
+    custom = None
+    #constant IContactData arguments, e.g. {'status': 'normal'}
+    defaults = None
+
+    def __init__(self, fields=None, custom=None, defaults=None):
+        """
+            Instantiate an instance of the class, the arguments override the
+            class attributes.
+        """
+        self.fields = fields or self.fields or {}
+        self.custom = custom or self.custom or {}
+        self.defaults = defaults or self.defaults or {}
+        if 'email' not in self.fields:
+            raise ValueError('FieldMapAdapter needs a field for email')
+        self.paths = sorted(set(list(self.fields.values()) +
+            list(self.custom.values())))
+
+    def build(self, get):
+        """
+            Returns the IContactData of the values get(path) returns.
+        """
+        kwargs = dict(self.defaults)
+        for argument, path in self.fields.items():
+            kwargs[argument] = get(path)
+        custom = {}
+        for name, path in self.custom.items():
+            custom[name] = get(path)
+        return IContactData(custom=custom, **kwargs)
+
+    def resolve(self, instance, path):
+        """
+            Returns the value of path on instance, None past a relation that
+            is not set.
+        """
+        value = instance
+        for name in path.split('__'):
+            value = getattr(value, name)
+            if value is None:
+                return None
+        return value
+
+    def get_contact_data(self, instance):
+        return self.build(lambda path: self.resolve(instance, path))
+
+    def bulk_queryset(self, queryset):
+        return queryset.values('pk', *self.paths)
+
+    def get_bulk_contact_data(self, row):
+        return self.build(row.get)
+
+
+class ReverseAdapter(object):
+    """
+        Applies changes made in iContact to the objects of a model, see
+        icontact.ingest.
+
+        Events of type t are handled by the method on_t(instance, event),
+        which returns whether instance changed and has to be saved, events
+        without a handler are ignored::
+
+            class ContactReverseAdapter(ReverseAdapter):
+                fields = {'firstName': 'first_name', 'city': 'city'}
+
+                def on_unsubscribe(self, instance, event):
+                    instance.newsletter = False
+                    return True
+
+        fields: iContact fields, as found in the data of an event, mapped to
+                attributes of the model. on_update copies the ones that
+                differ.
+    """
+    fields = {}
+
+    def __init__(self, fields=None):
+        """
+            fields overrides the class attribute.
+        """
+        if fields is not None:
+            self.fields = fields
+
+    def apply(self, instance, event):
+        """
+            Applies event to instance, returns whether instance changed.
+        """
+        handler = getattr(self, 'on_%s' % event.get('type'), None)
+        if handler is None:
+            return False
+        return bool(handler(instance, event))
+
+    def on_update(self, instance, event):
+        data = event.get('data') or {}
+        changed = False
+        for field, attribute in self.fields.items():
+            if field in data and getattr(instance, attribute) != data[field]:
+                setattr(instance, attribute, data[field])
+                changed = True
+        return changed
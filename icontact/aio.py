@@ -0,0 +1,428 @@
+"""
+asyncio version of the Icontact client.
+
+Requires Python 3.6+ and aiohttp, neither of which the rest of the
+application needs. Install the async extra to get aiohttp, the module is left
+out of installs on Python 2.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from icontact import metrics
+from icontact.breaker import CircuitOpen
+from icontact.client import IContactClient, IContactException, \
+    IContactUnavailable, BatchResult, chunks, DEFAULT_BATCH_SIZE, \
+    DEFAULT_PAGE_SIZE, UNAVAILABLE_STATUSES
+from icontact.conf import conf
+from icontact.session import DEFAULT_POOL_MAXSIZE, DEFAULT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 20
+
+if aiohttp is not None:
+    CONNECTION_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+else:
+    CONNECTION_ERRORS = (asyncio.TimeoutError,)
+
+
+class AsyncResponse(object):
+    """
+        The parts of a requests.Response process_response and the retry
+        policy look at, read from an aiohttp response.
+    """
+
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    @property
+    def content(self):
+        return self.body
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class AsyncIContactClient(IContactClient):
+    """
+        Icontact client whose methods are coroutines, for use in asyncio
+        applications.
+
+        Every method of IContactClient is available with the same arguments
+        and has to be awaited, iter_contacts is an async generator. Urls are
+        built by prepare_url and responses checked by process_response
+        exactly like the blocking client does.
+
+        Connections are pooled per client, call close() or use the client as
+        an async context manager when done with it.
+
+        concurrency: most requests in flight at any time, further calls wait
+                for one to finish. Defaults to ICONTACT_ASYNC_CONCURRENCY.
+
+        session: an aiohttp.ClientSession to use instead of creating one.
+    """
+
+    def __init__(self, concurrency=None, session=None, **kwargs):
+        """
+            Instantiate a instance of the class, other keyword arguments are
+            passed to IContactClient.
+        """
+        IContactClient.__init__(self, **kwargs)
+        self.concurrency = concurrency or conf.get(
+            'ASYNC_CONCURRENCY', DEFAULT_CONCURRENCY)
+        self._session = session
+        self._semaphore = None
+
+    @property
+    def semaphore(self):
+        #created lazily so it belongs to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def session(self):
+        """
+            Returns the aiohttp session requests are sent through.
+        """
+        if self._session is None:
+            if aiohttp is None:
+                raise ImproperlyConfigured(
+                    'AsyncIContactClient requires aiohttp')
+            connector = aiohttp.TCPConnector(
+                limit=conf.get('POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE),
+                force_close=not conf.get('KEEP_ALIVE', True))
+            timeout = aiohttp.ClientTimeout(total=conf.get(
+                'TIMEOUT', DEFAULT_TIMEOUT))
+            self._session = aiohttp.ClientSession(connector=connector,
+                timeout=timeout)
+        return self._session
+
+    async def close(self):
+        """
+            Closes the pooled connections.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def connection_stats(self):
+        """
+            Connections are pooled by aiohttp, which doesn't count them.
+        """
+        return {}
+
+    async def _acquire(self):
+        #same as RateLimiter.acquire, without blocking the event loop
+        limiter = self.limiter
+        if limiter is None:
+            return
+        waited = 0
+        for window in [limiter.bucket] + limiter.windows:
+            while True:
+                wait = window.try_acquire()
+                if not wait:
+                    break
+                if waited + wait > limiter.max_wait:
+                    raise IContactException(
+                        'Rate limit exceeded, retry in %.0f seconds' % wait,
+                        status_code=429)
+                await asyncio.sleep(wait)
+                waited += wait
+
+    async def _request(self, method, url, payload=None, params=None,
+            body=None, headers=None):
+        """
+            Sends an authenticated request, retrying and reporting it to
+            icontact.metrics like the blocking client does.
+        """
+        data = body
+        if payload is not None:
+            data = json.dumps(payload)
+        if params is not None:
+            params = dict((key, str(value)) for key, value in params.items())
+        if headers:
+            headers = dict(self._headers, **headers)
+        if not metrics.enabled():
+            return await self._guarded_send(method, url, data, params,
+                headers=headers)
+        call = {'retries': 0}
+        response = error = None
+        start = time.time()
+        try:
+            response = await self._guarded_send(method, url, data, params,
+                call, headers)
+            return response
+        except IContactException as e:
+            error = e
+            raise
+        finally:
+            #aiohttp doesn't tell whether a connection was reused
+            metrics.record(self, method, url, response, time.time() - start,
+                call['retries'], len(data or ''), error=error)
+
+    async def _guarded_send(self, method, url, data, params, call=None,
+            headers=None):
+        """
+            Sends data through the circuit breaker, see
+            IContactClient._guarded_send.
+        """
+        breaker = self.breaker
+        if breaker is None:
+            return await self._send(method, url, data, params, call,
+                headers)
+        try:
+            breaker.acquire()
+        except CircuitOpen as e:
+            raise IContactUnavailable(str(e), status_code=503,
+                retry_after=e.wait)
+        start = time.time()
+        try:
+            response = await self._send(method, url, data, params, call,
+                headers)
+        except IContactUnavailable:
+            breaker.failure()
+            raise
+        if response.status_code in UNAVAILABLE_STATUSES:
+            breaker.failure()
+        else:
+            breaker.success(time.time() - start)
+        return response
+
+    async def _send(self, method, url, data, params, call=None,
+            headers=None):
+        headers = headers or self._headers
+        attempt = 0
+        while True:
+            await self._acquire()
+            response = None
+            try:
+                async with self.semaphore:
+                    async with self.session().request(method, url, data=data,
+                            headers=headers, params=params) as r:
+                        body = await r.read()
+                        response = AsyncResponse(r.status, r.headers, body)
+            except CONNECTION_ERRORS as e:
+                #a POST may have gone through, see IContactClient._send
+                if method == 'POST' or not self.retry.should_retry(attempt):
+                    raise IContactUnavailable(str(e) or 'Timeout')
+            if response is not None and \
+                    not self.retry.should_retry(attempt, response, method):
+                return response
+            delay = self.retry.delay(attempt, response)
+            logger.warning('%s %s failed (%s), retrying in %.1fs', method,
+                url, response is None and 'no response' or
+                response.status_code, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+            if call is not None:
+                call['retries'] = attempt
+
+    async def _call(self, method, resource_url, payload=None, params=None):
+        url = self.prepare_url(resource_url=resource_url)
+        response = await self._request(method, url, payload, params)
+        return self.process_response(response)
+
+    async def create_contact(self, payload=None):
+        """
+            Creates contact from dict, see IContactClient.create_contact.
+        """
+        return await self._call('POST', 'contacts/', payload or {})
+
+    async def get_contact(self, contact_id):
+        """
+            Gets a contact with the provided contactId, through the contact
+            cache, see IContactClient.get_contact.
+        """
+        resource_url = 'contacts/{contact_id}'.format(contact_id=contact_id)
+        cache = self.contact_cache
+        if cache is None:
+            return await self._call('GET', resource_url)
+        contact, etag = cache.lookup(contact_id)
+        if contact is not None:
+            return contact
+        url = self.prepare_url(resource_url=resource_url)
+        response = await self._request('GET', url,
+            headers=etag and {'If-None-Match': etag} or None)
+        if response.status_code == 304:
+            contact = cache.revalidate(contact_id)
+            if contact is not None:
+                return contact
+            response = await self._request('GET', url)
+        data = self.process_response(response)
+        cache.set(contact_id, data, response.headers.get('ETag'))
+        return data
+
+    async def update_contact(self, contact_id, payload=None):
+        """
+            Updates a contact with the provided contactId.
+        """
+        try:
+            return await self._call('PUT', 'contacts/{contact_id}'.format(
+                contact_id=contact_id), payload or {})
+        finally:
+            #even a failed update may have reached iContact
+            self.forget_contacts([contact_id])
+
+    async def delete_contact(self, contact_id):
+        """
+            Deletes a contact with the provided contactId.
+        """
+        try:
+            return await self._call('DELETE', 'contacts/{contact_id}'.format(
+                contact_id=contact_id))
+        finally:
+            self.forget_contacts([contact_id])
+
+    async def get_contacts(self):
+        """
+            Gets all contacts.
+        """
+        return await self._call('GET', 'contacts/')
+
+    async def get_lists(self):
+        """
+            Gets every list of the folder, refreshing the list cache.
+        """
+        lists = (await self._call('GET', 'lists/')).get('lists', [])
+        self.list_cache.set_all(lists)
+        return lists
+
+    async def get_list(self, list_id):
+        """
+            Gets the list with the provided listId.
+        """
+        return (await self._call('GET', 'lists/{list_id}'.format(
+            list_id=list_id)))['list']
+
+    async def create_list(self, name, **fields):
+        """
+            Creates a list called name and returns it.
+        """
+        data = await self._call('POST', 'lists/', [dict(fields, name=name)])
+        list_ = data['lists'][0]
+        self.list_cache.add(list_)
+        return list_
+
+    async def find_list(self, name):
+        """
+            Returns the list called name or None, see
+            IContactClient.find_list.
+        """
+        if not self.list_cache.fresh():
+            await self.get_lists()
+        return self.list_cache.get(name)
+
+    async def get_or_create_list(self, name, **fields):
+        """
+            Returns the list called name, creating it if it doesn't exist.
+        """
+        return await self.find_list(name) or \
+            await self.create_list(name, **fields)
+
+    async def subscribe(self, contact_id, list_id=None):
+        """
+            Subscribe contact to list_id, the default list if not given.
+        """
+        list_id = list_id or self.default_list
+        if self.is_subscribed(contact_id, list_id):
+            return {'subscriptions': []}
+        payload = {'subscription': {'contactId': contact_id,
+            'listId': list_id, 'status': 'normal'}}
+        data = await self._call('POST', 'subscriptions/', payload)
+        self._cache_subscriptions([contact_id], list_id, 'normal')
+        return data
+
+    async def move_many(self, contact_ids, from_list, to_list,
+            batch_size=None):
+        """
+            Moves every contactId in contact_ids from from_list to to_list,
+            see IContactClient.move_many.
+        """
+        batch_size = batch_size or conf.get('BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        result = BatchResult()
+        for chunk in chunks(contact_ids, batch_size):
+            subscribed = await self.subscribe_many(chunk, to_list, batch_size)
+            result.errors.extend(subscribed.errors)
+            result.extend(await self.unsubscribe_many([contact_id
+                for contact_id, _ in subscribed.results], from_list,
+                batch_size))
+        return result
+
+    async def iter_contacts(self, fields=None, page_size=None, prefetch=False,
+            **filters):
+        """
+            Yields every contact one by one, see IContactClient.iter_contacts.
+        """
+        page_size = page_size or conf.get('PAGE_SIZE', DEFAULT_PAGE_SIZE)
+        params = dict(filters, limit=page_size)
+        if fields:
+            params['fields'] = ','.join(fields)
+
+        def fetch(offset):
+            return asyncio.ensure_future(self._call('GET', 'contacts/',
+                params=dict(params, offset=offset)))
+        offset = 0
+        page = await fetch(offset)
+        while True:
+            contacts = page.get('contacts', [])
+            offset += len(contacts)
+            more = len(contacts) == page_size and \
+                offset < page.get('total', offset + 1)
+            prefetched = None
+            if more and prefetch:
+                prefetched = fetch(offset)
+            for contact in contacts:
+                yield contact
+            if not more:
+                return
+            page = await (prefetched or fetch(offset))
+
+    async def _batch(self, resource_url, items, encode, item_key,
+            element_key, response_key, batch_size=None, result=None,
+            done=None):
+        """
+            Posts chunks of items concurrently, up to concurrency chunks at a
+            time. create_contacts, update_contacts, subscribe_many and
+            unsubscribe_many are inherited and return this coroutine.
+        """
+        batch_size = batch_size or conf.get('BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        url = self.prepare_url(resource_url=resource_url)
+
+        async def post(chunk):
+            try:
+                body = '[' + ','.join([encode(i) for i in chunk]) + ']'
+                response = await self._request('POST', url, body=body)
+                data = self.process_response(response, strict=False)
+            except IContactException as e:
+                failed = BatchResult()
+                failed.errors.extend([(item, str(e)) for item in chunk])
+                return failed
+            return self._match_batch(chunk, data, item_key, element_key,
+                response_key)
+
+        if result is None:
+            result = BatchResult()
+        #only hold a window of chunks in memory, not the whole iterable
+        for window in chunks(chunks(items, batch_size), self.concurrency):
+            for partial in await asyncio.gather(*[post(c) for c in window]):
+                if done is not None:
+                    done(partial)
+                result.extend(partial)
+        return result
@@ -0,0 +1,305 @@
+"""
+Pushes the existing rows of an observed model to iContact.
+"""
+import json
+import logging
+import threading
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+
+from icontact.adapter import InvalidContactData
+from icontact.models import IContact, SyncCheckpoint
+from icontact.observer import get_observer
+
+logger = logging.getLogger(__name__)
+
+
+def object_pk(obj):
+    """
+        Returns the primary key of a model instance, or of a row of a values()
+        queryset including pk.
+    """
+    if isinstance(obj, dict):
+        return obj['pk']
+    return obj.pk
+
+
+def iter_pages(queryset, size, start=0):
+    """
+        Yields lists of up to size objects of queryset with a primary key
+        greater than start, in primary key order. Keyset pagination is used,
+        so no query ever loads more than one page.
+    """
+    queryset = queryset.order_by('pk')
+    last = start
+    while True:
+        page = list(queryset.filter(pk__gt=last)[:size].iterator())
+        if not page:
+            return
+        last = object_pk(page[-1])
+        yield page
+
+
+class BackfillStats(object):
+    """
+        Running totals of a backfill.
+    """
+
+    def __init__(self, total=0):
+        self.total = total
+        self.processed = 0
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started = time.time()
+
+    def elapsed(self):
+        """
+            Seconds since the backfill started.
+        """
+        return time.time() - self.started
+
+    def rate(self):
+        """
+            Rows processed per second.
+        """
+        elapsed = self.elapsed()
+        if not elapsed:
+            return 0.0
+        return self.processed / elapsed
+
+    def eta(self):
+        """
+            Estimated seconds left, or None while the rate is unknown.
+        """
+        rate = self.rate()
+        if not rate:
+            return None
+        return max(self.total - self.processed, 0) / rate
+
+
+class Backfill(object):
+    """
+        Streams the rows of model through the adapter it is observed with and
+        creates the ones iContact doesn't know about yet in batches.
+
+        Rows are read in pages of batch_size ordered by primary key, so only
+        concurrency pages are ever held in memory. After each page the
+        highest primary key below which every row has been handled is saved
+        in a SyncCheckpoint, and the next run starts from there.
+
+        update: also push rows already mapped to a contactId.
+
+        Rows of a model routed to an account per instance are read as model
+        instances rather than through bulk_queryset, and each page is
+        synced with every account it has rows of in turn.
+
+        checkpoint: name of the checkpoint, defaults to one per model.
+
+        progress: callable receiving BackfillStats after every page.
+    """
+
+    def __init__(self, model, batch_size=500, concurrency=4, update=False,
+            checkpoint=None, progress=None):
+        """
+            Instantiate an instance of the class.
+        """
+        observer = get_observer(model)
+        if observer is None:
+            raise ValueError('%s is not observed' % model.__name__)
+        self.model = model
+        self.observer = observer
+        self.adapter = observer.adapters[model]
+        self.per_instance = observer.routes_per_instance(model)
+        self.content_type = ContentType.objects.get_for_model(model)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.update = update
+        self.checkpoint_name = checkpoint or 'backfill:%s.%s' % (
+            model._meta.app_label, model._meta.object_name.lower())
+        self.progress = progress
+        self._lock = threading.Lock()
+
+    def checkpoint(self):
+        """
+            Returns the SyncCheckpoint of this backfill.
+        """
+        checkpoint, created = SyncCheckpoint.objects.get_or_create(
+            name=self.checkpoint_name)
+        return checkpoint
+
+    def queryset(self):
+        return self.model._default_manager.order_by('pk')
+
+    def pages(self, start):
+        """
+            Yields lists of up to batch_size rows with a primary key greater
+            than start, using keyset pagination so no query ever loads more
+            than one page.
+
+            Rows are read through the adapter's bulk_queryset, as plain
+            dicts of the mapped columns for a FieldMapAdapter, unless the
+            account of each row has to be known.
+        """
+        queryset = self.queryset()
+        if not self.per_instance:
+            queryset = self.adapter.bulk_queryset(queryset)
+        return iter_pages(queryset, self.batch_size, start)
+
+    def contact_data(self, obj):
+        if self.per_instance:
+            return self.adapter.get_contact_data(obj)
+        return self.adapter.get_bulk_contact_data(obj)
+
+    def by_account(self, objects):
+        """
+            Returns a dict of the rows of objects by the name of the account
+            they are synced with.
+        """
+        if not self.per_instance:
+            return {self.observer.get_account(model=self.model): objects}
+        groups = {}
+        for obj in objects:
+            groups.setdefault(self.observer.get_account(obj), []).append(obj)
+        return groups
+
+    def sync_page(self, objects):
+        """
+            Creates, and optionally updates, the contacts for a page of rows.
+            Returns a dict with the number of rows created, updated, skipped
+            and failed.
+        """
+        counts = {'created': 0, 'updated': 0, 'skipped': 0, 'failed': 0}
+        existing = IContact.objects.get_contact_ids_for(self.model,
+            [object_pk(obj) for obj in objects])
+        for account, rows in self.by_account(objects).items():
+            client = self.observer.client(model=self.model, account=account)
+            self.sync_rows(client, rows, existing, counts)
+        return counts
+
+    def sync_rows(self, client, objects, existing, counts):
+        """
+            Syncs rows of one account with client, adding to counts.
+        """
+        updates = []
+        contacts = []
+        owners = {}
+        for obj in objects:
+            contact_id = existing.get(object_pk(obj))
+            if contact_id is not None and not self.update:
+                counts['skipped'] += 1
+                continue
+            try:
+                contact = self.contact_data(obj)
+            except InvalidContactData as e:
+                logger.warning('could not sync %r: %s', obj, e)
+                counts['failed'] += 1
+                continue
+            owners[id(contact)] = obj
+            if contact_id is None:
+                contacts.append(contact)
+            else:
+                updates.append((contact_id, contact))
+        if contacts:
+            result = client.create_contacts(contacts,
+                batch_size=self.batch_size)
+            mappings = [IContact(content_type=self.content_type,
+                object_id=object_pk(owners[id(contact)]),
+                contact_id=contact_id)
+                for contact, contact_id in result.results]
+            IContact.objects.bulk_create(mappings)
+            subscribed = client.subscribe_many(
+                [m.contact_id for m in mappings], batch_size=self.batch_size)
+            counts['created'] += len(mappings)
+            counts['failed'] += len(result.errors)
+            for contact, message in result.errors:
+                logger.warning('could not create %s: %s', contact.email,
+                    message)
+            for contact_id, message in subscribed.errors:
+                logger.warning('could not subscribe %s: %s', contact_id,
+                    message)
+        if updates:
+            result = client.update_contacts(updates,
+                batch_size=self.batch_size)
+            for (contact_id, contact), _ in result.results:
+                #so the next save only sends what changed since, rows may
+                #be values() dicts so the mapping is updated directly
+                IContact.objects.filter(content_type=self.content_type,
+                    object_id=object_pk(owners[id(contact)])).update(
+                    payload_hash=contact.get_hash(),
+                    payload=json.dumps(contact.get_data()['contact']))
+            counts['updated'] += len(result.results)
+            counts['failed'] += len(result.errors)
+
+    def run(self, restart=False):
+        """
+            Runs the backfill and returns its BackfillStats.
+        """
+        checkpoint = self.checkpoint()
+        if restart:
+            checkpoint.last_pk = 0
+            checkpoint.save()
+        start = checkpoint.last_pk
+        stats = BackfillStats(
+            total=self.queryset().filter(pk__gt=start).count())
+        #pages are handed out in order, but can finish in any order. The
+        #checkpoint only moves past a page once every page before it is done.
+        order = []
+        done = set()
+        pages = self.pages(start)
+        errors = []
+
+        def advance():
+            last = None
+            while order and order[0] in done:
+                last = order.pop(0)
+                done.discard(last)
+            if last is not None:
+                checkpoint.last_pk = last
+                checkpoint.save()
+
+        def work():
+            try:
+                while not errors:
+                    with self._lock:
+                        try:
+                            page = next(pages)
+                        except StopIteration:
+                            return
+                        order.append(object_pk(page[-1]))
+                    counts = self.sync_page(page)
+                    with self._lock:
+                        stats.processed += len(page)
+                        stats.created += counts['created']
+                        stats.updated += counts['updated']
+                        stats.skipped += counts['skipped']
+                        stats.failed += counts['failed']
+                        done.add(object_pk(page[-1]))
+                        advance()
+                        if self.progress is not None:
+                            self.progress(stats)
+            except Exception as e:
+                errors.append(e)
+
+        def thread():
+            try:
+                work()
+            finally:
+                #each thread has its own database connection
+                connection.close()
+
+        if self.concurrency <= 1:
+            work()
+        else:
+            threads = [threading.Thread(target=thread)
+                for i in range(self.concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+        return stats
@@ -0,0 +1,309 @@
+"""
+Benchmarks of the client and the observer against the fake iContact api of
+icontact.testing, so changes to the sync path can be measured without
+reaching iContact.
+
+Results are plain dicts that can be written to json and compared with the
+results of another version by compare.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from itertools import islice
+
+from django.db import transaction
+
+try:
+    import resource
+except ImportError:
+    #not available on windows
+    resource = None
+
+from icontact.adapter import IContactData
+from icontact.breaker import CircuitBreaker
+from icontact.client import IContactClient, IContactException
+from icontact.models import reset_contact_id_cache
+from icontact.observer import get_observer
+from icontact.ratelimit import RateLimiter
+from icontact.testing import FakeIContact
+
+#client methods timed one call at a time
+METHODS = ('create_contact', 'get_contact', 'update_contact', 'subscribe',
+    'delete_contact')
+
+#modules importing the application should not load
+HEAVY_MODULES = ('requests', 'icontact.models', 'django.db',
+    'django.core.cache', 'django.test')
+
+IMPORT_SCRIPT = '''
+import json, sys, time
+start = time.time()
+__import__(%r)
+elapsed = time.time() - start
+print(json.dumps({'ms': elapsed * 1000,
+    'loaded': [name for name in %r if name in sys.modules]}))
+'''
+
+
+def percentile(values, percent):
+    """
+        Returns the value below which percent % of values fall, nearest rank.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def summarize(timings):
+    """
+        Returns the number of calls and their p50, p99 and mean in
+        milliseconds, None when there were no calls.
+    """
+    if not timings:
+        return {'calls': 0, 'p50': None, 'p99': None, 'mean': None}
+    return {'calls': len(timings),
+        'p50': percentile(timings, 50) * 1000,
+        'p99': percentile(timings, 99) * 1000,
+        'mean': sum(timings) / len(timings) * 1000}
+
+
+def max_rss():
+    """
+        Returns the peak resident memory of the process in kilobytes, None
+        where it can't be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        #bytes on mac os, kilobytes elsewhere
+        peak //= 1024
+    return peak
+
+
+def contact_data(count, prefix='bench'):
+    """
+        Yields count IContactData with distinct emails.
+    """
+    for i in range(count):
+        yield IContactData(email='%s%s@example.com' % (prefix, i),
+            first_name='First %s' % i, last_name='Last %s' % i,
+            city='Durham', state='NC')
+
+
+def import_time(module='icontact.observer', repeat=3):
+    """
+        Imports module in a fresh interpreter, without Django settings,
+        repeat times and returns the fastest import in milliseconds along
+        with the HEAVY_MODULES it loaded.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    env.pop('DJANGO_SETTINGS_MODULE', None)
+    best = None
+    for i in range(repeat):
+        process = subprocess.Popen([sys.executable, '-c',
+            IMPORT_SCRIPT % (module, HEAVY_MODULES)], env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = process.communicate()
+        if process.returncode:
+            raise RuntimeError('importing %s failed: %s' % (module,
+                err.decode('utf-8', 'replace')))
+        result = json.loads(out.decode('utf-8'))
+        if best is None or result['ms'] < best['ms']:
+            best = result
+    best['module'] = module
+    return best
+
+
+def flatten(results, prefix=''):
+    """
+        Returns the numbers in the nested dict results keyed by dotted path.
+    """
+    flat = {}
+    for key, value in results.items():
+        path = prefix + str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(previous, current):
+    """
+        Returns (metric, previous, current, change) tuples for the metrics
+        found in both results, change being relative to previous.
+    """
+    before = flatten(previous)
+    after = flatten(current)
+    rows = []
+    for key in sorted(set(before) & set(after)):
+        change = None
+        if before[key]:
+            change = (after[key] - before[key]) / float(before[key])
+        rows.append((key, before[key], after[key], change))
+    return rows
+
+
+class Benchmark(object):
+    """
+        Runs the benchmarks against a FakeIContact.
+
+        contacts: number of contacts created by the bulk benchmark, and
+                number of calls made per client method.
+
+        latency, error_rate, rate_limit: passed to FakeIContact, so results
+                only compare meaningfully between runs with equal settings.
+
+        model: an observed model whose existing rows are saved to measure
+                the observer, skipped when not given.
+    """
+
+    def __init__(self, contacts=1000, latency=0, error_rate=0,
+            rate_limit=None, model=None, batch_size=None):
+        self.contacts = contacts
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.model = model
+        self.batch_size = batch_size
+
+    def client(self, fake):
+        #client side limiting would measure the limiter, not the sync path
+        limiter = RateLimiter(((10 ** 9, 1),), shared=False)
+        #injected errors must not open the account's shared breaker
+        return IContactClient(pool=fake.pool(), limiter=limiter,
+            breaker=CircuitBreaker())
+
+    def fake(self):
+        return FakeIContact(latency=self.latency, error_rate=self.error_rate,
+            rate_limit=self.rate_limit, seed=0)
+
+    def run(self):
+        """
+            Runs every benchmark and returns their results.
+        """
+        results = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'config': {'contacts': self.contacts, 'latency': self.latency,
+                'error_rate': self.error_rate,
+                'rate_limit': self.rate_limit},
+            'import': import_time(),
+            'methods': self.methods(),
+            'bulk': self.bulk(),
+        }
+        if self.model is not None:
+            results['saves'] = self.saves()
+        return results
+
+    def methods(self):
+        """
+            Times single calls of every method in METHODS, and of fetching a
+            page with iter_contacts. Calls failing with an IContactException,
+            which error_rate and rate_limit cause, are timed too and counted
+            in errors.
+        """
+        fake = self.fake()
+        client = self.client(fake)
+        timings = dict((method, []) for method in METHODS)
+        timings['iter_contacts'] = []
+        errors = dict((method, 0) for method in timings)
+        contact_ids = []
+
+        def timed(method, *args, **kwargs):
+            start = time.time()
+            try:
+                return getattr(client, method)(*args, **kwargs)
+            except IContactException:
+                errors[method] += 1
+            finally:
+                timings[method].append(time.time() - start)
+        count = max(self.contacts // 10, 1)
+        for contact in contact_data(count, prefix='method'):
+            data = timed('create_contact', payload=contact.get_data())
+            if data is not None:
+                contact_ids.append(data['contacts'][0]['contactId'])
+        for contact_id in contact_ids:
+            timed('get_contact', contact_id)
+            timed('update_contact', contact_id,
+                {'contact': {'city': 'Raleigh'}})
+            timed('subscribe', contact_id, list_id=1)
+        pages = client.iter_contacts(page_size=20)
+        while True:
+            start = time.time()
+            try:
+                page = list(islice(pages, 20))
+            except IContactException:
+                #the generator is done once it raised
+                errors['iter_contacts'] += 1
+                page = []
+            timings['iter_contacts'].append(time.time() - start)
+            if len(page) < 20:
+                break
+        for contact_id in contact_ids:
+            timed('delete_contact', contact_id)
+        return dict((method, dict(summarize(values), errors=errors[method]))
+            for method, values in timings.items())
+
+    def bulk(self):
+        """
+            Creates and subscribes contacts with the batch methods, returning
+            the throughput, requests per contact and the peak resident memory
+            of the process in kilobytes, which includes the contacts stored
+            by the fake itself.
+        """
+        fake = self.fake()
+        client = self.client(fake)
+        start = time.time()
+        result = client.create_contacts(contact_data(self.contacts),
+            batch_size=self.batch_size)
+        client.subscribe_many((contact_id for contact, contact_id
+            in result.results), list_id=1, batch_size=self.batch_size)
+        elapsed = time.time() - start
+        return {'contacts_per_sec': self.contacts / max(elapsed, 1e-9),
+            'requests_per_contact': len(fake.log) / float(self.contacts),
+            'failed': len(result.errors),
+            'max_rss': max_rss()}
+
+    def saves(self):
+        """
+            Saves up to contacts existing rows of model twice, the first save
+            syncs them and the second one finds nothing changed. Changes are
+            rolled back.
+        """
+        observer = get_observer(self.model)
+        if observer is None:
+            raise ValueError('%s is not observed' % self.model.__name__)
+        fake = self.fake()
+        objects = list(self.model._default_manager.all()[:self.contacts])
+        if not objects:
+            raise ValueError('%s has no rows to save' % self.model.__name__)
+        results = {}
+        previous = observer._client
+        observer._client = self.client(fake)
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        try:
+            for name in ('first', 'unchanged'):
+                requests = len(fake.log)
+                start = time.time()
+                for obj in objects:
+                    obj.save()
+                elapsed = time.time() - start
+                results[name] = {
+                    'saves_per_sec': len(objects) / max(elapsed, 1e-9),
+                    'requests_per_save': (len(fake.log) - requests) /
+                        float(len(objects))}
+        finally:
+            observer._client = previous
+            transaction.rollback()
+            transaction.leave_transaction_management()
+            #the cache still holds the rolled back mappings
+            reset_contact_id_cache()
+        return results
@@ -0,0 +1,145 @@
+"""
+Circuit breaker failing calls to iContact fast while it is down, instead of
+making every caller wait for timeouts and retries.
+"""
+import threading
+import time
+
+from icontact.conf import conf
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+
+
+class CircuitOpen(Exception):
+    """
+        Raised instead of calling iContact while the circuit is open.
+    """
+
+    def __init__(self, wait):
+        Exception.__init__(self,
+            'iContact is unavailable, retry in %.0f seconds' % wait)
+        self.wait = wait
+
+
+class CircuitBreaker(object):
+    """
+        Thread-safe circuit breaker.
+
+        The circuit opens after failure_threshold consecutive failed calls,
+        calls slower than slow_call seconds counting as failures when given.
+        While open, acquire raises CircuitOpen. After reset_timeout seconds
+        one trial call is let through, the circuit closes if it succeeds and
+        opens again if it fails.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+            reset_timeout=DEFAULT_RESET_TIMEOUT, slow_call=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call = slow_call
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+        #start of the trial call of a half-open circuit
+        self._trial = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+            Returns if a call may be made, raises CircuitOpen otherwise.
+        """
+        if self.state == CLOSED:
+            return
+        with self._lock:
+            now = time.time()
+            if self.state == CLOSED:
+                return
+            #a trial that never reported back doesn't hold the circuit
+            if self._trial is None or \
+                    self._trial + self.reset_timeout <= now:
+                if self.opened + self.reset_timeout <= now:
+                    self.state = HALF_OPEN
+                    self._trial = now
+                    return
+            raise CircuitOpen(max(self.opened + self.reset_timeout - now, 0))
+
+    def success(self, duration=0):
+        """
+            Reports a call that succeeded after duration seconds.
+        """
+        if self.slow_call is not None and duration > self.slow_call:
+            self.failure()
+            return
+        with self._lock:
+            self.failures = 0
+            self.state = CLOSED
+            self._trial = None
+
+    def failure(self):
+        """
+            Reports a failed call.
+        """
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or \
+                    self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened = time.time()
+                self._trial = None
+
+    def is_closed(self):
+        return self.state == CLOSED
+
+    def reset(self):
+        """
+            Closes the circuit.
+        """
+        with self._lock:
+            self.failures = 0
+            self.state = CLOSED
+            self.opened = None
+            self._trial = None
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(account_id):
+    """
+        Returns the CircuitBreaker shared by every client of account_id in
+        the process.
+
+        Optional settings:
+
+        ICONTACT_BREAKER_FAILURES: consecutive failures opening the circuit,
+                        0 to disable the breaker.
+
+        ICONTACT_BREAKER_RESET: seconds the circuit stays open.
+
+        ICONTACT_BREAKER_SLOW_CALL: seconds after which a call counts as
+                        failed, even if it succeeded.
+    """
+    threshold = conf.get('BREAKER_FAILURES', DEFAULT_FAILURE_THRESHOLD)
+    if not threshold:
+        return None
+    with _breakers_lock:
+        if account_id not in _breakers:
+            _breakers[account_id] = CircuitBreaker(threshold,
+                reset_timeout=conf.get('BREAKER_RESET', DEFAULT_RESET_TIMEOUT),
+                slow_call=conf.get('BREAKER_SLOW_CALL', None))
+        return _breakers[account_id]
+
+
+def reset_breakers():
+    """
+        Forgets every breaker, the next clients get closed ones built from
+        the current settings.
+    """
+    with _breakers_lock:
+        _breakers.clear()
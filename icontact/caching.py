@@ -0,0 +1,337 @@
+"""
+In-process caches used to avoid repeated database lookups and api calls.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from icontact.conf import conf
+
+DEFAULT_ID_CACHE_SIZE = 10000
+DEFAULT_ID_CACHE_TTL = 300
+DEFAULT_LIST_CACHE_TTL = 300
+DEFAULT_SUBSCRIPTION_CACHE_SIZE = 10000
+DEFAULT_SUBSCRIPTION_CACHE_TTL = 3600
+DEFAULT_CONTACT_CACHE_SIZE = 1000
+DEFAULT_CONTACT_CACHE_TTL = 60
+
+
+class LRUCache(object):
+    """
+        Thread-safe least recently used cache holding at most maxsize items,
+        each for at most ttl seconds if ttl is given.
+    """
+
+    def __init__(self, maxsize=1000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """
+            Returns the value cached for key, or default.
+        """
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires < time.time():
+                return default
+            #re-inserted to mark it as the most recently used
+            self._data[key] = (value, expires)
+            return value
+
+    def set(self, key, value):
+        """
+            Caches value for key, evicting the least recently used item if
+            the cache is full.
+        """
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """
+            Removes key from the cache.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_matching(self, predicate):
+        """
+            Removes the keys predicate returns True for, in one pass over
+            the cache.
+        """
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ListCache(object):
+    """
+        The lists of a folder by name, refreshed as a whole at most every ttl
+        seconds.
+    """
+
+    def __init__(self, ttl=DEFAULT_LIST_CACHE_TTL):
+        self.ttl = ttl
+        self._by_name = {}
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def fresh(self):
+        """
+            Whether every list has been loaded less than ttl seconds ago.
+        """
+        return self._loaded is not None and \
+            self._loaded + self.ttl > time.time()
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def set_all(self, lists):
+        """
+            Replaces the cached lists with lists, dicts with a name key.
+        """
+        with self._lock:
+            self._by_name = dict((l['name'], l) for l in lists)
+            self._loaded = time.time()
+
+    def add(self, list_):
+        with self._lock:
+            self._by_name[list_['name']] = list_
+
+    def clear(self):
+        with self._lock:
+            self._by_name = {}
+            self._loaded = None
+
+
+class ContactIdCache(object):
+    """
+        Caches the contactId of (content type id, object id) pairs in an
+        LRUCache and, optionally, in one of Django's cache backends so it is
+        shared between processes.
+
+        Only known contactIds are cached, a missing mapping is always looked
+        up again.
+    """
+
+    def __init__(self, maxsize=DEFAULT_ID_CACHE_SIZE,
+            ttl=DEFAULT_ID_CACHE_TTL, backend=None):
+        self.local = LRUCache(maxsize, ttl)
+        self.ttl = ttl
+        self.backend = backend
+
+    def _key(self, key):
+        return 'icontact:id:%s:%s' % key
+
+    def get_many(self, keys):
+        """
+            Returns a dict of the cached contactIds for keys.
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            contact_id = self.local.get(key)
+            if contact_id is None:
+                missing.append(key)
+            else:
+                found[key] = contact_id
+        if missing and self.backend is not None:
+            shared = self.backend.get_many([self._key(k) for k in missing])
+            for key in missing:
+                contact_id = shared.get(self._key(key))
+                if contact_id is not None:
+                    self.local.set(key, contact_id)
+                    found[key] = contact_id
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set(self, key, contact_id):
+        self.local.set(key, contact_id)
+        if self.backend is not None:
+            self.backend.set(self._key(key), contact_id, self.ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.backend is not None:
+            self.backend.delete(self._key(key))
+
+    def clear(self):
+        """
+            Empties the local cache, entries in a shared backend expire on
+            their own.
+        """
+        self.local.clear()
+
+
+class ContactCache(object):
+    """
+        Contacts fetched from iContact by contactId, served for ttl seconds.
+        Stale contacts are kept until evicted along with their ETag, so they
+        can be fetched again with a conditional request.
+
+        Counts hits, misses and the misses answered with a 304 Not Modified.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CONTACT_CACHE_SIZE,
+            ttl=DEFAULT_CONTACT_CACHE_TTL):
+        self.ttl = ttl
+        #contactId -> (contact, etag, expires)
+        self._entries = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def lookup(self, contact_id):
+        """
+            Returns (contact, None) if contact_id is cached and fresh,
+            otherwise (None, etag), etag being the one of the stale contact
+            if there is one.
+
+            Returned contacts are copies, callers may change them.
+        """
+        entry = self._entries.get(str(contact_id))
+        if entry is not None and entry[2] > time.time():
+            self._count('hits')
+            return copy.deepcopy(entry[0]), None
+        self._count('misses')
+        return None, entry is not None and entry[1] or None
+
+    def set(self, contact_id, contact, etag=None):
+        self._entries.set(str(contact_id),
+            (copy.deepcopy(contact), etag, time.time() + self.ttl))
+
+    def revalidate(self, contact_id):
+        """
+            Serves the stale contact of contact_id for another ttl seconds,
+            after iContact answered that it didn't change. Returns a copy of
+            it, or None if it has been dropped since.
+        """
+        entry = self._entries.get(str(contact_id))
+        if entry is None:
+            return None
+        self._count('revalidated')
+        self.set(contact_id, entry[0], entry[1])
+        return copy.deepcopy(entry[0])
+
+    def delete(self, contact_id):
+        self._entries.delete(str(contact_id))
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """
+            Returns the counters and the fraction of lookups served without
+            a request.
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+            'revalidated': self.revalidated,
+            'hit_rate': lookups and self.hits / float(lookups) or 0.0}
+
+
+def get_contact_id_cache():
+    """
+        Returns a ContactIdCache configured from settings, or None when
+        caching is disabled.
+
+        Optional settings:
+
+        ICONTACT_ID_CACHE_SIZE: contactIds kept per process, 0 disables the
+                        cache.
+
+        ICONTACT_ID_CACHE_TTL: seconds a contactId is cached for.
+
+        ICONTACT_ID_CACHE_BACKEND: alias of a Django cache to share cached
+                        contactIds between processes.
+    """
+    size = conf.get('ID_CACHE_SIZE', DEFAULT_ID_CACHE_SIZE)
+    if not size:
+        return None
+    backend = conf.get('ID_CACHE_BACKEND', None)
+    if backend is not None:
+        from django.core.cache import get_cache
+        backend = get_cache(backend)
+    return ContactIdCache(maxsize=size,
+        ttl=conf.get('ID_CACHE_TTL', DEFAULT_ID_CACHE_TTL),
+        backend=backend)
+
+
+def get_list_cache():
+    """
+        Returns a ListCache configured from settings.
+
+        Optional settings:
+
+        ICONTACT_LIST_CACHE_TTL: seconds the lists are cached for.
+    """
+    return ListCache(ttl=conf.get('LIST_CACHE_TTL', DEFAULT_LIST_CACHE_TTL))
+
+
+def get_subscription_cache():
+    """
+        Returns an LRUCache of subscription statuses by (listId, contactId),
+        or None when caching is disabled.
+
+        Optional settings:
+
+        ICONTACT_SUBSCRIPTION_CACHE_SIZE: statuses kept per client, 0
+                        disables the cache.
+
+        ICONTACT_SUBSCRIPTION_CACHE_TTL: seconds a status is cached for, a
+                        contact unsubscribed on iContact's side since is
+                        only subscribed again once it expires.
+    """
+    size = conf.get('SUBSCRIPTION_CACHE_SIZE', DEFAULT_SUBSCRIPTION_CACHE_SIZE)
+    if not size:
+        return None
+    return LRUCache(maxsize=size, ttl=conf.get(
+        'SUBSCRIPTION_CACHE_TTL', DEFAULT_SUBSCRIPTION_CACHE_TTL))
+
+
+def get_contact_cache():
+    """
+        Returns a ContactCache, or None when caching is disabled.
+
+        Optional settings:
+
+        ICONTACT_CONTACT_CACHE_SIZE: contacts kept per client, 0 disables the
+                        cache.
+
+        ICONTACT_CONTACT_CACHE_TTL: seconds a contact is served without
+                        asking iContact, changes made on iContact's side
+                        since are only seen once it expires.
+    """
+    size = conf.get('CONTACT_CACHE_SIZE', DEFAULT_CONTACT_CACHE_SIZE)
+    if not size:
+        return None
+    return ContactCache(maxsize=size,
+        ttl=conf.get('CONTACT_CACHE_TTL', DEFAULT_CONTACT_CACHE_TTL))
@@ -1,11 +1,20 @@
 """
 Icontact client for python
 """
-import requests
 import logging
 import json
+import threading
+import time
+from itertools import islice
 
-from django.conf import settings
+from icontact import metrics
+from icontact.breaker import CircuitOpen, get_breaker
+from icontact.caching import get_contact_cache, get_list_cache, \
+    get_subscription_cache
+from icontact.conf import conf
+from icontact.ratelimit import RateLimitExceeded, get_limiter, \
+    get_retry_policy
+from icontact.session import get_pool
 
 logger = logging.getLogger(__name__)
 
@@ -26,9 +35,117 @@ STATUS_CODES = {
 }
 
 
-class IContactException(Exception): pass
+#statuses of a gateway or server that is down, as opposed to errors raised
+#by the request itself, which would fail again if replayed
+UNAVAILABLE_STATUSES = (502, 503, 504)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PAGE_SIZE = 500
+
+
+class IContactException(Exception):
+    """
+        Raised when iContact rejects a request. status_code holds the http
+        status of the response, if there was one.
+    """
+
+    def __init__(self, message='', status_code=None):
+        Exception.__init__(self, message)
+        self.status_code = status_code
+
+
+class IContactUnavailable(IContactException):
+    """
+        Raised when iContact could not be reached, or without trying while
+        its circuit breaker is open, so the call can be made again later.
+        retry_after holds the seconds until the breaker lets calls through,
+        if known.
+    """
+
+    def __init__(self, message='', status_code=None, retry_after=None):
+        IContactException.__init__(self, message, status_code)
+        self.retry_after = retry_after
+
+
+class BatchResult(object):
+    """
+        Outcome of a batch call.
+
+        results: list of (item, contactId) tuples for the items iContact
+                accepted.
+
+        errors: list of (item, message) tuples for the items iContact
+                rejected or that could not be sent.
+    """
+
+    def __init__(self):
+        self.results = []
+        self.errors = []
+
+    def __len__(self):
+        return len(self.results) + len(self.errors)
+
+    def extend(self, other):
+        """
+            Adds the results and errors of another BatchResult to this one.
+        """
+        self.results.extend(other.results)
+        self.errors.extend(other.errors)
+
+
+class Prefetch(object):
+    """
+        Calls function in a background thread, result() waits for it and
+        returns its return value or raises its exception.
+    """
+
+    def __init__(self, function, *args):
+        self._value = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run,
+            args=(function, args))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, function, args):
+        try:
+            self._value = function(*args)
+        except Exception as e:
+            self._error = e
+
+    def result(self):
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+def chunks(iterable, size):
+    """
+        Splits any iterable in lists of at most size items without loading
+        it all in memory.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
     
     
+def contact_json(contact, contact_id=None):
+    """
+        Returns the json of the contact data of contact, using its to_json
+        method when it has one.
+    """
+    if hasattr(contact, 'to_json'):
+        return contact.to_json(contact_id)
+    data = contact.get_data()['contact']
+    if contact_id is not None:
+        data = dict(data, contactId=contact_id)
+    return json.dumps(data)
+
+
 class IContactClient(object):
     """
         Icontact Client to create, update, delete contacts, and subscribe
@@ -61,22 +178,177 @@ class IContactClient(object):
     """    
         
 
-    def __init__(self, api_key=settings.ICONTACT_API_KEY,
-            username=settings.ICONTACT_USERNAME, 
-            password=settings.ICONTACT_PASSWORD,
-            account_id=settings.ICONTACT_ACCOUNT_ID,
-            folder_id=settings.ICONTACT_FOLDER_ID):
+    def __init__(self, api_key=None, username=None, password=None,
+            account_id=None, folder_id=None, pool=None, limiter=None,
+            retry=None, default_list=None, breaker=None):
         """
             Instantiate a instance of the class, not arguments are required.
+            Credentials, account_id, folder_id and default_list not given are
+            read from settings when the client is created.
+
+            pool: a ConnectionPool to send requests through, by default the
+                pool shared by every client in the process is used.
+
+            limiter: a RateLimiter, by default the one shared by every client
+                of the account in the process.
+
+            retry: a RetryPolicy for failed requests, by default built from
+                settings.
+
+            breaker: a CircuitBreaker, by default the one shared by every
+                client of the account in the process.
         """
             
-        self.api_key = api_key 
-        self.username = username
-        self.password = password
-        self.api_version = settings.ICONTACT_API_VERSION
-        self.account_id = account_id
-        self.folder_id = folder_id
+        self.api_key = api_key or conf.require('API_KEY')
+        self.username = username or conf.require('USERNAME')
+        self.password = password or conf.require('PASSWORD')
+        self.api_version = conf.require('API_VERSION')
+        self.account_id = account_id or conf.require('ACCOUNT_ID')
+        self.folder_id = folder_id or conf.require('FOLDER_ID')
+        self.default_list = default_list or conf.get('DEFAULT_LIST', None)
+        self._pool = pool
+        self.limiter = limiter or get_limiter(self.account_id)
+        self.retry = retry or get_retry_policy()
+        self.breaker = breaker or get_breaker(self.account_id)
+        self.list_cache = get_list_cache()
+        #subscription statuses by (listId, contactId), or None
+        self.subscription_cache = get_subscription_cache()
+        #contacts by contactId, or None
+        self.contact_cache = get_contact_cache()
+        #built once, they don't change for the life of the client
+        self._headers = self._get_headers()
+        self._base_url = "{base}a/{account_id}/c/{folder_id}/".format(
+            base=conf.require('URL'),
+            account_id=self.account_id,
+            folder_id=self.folder_id)
     
+    @property
+    def pool(self):
+        """
+            ConnectionPool used to talk to iContact.
+        """
+        if self._pool is None:
+            return get_pool()
+        return self._pool
+
+    def connection_stats(self):
+        """
+            Returns the number of connections opened and reused by the pool
+            this client sends its requests through.
+        """
+        return self.pool.stats()
+
+    def _request(self, method, url, payload=None, params=None, body=None,
+            headers=None):
+        """
+            Sends an authenticated request through the connection pool.
+
+            Requests wait for the rate limiter, and are retried according to
+            the retry policy on connection errors and on responses that mean
+            iContact did not process them (429 and 5xx). Timeouts and
+            connection errors are only retried for idempotent methods, as a
+            POST may have gone through.
+
+            While the circuit breaker is open IContactUnavailable is raised
+            right away, see _guarded_send.
+
+            The call is reported to icontact.metrics when instrumentation is
+            enabled.
+
+            body: payload already serialized to json.
+
+            headers: sent along with the authentication headers.
+        """
+        data = body
+        if payload is not None:
+            data = json.dumps(payload)
+        if headers:
+            headers = dict(self._headers, **headers)
+        if not metrics.enabled():
+            return self._guarded_send(method, url, data, params,
+                headers=headers)
+        call = {'retries': 0}
+        #approximate when other threads open connections at the same time
+        opened = self.pool.stats()['opened']
+        response = error = None
+        start = time.time()
+        try:
+            response = self._guarded_send(method, url, data, params, call,
+                headers)
+            return response
+        except IContactException as e:
+            error = e
+            raise
+        finally:
+            metrics.record(self, method, url, response, time.time() - start,
+                call['retries'], len(data or ''),
+                reused=self.pool.stats()['opened'] == opened, error=error)
+
+    def _guarded_send(self, method, url, data, params, call=None,
+            headers=None):
+        """
+            Sends data through the circuit breaker. Calls that got no
+            response or one of UNAVAILABLE_STATUSES after their retries count
+            as failures, other responses as successes.
+        """
+        breaker = self.breaker
+        if breaker is None:
+            return self._send(method, url, data, params, call, headers)
+        try:
+            breaker.acquire()
+        except CircuitOpen as e:
+            raise IContactUnavailable(str(e), status_code=503,
+                retry_after=e.wait)
+        start = time.time()
+        try:
+            response = self._send(method, url, data, params, call, headers)
+        except IContactUnavailable:
+            breaker.failure()
+            raise
+        if response.status_code in UNAVAILABLE_STATUSES:
+            breaker.failure()
+        else:
+            breaker.success(time.time() - start)
+        return response
+
+    def _send(self, method, url, data, params, call=None, headers=None):
+        """
+            Sends data until it is not retried anymore, counting the retries
+            in call['retries'] if call is given.
+        """
+        #requests is only imported once a request is sent
+        from requests.exceptions import ConnectionError, Timeout
+        headers = headers or self._headers
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                try:
+                    self.limiter.acquire()
+                except RateLimitExceeded as e:
+                    raise IContactException(str(e), status_code=429)
+            response = None
+            try:
+                response = self.pool.request(method, url, data=data,
+                    headers=headers, params=params)
+            except Timeout as e:
+                if method == 'POST' or not self.retry.should_retry(attempt):
+                    raise IContactUnavailable(str(e))
+            except ConnectionError as e:
+                #the connection may have dropped after the request was sent
+                if method == 'POST' or not self.retry.should_retry(attempt):
+                    raise IContactUnavailable(str(e))
+            if response is not None and \
+                    not self.retry.should_retry(attempt, response, method):
+                return response
+            delay = self.retry.delay(attempt, response)
+            logger.warning('%s %s failed (%s), retrying in %.1fs', method,
+                url, response is None and 'no response' or
+                response.status_code, delay)
+            time.sleep(delay)
+            attempt += 1
+            if call is not None:
+                call['retries'] = attempt
+
     def _get_headers(self, **kwargs):
         """
             Headers required to authenticate your request. 
@@ -93,7 +365,7 @@ class IContactClient(object):
             }
         headers.update(kwargs)
         return headers
-        
+
     def prepare_url(self, resource_url=""):
         """
             Prepares an url to make requests to.
@@ -102,33 +374,34 @@ class IContactClient(object):
             https://app.sandbox.icontact.com/icp/a/app_id/c/folder_id/resource_path
         
         """
-        url = "{base}a/{account_id}/c/{folder_id}/{resource_url}".format(
-            base=settings.ICONTACT_URL, 
-            account_id=self.account_id,
-            folder_id=self.folder_id,
-            resource_url=resource_url)
-        logging.debug('request url: %s'%url)
+        url = self._base_url + resource_url
+        logger.debug('request url: %s', url)
         return url
         
-    def process_response(self, response):
+    def process_response(self, response, strict=True):
         """
             returns json object if the request was successful, otherwise
-            raises an IcontactException.
+            raises an IcontactException, an IContactUnavailable when
+            iContact is down (UNAVAILABLE_STATUSES).
+
+            Warnings are reported per item by batch requests, pass strict as
+            False to get the data back instead of an exception.
         """
         status_code = response.status_code
-        logging.debug('status code: %s'%status_code)
-        logging.debug(response)
+        logger.debug('status code: %s', status_code)
         if status_code == 200:
             data = response.json()
-            logging.debug(data)
-            if 'warnings' in data:
+            logger.debug('response: %s', data)
+            if strict and 'warnings' in data:
                 raise IContactException(' '.join(data['warnings']))
             if 'errors' in data:
                 raise IContactException(' '.join(data['errors']))
             return data
         message = STATUS_CODES.get(int(status_code), 404)
-        logging.debug(message)
-        raise IContactException(message)
+        logger.debug('error: %s', message)
+        if int(status_code) in UNAVAILABLE_STATUSES:
+            raise IContactUnavailable(message, status_code=status_code)
+        raise IContactException(message, status_code=status_code)
     
     def create_contact(self, payload=None):
         """
@@ -138,11 +411,10 @@ class IContactClient(object):
             payload is a python dict that must at least contain the key "email", 
             as the email field is required by Icontact.
         """
-        logging.debug('method: POST')
+        logger.debug('method: POST')
         url = self.prepare_url(resource_url='contacts/')
         payload = payload or {}
-        r = requests.post(url, data=json.dumps(payload), 
-            headers=self._get_headers())
+        r = self._request('POST', url, payload)
         contact = self.process_response(r)
         return contact
 
@@ -150,25 +422,57 @@ class IContactClient(object):
         """
             Gets a contact with the provided contactId, if it doesn't find a
             match it raises an IcontactException
+
+            Contacts are served from the contact cache while fresh, stale
+            ones are fetched again with their ETag so an unchanged contact
+            costs a 304 without a body.
         """
-        logging.debug('method: GET')
+        logger.debug('method: GET')
         url = self.prepare_url(resource_url='contacts/{contact_id}'.format(
             contact_id=contact_id))
-        r = requests.get(url, headers=self._get_headers())
+        cache = self.contact_cache
+        if cache is None:
+            r = self._request('GET', url)
+            return self.process_response(r)
+        contact, etag = cache.lookup(contact_id)
+        if contact is not None:
+            return contact
+        r = self._request('GET', url,
+            headers=etag and {'If-None-Match': etag} or None)
+        if r.status_code == 304:
+            contact = cache.revalidate(contact_id)
+            if contact is not None:
+                return contact
+            #invalidated while the request was sent
+            r = self._request('GET', url)
         json_response = self.process_response(r)
+        cache.set(contact_id, json_response, r.headers.get('ETag'))
         return json_response
 
+    def forget_contacts(self, contact_ids):
+        """
+            Drops contact_ids from the contact cache, done by the methods
+            changing contacts.
+        """
+        if self.contact_cache is None:
+            return
+        for contact_id in contact_ids:
+            self.contact_cache.delete(contact_id)
+
     def update_contact(self, contact_id, payload=None):
         """
             Updates a contact with the provided contactId, if it doesn't find a
             match it raises an IcontactException
         """
-        logging.debug('method: PUT')
+        logger.debug('method: PUT')
         url = self.prepare_url(resource_url='contacts/{contact_id}'.format(
             contact_id=contact_id))
         payload = payload or {}
-        r = requests.put(url, data=json.dumps(payload), 
-            headers=self._get_headers())
+        try:
+            r = self._request('PUT', url, payload)
+        finally:
+            #even a failed update may have reached iContact
+            self.forget_contacts([contact_id])
         json_response = self.process_response(r)
         return json_response
         
@@ -179,10 +483,13 @@ class IContactClient(object):
             
             Return an empty list if deleted succesfully.
         """
-        logging.debug('method: DELETE')
+        logger.debug('method: DELETE')
         url = self.prepare_url(resource_url='contacts/{contact_id}'.format(
             contact_id=contact_id))
-        r = requests.delete(url, headers=self._get_headers())
+        try:
+            r = self._request('DELETE', url)
+        finally:
+            self.forget_contacts([contact_id])
         json_response = self.process_response(r)
         return json_response
         
@@ -191,13 +498,133 @@ class IContactClient(object):
         """
             Gets all contacts.
         """
-        logging.debug('method: GET')
+        logger.debug('method: GET')
         url = self.prepare_url(resource_url='contacts/')
-        r = requests.get(url, headers=self._get_headers())
+        r = self._request('GET', url)
         json_response = self.process_response(r)
         return json_response
         
-    def subscribe(self, contact_id, list_id=settings.ICONTACT_DEFAULT_LIST):
+    def _get_page(self, url, params, offset):
+        params = dict(params, offset=offset)
+        return self.process_response(self._request('GET', url, params=params))
+
+    def iter_contacts(self, fields=None, page_size=None, prefetch=False,
+            **filters):
+        """
+            Yields every contact one by one, fetching them in pages of
+            page_size so memory use doesn't grow with the number of contacts.
+
+            fields: list of the contact fields to fetch, all by default.
+
+            prefetch: fetch the next page in a background thread while the
+                current one is consumed.
+
+            Other keyword arguments are sent as search filters, for instance
+            status='normal' or email='*@rochapps.com'.
+        """
+        logger.debug('method: GET (paged)')
+        page_size = page_size or conf.get('PAGE_SIZE', DEFAULT_PAGE_SIZE)
+        url = self.prepare_url(resource_url='contacts/')
+        params = dict(filters, limit=page_size)
+        if fields:
+            params['fields'] = ','.join(fields)
+        offset = 0
+        page = self._get_page(url, params, offset)
+        while True:
+            contacts = page.get('contacts', [])
+            offset += len(contacts)
+            more = len(contacts) == page_size and \
+                offset < page.get('total', offset + 1)
+            prefetched = None
+            if more and prefetch:
+                prefetched = Prefetch(self._get_page, url, params, offset)
+            for contact in contacts:
+                yield contact
+            if not more:
+                return
+            if prefetched is not None:
+                page = prefetched.result()
+            else:
+                page = self._get_page(url, params, offset)
+        
+    def get_lists(self):
+        """
+            Gets every list of the folder, refreshing the list cache.
+        """
+        logger.debug('method: GET')
+        url = self.prepare_url(resource_url='lists/')
+        r = self._request('GET', url)
+        lists = self.process_response(r).get('lists', [])
+        self.list_cache.set_all(lists)
+        return lists
+
+    def get_list(self, list_id):
+        """
+            Gets the list with the provided listId, if it doesn't find a
+            match it raises an IcontactException.
+        """
+        logger.debug('method: GET')
+        url = self.prepare_url(resource_url='lists/{list_id}'.format(
+            list_id=list_id))
+        r = self._request('GET', url)
+        return self.process_response(r)['list']
+
+    def create_list(self, name, **fields):
+        """
+            Creates a list called name and returns it, fields are sent along,
+            e.g. welcomeMessageId or description.
+        """
+        logger.debug('method: POST')
+        url = self.prepare_url(resource_url='lists/')
+        r = self._request('POST', url, [dict(fields, name=name)])
+        list_ = self.process_response(r)['lists'][0]
+        self.list_cache.add(list_)
+        return list_
+
+    def find_list(self, name):
+        """
+            Returns the list called name or None, lists are fetched again
+            only once the list cache expired.
+        """
+        if not self.list_cache.fresh():
+            self.get_lists()
+        return self.list_cache.get(name)
+
+    def get_or_create_list(self, name, **fields):
+        """
+            Returns the list called name, creating it if it doesn't exist.
+        """
+        return self.find_list(name) or self.create_list(name, **fields)
+
+    def is_subscribed(self, contact_id, list_id):
+        """
+            Whether the subscription cache knows contact_id to be subscribed
+            to list_id.
+        """
+        if self.subscription_cache is None:
+            return False
+        key = (str(list_id), str(contact_id))
+        return self.subscription_cache.get(key) == 'normal'
+
+    def forget_subscriptions(self, contact_ids):
+        """
+            Drops every subscription of contact_ids from the subscription
+            cache, for subscriptions changed in iContact.
+        """
+        if self.subscription_cache is None:
+            return
+        contact_ids = set(str(contact_id) for contact_id in contact_ids)
+        self.subscription_cache.delete_matching(
+            lambda key: key[1] in contact_ids)
+
+    def _cache_subscriptions(self, contact_ids, list_id, status):
+        if self.subscription_cache is None:
+            return
+        for contact_id in contact_ids:
+            self.subscription_cache.set((str(list_id), str(contact_id)),
+                status)
+
+    def subscribe(self, contact_id, list_id=None):
         """
             Subscribe contact that matches the provided contactId to the
             default list.
@@ -206,12 +633,168 @@ class IContactClient(object):
             
             listId: an Integer reprenting the id of the list you want the
                 contact to be subscribed to.
+
+            Contacts the subscription cache knows to be subscribed already
+            are skipped, an empty list of subscriptions is returned then.
         """
-        logging.debug('method: POST')
+        list_id = list_id or self.default_list
+        if self.is_subscribed(contact_id, list_id):
+            return {'subscriptions': []}
+        logger.debug('method: POST')
         url = self.prepare_url(resource_url='subscriptions/')
-        payload = {'subscription':{'contactId': contact_id, 'listId': list_id,
-            'status': 'normal'}}
-        r = requests.post(url, data=json.dumps(payload), 
-            headers=self._get_headers())
+        payload = {'subscription':{'contactId': contact_id,
+            'listId': list_id, 'status': 'normal'}}
+        r = self._request('POST', url, payload)
         json_response = self.process_response(r)
+        self._cache_subscriptions([contact_id], list_id, 'normal')
         return json_response
+
+    def _batch(self, resource_url, items, encode, item_key, element_key,
+            response_key, batch_size=None, result=None, done=None):
+        """
+            Posts items to resource_url in chunks of batch_size.
+
+            encode(item) returns the json of the array element sent for an
+            item, returned elements are matched back to items by comparing
+            item_key(item) with element_key(element).
+
+            result: BatchResult the outcome is added to, a new one by default.
+
+            done: called with the BatchResult of every chunk sent.
+        """
+        batch_size = batch_size or conf.get('BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        url = self.prepare_url(resource_url=resource_url)
+        if result is None:
+            result = BatchResult()
+        for chunk in chunks(items, batch_size):
+            logger.debug('method: POST (%s items)', len(chunk))
+            try:
+                body = '[' + ','.join([encode(i) for i in chunk]) + ']'
+                r = self._request('POST', url, body=body)
+                data = self.process_response(r, strict=False)
+            except IContactException as e:
+                result.errors.extend([(item, str(e)) for item in chunk])
+                continue
+            partial = self._match_batch(chunk, data, item_key, element_key,
+                response_key)
+            if done is not None:
+                done(partial)
+            result.extend(partial)
+        return result
+
+    def _match_batch(self, chunk, data, item_key, element_key, response_key):
+        """
+            Matches the elements of a batch response back to the items of
+            chunk, returns a BatchResult.
+        """
+        result = BatchResult()
+        pending = {}
+        for item in chunk:
+            pending.setdefault(item_key(item), []).append(item)
+        for element in data.get(response_key, []):
+            matches = pending.get(element_key(element))
+            if matches:
+                result.results.append((matches.pop(0), element['contactId']))
+        message = ' '.join(data.get('warnings', [])) or 'Rejected by iContact'
+        for matches in pending.values():
+            result.errors.extend([(item, message) for item in matches])
+        return result
+
+    def create_contacts(self, contacts, batch_size=None):
+        """
+            Creates contacts from an iterable of IContactData, sending up to
+            batch_size contacts per request.
+
+            Returns a BatchResult of (IContactData, contactId) tuples, items
+            are matched back to iContact's response by email.
+        """
+        return self._batch('contacts/', contacts, contact_json,
+            lambda contact: contact.email.lower(),
+            lambda element: element.get('email', '').lower(),
+            'contacts', batch_size)
+
+    def update_contacts(self, contacts, batch_size=None):
+        """
+            Updates contacts from an iterable of (contactId, IContactData)
+            tuples, sending up to batch_size contacts per request.
+
+            Returns a BatchResult of ((contactId, IContactData), contactId)
+            tuples.
+        """
+        def encode(item):
+            self.forget_contacts([item[0]])
+            return contact_json(item[1], item[0])
+        return self._batch('contacts/', contacts, encode,
+            lambda item: str(item[0]),
+            lambda element: str(element.get('contactId')),
+            'contacts', batch_size)
+
+    def _subscriptions(self, contact_ids, list_id, status, batch_size):
+        """
+            Posts subscriptions with status for contact_ids to list_id,
+            contacts the subscription cache already knows with that status
+            are counted as results without being sent.
+        """
+        result = BatchResult()
+        cache = self.subscription_cache
+
+        def pending():
+            for contact_id in contact_ids:
+                if cache is not None and cache.get(
+                        (str(list_id), str(contact_id))) == status:
+                    result.results.append((contact_id, contact_id))
+                else:
+                    yield contact_id
+
+        def encode(contact_id):
+            return json.dumps({'contactId': contact_id, 'listId': list_id,
+                'status': status})
+
+        def done(partial):
+            self._cache_subscriptions([contact_id for contact_id, _
+                in partial.results], list_id, status)
+        return self._batch('subscriptions/', pending(), encode,
+            lambda contact_id: str(contact_id),
+            lambda element: str(element.get('contactId')),
+            'subscriptions', batch_size, result=result, done=done)
+
+    def subscribe_many(self, contact_ids, list_id=None, batch_size=None):
+        """
+            Subscribes every contactId in contact_ids to list_id, the default
+            list if not given, sending up to batch_size subscriptions per
+            request.
+
+            Returns a BatchResult of (contactId, contactId) tuples, contacts
+            the subscription cache knows to be subscribed are not sent again.
+        """
+        return self._subscriptions(contact_ids, list_id or self.default_list,
+            'normal', batch_size)
+
+    def unsubscribe_many(self, contact_ids, list_id=None, batch_size=None):
+        """
+            Unsubscribes every contactId in contact_ids from list_id, the
+            default list if not given, sending up to batch_size subscriptions
+            per request.
+
+            Returns a BatchResult of (contactId, contactId) tuples.
+        """
+        return self._subscriptions(contact_ids, list_id or self.default_list,
+            'unsubscribed', batch_size)
+
+    def move_many(self, contact_ids, from_list, to_list, batch_size=None):
+        """
+            Moves every contactId in contact_ids from from_list to to_list,
+            batch_size contacts at a time. Contacts are only unsubscribed from
+            from_list once they are subscribed to to_list.
+
+            Returns a BatchResult of (contactId, contactId) tuples for the
+            contacts moved.
+        """
+        batch_size = batch_size or conf.get('BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        result = BatchResult()
+        for chunk in chunks(contact_ids, batch_size):
+            subscribed = self.subscribe_many(chunk, to_list, batch_size)
+            result.errors.extend(subscribed.errors)
+            result.extend(self.unsubscribe_many([contact_id for contact_id, _
+                in subscribed.results], from_list, batch_size))
+        return result
@@ -0,0 +1,99 @@
+"""
+Coalescing of the changes made to observed objects within a request or a
+block of code, so each object is synced with iContact once at the end.
+"""
+import copy
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_state = threading.local()
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+
+
+def is_active():
+    """
+        Whether changes are being coalesced in the current thread.
+    """
+    return getattr(_state, 'depth', 0) > 0
+
+
+def begin():
+    """
+        Starts coalescing changes in the current thread. Calls can be nested,
+        changes are only flushed when the outermost block ends.
+    """
+    if not is_active():
+        _state.depth = 0
+        _state.pending = OrderedDict()
+    _state.depth += 1
+
+
+def merge(previous, action):
+    """
+        Returns the single action equivalent to previous followed by action,
+        or None if they cancel out.
+    """
+    if previous is None:
+        return action
+    if previous == CREATE:
+        if action == DELETE:
+            return None
+        return CREATE
+    if previous == DELETE:
+        #the primary key has been reused, the mapping still exists
+        return UPDATE
+    return action
+
+
+def record(observer, action, sender, instance):
+    """
+        Records a change made to instance, merging it with the changes
+        already recorded for it. Returns True if it was merged.
+    """
+    key = (sender, instance.pk)
+    if action == DELETE:
+        #Django clears the primary key of deleted instances after the
+        #signal, the flush needs it
+        instance = copy.copy(instance)
+    previous = _state.pending.pop(key, None)
+    previous_action = previous and previous[1]
+    merged = merge(previous_action, action)
+    if merged is not None:
+        _state.pending[key] = (observer, merged, instance)
+    return previous is not None
+
+
+def end(commit=True):
+    """
+        Ends a block started with begin. When the outermost block ends the
+        recorded changes are sent to their observers if commit is True, and
+        dropped otherwise.
+    """
+    _state.depth -= 1
+    if _state.depth:
+        return
+    pending = _state.pending
+    _state.pending = None
+    if not commit:
+        return
+    for (sender, pk), (observer, action, instance) in pending.items():
+        observer.dispatch(action, sender, instance)
+
+
+@contextmanager
+def coalescing():
+    """
+        Context manager coalescing the changes made inside it, they are
+        dropped if it exits with an exception.
+    """
+    begin()
+    try:
+        yield
+    except Exception:
+        end(commit=False)
+        raise
+    end()
@@ -0,0 +1,83 @@
+"""
+Settings of the icontact application.
+
+ICONTACT_* settings are read from Django's settings the first time they are
+used and cached, so importing the application doesn't need them and reading
+one afterwards is a dict lookup. Cached values are dropped when a setting is
+changed with override_settings, or by calling conf.reload().
+"""
+import sys
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+PREFIX = 'ICONTACT_'
+
+_missing = object()
+
+
+class Settings(object):
+    """
+        Cached ICONTACT_* settings, by their name without the prefix, e.g.
+        conf.get('BATCH_SIZE', 500).
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._connected = False
+        self._lock = threading.Lock()
+
+    def get(self, name, default=None):
+        """
+            Returns the ICONTACT_<name> setting, or default if it isn't set.
+        """
+        if not self._connected:
+            self._connect()
+        try:
+            value = self._values[name]
+        except KeyError:
+            value = self._values[name] = getattr(settings, PREFIX + name,
+                _missing)
+        if value is _missing:
+            return default
+        return value
+
+    def require(self, name):
+        """
+            Returns the ICONTACT_<name> setting, raises ImproperlyConfigured
+            if it isn't set.
+        """
+        value = self.get(name, _missing)
+        if value is _missing:
+            raise ImproperlyConfigured('The %s%s setting is required'
+                % (PREFIX, name))
+        return value
+
+    def reload(self):
+        """
+            Forgets every cached setting, they are read again when next used.
+        """
+        with self._lock:
+            self._values = {}
+
+    def _connect(self):
+        #django.test is slow to import, only listen once something such as
+        #override_settings imported it, settings cached before may be stale
+        signals = sys.modules.get('django.test.signals')
+        if signals is None:
+            return
+        with self._lock:
+            if self._connected:
+                return
+            signals.setting_changed.connect(self._changed)
+            self._connected = True
+            self._values = {}
+
+    def _changed(self, setting=None, **kwargs):
+        if setting and setting.startswith(PREFIX):
+            with self._lock:
+                self._values.pop(setting[len(PREFIX):], None)
+
+
+conf = Settings()
@@ -0,0 +1,122 @@
+"""
+Runs sync operations for many objects concurrently, see
+IContactObserver.sync_many.
+"""
+import logging
+import threading
+from collections import deque
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+from icontact.client import BatchResult
+from icontact.conf import conf
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYNC_THREADS = 4
+
+
+class SyncExecutor(object):
+    """
+        Calls function(instance) for many instances from a pool of threads.
+
+        Instances of the same object, by model and primary key, are run one
+        after the other in the order they were given, while different objects
+        run concurrently. At most window instances are read ahead of the ones
+        finished, so any iterable can be passed without loading it all.
+
+        function returns the contactId of the instance, exceptions it raises
+        are reported as errors of the instance.
+
+        threads: number of threads, 1 or less runs everything in the calling
+                thread.
+
+        window: instances waiting or running at a time, 4 per thread by
+                default.
+    """
+
+    def __init__(self, function, threads=None, window=None):
+        self.function = function
+        self.threads = threads or conf.get('SYNC_THREADS',
+            DEFAULT_SYNC_THREADS)
+        self.window = window or self.threads * 4
+
+    def call(self, instance, result, lock):
+        try:
+            contact_id = self.function(instance)
+        except Exception as e:
+            logger.warning('could not sync %r: %s', instance, e)
+            with lock:
+                result.errors.append((instance, str(e)))
+            return
+        with lock:
+            result.results.append((instance, contact_id))
+
+    def run(self, instances):
+        """
+            Runs function for every instance of instances and returns a
+            BatchResult of (instance, contactId) tuples, in the order they
+            finished.
+        """
+        result = BatchResult()
+        if self.threads <= 1:
+            lock = threading.Lock()
+            for instance in instances:
+                self.call(instance, result, lock)
+            return result
+        cond = threading.Condition()
+        #object -> its instances not started yet, present while one of its
+        #instances is queued or running
+        pending = {}
+        #objects handed to the threads, None tells a thread to stop
+        ready = Queue()
+        state = {'running': 0}
+
+        def work():
+            from django.db import connection
+            try:
+                while True:
+                    key = ready.get()
+                    if key is None:
+                        return
+                    #the thread that got an object runs all its instances
+                    while True:
+                        with cond:
+                            if not pending[key]:
+                                del pending[key]
+                                break
+                            instance = pending[key].popleft()
+                        self.call(instance, result, cond)
+                        with cond:
+                            state['running'] -= 1
+                            cond.notify()
+            finally:
+                #each thread has its own database connection
+                connection.close()
+
+        threads = [threading.Thread(target=work, name='icontact-sync-%s' % i)
+            for i in range(self.threads)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            for instance in instances:
+                key = (instance.__class__, instance.pk)
+                with cond:
+                    while state['running'] >= self.window:
+                        cond.wait()
+                    state['running'] += 1
+                    if key in pending:
+                        pending[key].append(instance)
+                    else:
+                        pending[key] = deque([instance])
+                        ready.put(key)
+        finally:
+            for thread in threads:
+                ready.put(None)
+            for thread in threads:
+                thread.join()
+        return result
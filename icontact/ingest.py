@@ -0,0 +1,238 @@
+"""
+Applies changes made in iContact, such as unsubscribes, bounces and edits, to
+the local objects synced with the contacts.
+
+Events are dicts::
+
+    {'id': 'a1b2', 'type': 'unsubscribe', 'contactId': '1234',
+        'data': {'status': 'unsubscribed'}}
+
+posted to icontact.views.webhook, or built from polled contacts by
+contact_events. id is the idempotency key of the event, events without one
+are rejected.
+"""
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+
+from django.db import transaction
+
+from icontact.adapter import InvalidContactData
+from icontact.client import chunks
+from icontact.conf import conf
+from icontact.models import IContact, IContactEvent
+from icontact.observer import get_observer, suppressed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INGEST_BATCH_SIZE = 500
+
+#model -> ReverseAdapter applying events to its objects
+_adapters = {}
+
+
+def register(model, adapter):
+    """
+        Applies the events of contacts synced with objects of model through
+        adapter, an icontact.adapter.ReverseAdapter.
+    """
+    _adapters[model] = adapter
+
+
+def unregister(model):
+    """
+        Stops applying events to objects of model.
+    """
+    _adapters.pop(model, None)
+
+
+#fields of contact records holding their last modification time
+VERSION_FIELDS = ('modifiedDate', 'updateDate')
+
+
+def event_key(event):
+    """
+        Returns the idempotency key of event, None if it has no id.
+    """
+    key = event.get('id')
+    if not key:
+        return None
+    return str(key)[:100]
+
+
+def contact_version(contact):
+    """
+        Returns the version of a contact record, its modification time, or
+        a hash of the record when it has none. Without a modification time,
+        a contact changed back to data polled before is only applied again
+        once the earlier key has been purged.
+    """
+    for field in VERSION_FIELDS:
+        if contact.get(field):
+            return str(contact[field])
+    data = json.dumps(contact, sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def contact_events(contacts):
+    """
+        Yields an update event per contact record, e.g. of
+        IContactClient.iter_contacts. Keys are the contactId and version of
+        the records, so polling contacts that didn't change again is a no-op.
+    """
+    for contact in contacts:
+        yield {'id': 'contact:%s:%s' % (contact['contactId'],
+            contact_version(contact)),
+            'type': 'update', 'contactId': contact['contactId'],
+            'data': contact}
+
+
+class IngestResult(object):
+    """
+        Outcome of processing events.
+
+        applied: events that changed an object.
+
+        unchanged: events applied to an object without changing it, or of a
+                type its adapter ignores.
+
+        duplicates: events skipped because they had been applied already.
+
+        unknown: events of contacts not synced with an object of a
+                registered model.
+
+        errors: list of (event, message) tuples for the events that could
+                not be applied, they are applied again when redelivered.
+    """
+
+    def __init__(self):
+        self.applied = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.unknown = 0
+        self.errors = []
+
+    def as_dict(self):
+        return {'applied': self.applied, 'unchanged': self.unchanged,
+            'duplicates': self.duplicates, 'unknown': self.unknown,
+            'errors': len(self.errors)}
+
+
+class EventProcessor(object):
+    """
+        Applies events in batches of batch_size, each in its own transaction.
+        A batch takes one query to find the events already applied, one for
+        the contactId mappings and one per model for the objects, then a save
+        per changed object and one insert of the keys. A batch of events
+        applied already takes the first query only.
+
+        The changed objects are saved with the observers suppressed, as
+        iContact has the changes already, and the snapshots the observers
+        diff against are updated. The contacts of the events are dropped from
+        the contact and subscription caches of the observers' clients once
+        the batch is committed.
+
+        adapters: dict of ReverseAdapter by model, the registered ones by
+                default.
+    """
+
+    def __init__(self, adapters=None, batch_size=None):
+        self.adapters = adapters if adapters is not None else _adapters
+        self.batch_size = batch_size or conf.get(
+            'INGEST_BATCH_SIZE', DEFAULT_INGEST_BATCH_SIZE)
+
+    def process(self, events):
+        """
+            Applies an iterable of events, returns an IngestResult.
+        """
+        result = IngestResult()
+        for batch in chunks(events, self.batch_size):
+            self.process_batch(batch, result)
+        return result
+
+    def process_batch(self, events, result):
+        keyed = OrderedDict()
+        for event in events:
+            key = event_key(event)
+            if key is None:
+                result.errors.append((event, 'missing id'))
+                continue
+            if key in keyed:
+                result.duplicates += 1
+                continue
+            keyed[key] = event
+        with transaction.commit_on_success():
+            seen = IContactEvent.objects.seen(keyed.keys())
+            result.duplicates += len(seen)
+            pending = [(key, event) for key, event in keyed.items()
+                if key not in seen]
+            if not pending:
+                return
+            objects = IContact.objects.get_objects_for_contact_ids(set(
+                str(event.get('contactId')) for key, event in pending))
+            #contactId -> object changed by the batch
+            changed = OrderedDict()
+            applied = []
+            for key, event in pending:
+                contact_id = str(event.get('contactId'))
+                obj = objects.get(contact_id)
+                adapter = obj is not None and \
+                    self.adapters.get(obj.__class__)
+                if not adapter:
+                    result.unknown += 1
+                    applied.append(key)
+                    continue
+                try:
+                    if adapter.apply(obj, event):
+                        changed[contact_id] = obj
+                        result.applied += 1
+                    else:
+                        result.unchanged += 1
+                except Exception as e:
+                    logger.exception('could not apply event %s', key)
+                    result.errors.append((event, str(e)))
+                    continue
+                applied.append(key)
+            with suppressed():
+                for obj in changed.values():
+                    obj.save()
+            for contact_id, obj in changed.items():
+                self.update_snapshot(obj, contact_id)
+            if applied:
+                IContactEvent.objects.record(applied)
+        self.forget(objects)
+
+    def forget(self, objects):
+        """
+            Drops the contacts of objects, a dict of object by contactId,
+            from the caches of the clients their observers sync them with.
+            Contacts synced with no object are left, their account is unknown.
+        """
+        by_client = {}
+        for contact_id, obj in objects.items():
+            observer = get_observer(obj.__class__)
+            if observer is None:
+                continue
+            client = observer.client(obj)
+            by_client.setdefault(id(client), (client, []))[1].append(
+                contact_id)
+        for client, contact_ids in by_client.values():
+            client.forget_contacts(contact_ids)
+            client.forget_subscriptions(contact_ids)
+
+    def update_snapshot(self, obj, contact_id):
+        """
+            Records the contact data of obj as the data iContact has, so its
+            observer only sends what changes locally next.
+        """
+        observer = get_observer(obj.__class__)
+        if observer is None or obj.__class__ not in observer.adapters:
+            return
+        try:
+            contact = observer.adapters[obj.__class__].get_contact_data(obj)
+        except InvalidContactData:
+            return
+        IContact.objects.set_contact_id(obj, contact_id,
+            payload_hash=contact.get_hash(),
+            payload=contact.get_data()['contact'])
@@ -0,0 +1,51 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import get_model
+
+from icontact.backfill import Backfill
+
+
+class Command(BaseCommand):
+    """
+        Creates iContact contacts for the existing rows of an observed model.
+    """
+    args = '<app_label.ModelName>'
+    help = 'Pushes the existing rows of an observed model to iContact.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=500,
+            help='Rows read and sent to iContact per request.'),
+        make_option('--concurrency', type='int', default=4,
+            help='Number of batches sent to iContact at the same time.'),
+        make_option('--update', action='store_true', default=False,
+            help='Also update rows that already have a contactId.'),
+        make_option('--checkpoint', default=None,
+            help='Name of the checkpoint to resume from.'),
+        make_option('--restart', action='store_true', default=False,
+            help='Ignore the checkpoint and start from the first row.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1 or '.' not in args[0]:
+            raise CommandError('Usage: %s' % self.args)
+        app_label, model_name = args[0].split('.', 1)
+        model = get_model(app_label, model_name)
+        if model is None:
+            raise CommandError('Unknown model %s' % args[0])
+        try:
+            backfill = Backfill(model, batch_size=options['batch_size'],
+                concurrency=options['concurrency'], update=options['update'],
+                checkpoint=options['checkpoint'], progress=self.progress)
+        except ValueError as e:
+            raise CommandError(str(e))
+        stats = backfill.run(restart=options['restart'])
+        self.stdout.write('\nDone: %s created, %s updated, %s skipped, '
+            '%s failed in %.0fs\n' % (stats.created, stats.updated,
+                stats.skipped, stats.failed, stats.elapsed()))
+
+    def progress(self, stats):
+        eta = stats.eta()
+        self.stdout.write('\r%s/%s rows, %.1f rows/s, ETA %s' % (
+            stats.processed, stats.total, stats.rate(),
+            eta is None and '?' or '%dm%02ds' % divmod(int(eta), 60)))
+        self.stdout.flush()
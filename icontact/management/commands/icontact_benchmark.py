@@ -0,0 +1,84 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import get_model
+
+from icontact.benchmark import Benchmark, compare
+
+
+class Command(BaseCommand):
+    """
+        Benchmarks the client, and optionally the observer of a model,
+        against an in-process fake of the iContact api.
+    """
+    args = '[app_label.ModelName]'
+    help = 'Benchmarks syncing with a fake iContact api.'
+    option_list = BaseCommand.option_list + (
+        make_option('--contacts', type='int', default=1000,
+            help='Contacts created by the bulk benchmark.'),
+        make_option('--batch-size', type='int', default=None,
+            help='Contacts sent to iContact per batch request.'),
+        make_option('--latency', type='float', default=0,
+            help='Seconds every fake request takes.'),
+        make_option('--error-rate', type='float', default=0,
+            help='Fraction of fake requests answered with a 503.'),
+        make_option('--rate-limit', default=None,
+            help='Requests the fake answers per period before answering '
+                '429, as requests/seconds, e.g. 100/60.'),
+        make_option('--output', default=None,
+            help='File the results are written to as json.'),
+        make_option('--compare', default=None,
+            help='Results of a previous run to compare with.'),
+    )
+
+    def handle(self, *args, **options):
+        model = None
+        if args:
+            if len(args) != 1 or '.' not in args[0]:
+                raise CommandError('Usage: %s' % self.args)
+            model = get_model(*args[0].split('.', 1))
+            if model is None:
+                raise CommandError('Unknown model %s' % args[0])
+        rate_limit = None
+        if options['rate_limit']:
+            try:
+                requests, period = options['rate_limit'].split('/')
+                rate_limit = (int(requests), float(period))
+            except ValueError:
+                raise CommandError('--rate-limit must be requests/seconds, '
+                    'e.g. 100/60')
+        benchmark = Benchmark(contacts=options['contacts'],
+            latency=options['latency'], error_rate=options['error_rate'],
+            rate_limit=rate_limit, model=model,
+            batch_size=options['batch_size'])
+        try:
+            results = benchmark.run()
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+            for key, before, after, change in compare(previous, results):
+                self.stdout.write('%-40s %12.2f %12.2f %s\n' % (key, before,
+                    after, change is None and '' or '%+.1f%%' % (change * 100)))
+            return
+        imported = results['import']
+        self.stdout.write('import %s: %.1fms, loaded %s\n' % (
+            imported['module'], imported['ms'],
+            ', '.join(imported['loaded']) or 'nothing heavy'))
+        for method, timings in sorted(results['methods'].items()):
+            if not timings['calls']:
+                self.stdout.write('%-16s no calls\n' % method)
+                continue
+            self.stdout.write('%-16s p50 %7.2fms  p99 %7.2fms  %d errors\n' %
+                (method, timings['p50'], timings['p99'], timings['errors']))
+        bulk = results['bulk']
+        self.stdout.write('bulk: %.1f contacts/s, %.3f requests/contact\n' % (
+            bulk['contacts_per_sec'], bulk['requests_per_contact']))
+        for name, saves in sorted(results.get('saves', {}).items()):
+            self.stdout.write('saves (%s): %.1f saves/s, %.2f requests/save\n'
+                % (name, saves['saves_per_sec'], saves['requests_per_save']))
@@ -0,0 +1,62 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import get_model
+
+from icontact.registry import get_client
+from icontact.transfer import DEFAULT_BATCH_SIZE, FORMATS, export_local, \
+    export_remote, get_writer, guess_format, open_file
+
+
+class Command(BaseCommand):
+    """
+        Exports the contacts of iContact, or the contact data of an observed
+        model, to a csv or json lines file.
+    """
+    args = '[app_label.ModelName]'
+    help = 'Exports contacts to a csv or json lines file.'
+    option_list = BaseCommand.option_list + (
+        make_option('--output', default='icontact-contacts.csv',
+            help='File the contacts are written to.'),
+        make_option('--format', choices=FORMATS, default=None,
+            help='csv or jsonl, guessed from the file name by default.'),
+        make_option('--fields', default=None,
+            help='Comma separated contact fields to export.'),
+        make_option('--batch-size', type='int', default=DEFAULT_BATCH_SIZE,
+            help='Contacts fetched, or rows read, per request.'),
+        make_option('--account', default=None,
+            help='Account in ICONTACT_ACCOUNTS to export from.'),
+    )
+
+    def handle(self, *args, **options):
+        model = None
+        if args:
+            if len(args) != 1 or '.' not in args[0]:
+                raise CommandError('Usage: %s' % self.args)
+            model = get_model(*args[0].split('.', 1))
+            if model is None:
+                raise CommandError('Unknown model %s' % args[0])
+        path = options['output']
+        format = options['format'] or guess_format(path)
+        fields = options['fields'] and options['fields'].split(',') or None
+        with open_file(path, 'w') as f:
+            writer = get_writer(f, format, fields)
+            if model is None:
+                stats = export_remote(get_client(options['account']),
+                    writer, fields=fields, page_size=options['batch_size'],
+                    progress=self.progress, every=options['batch_size'])
+            else:
+                try:
+                    stats = export_local(model, writer,
+                        batch_size=options['batch_size'],
+                        progress=self.progress)
+                except ValueError as e:
+                    raise CommandError(str(e))
+        self.stdout.write('\nExported %s contacts to %s, %s failed, in %.0fs '
+            '(%.1f rows/s)\n' % (stats.processed - stats.failed, path,
+                stats.failed, stats.elapsed(), stats.rate()))
+
+    def progress(self, stats):
+        self.stdout.write('\r%s rows, %.1f rows/s' % (stats.processed,
+            stats.rate()))
+        self.stdout.flush()
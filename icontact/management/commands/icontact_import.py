@@ -0,0 +1,47 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from icontact.registry import get_client
+from icontact.transfer import DEFAULT_BATCH_SIZE, FORMATS, guess_format, \
+    import_contacts, open_file, read_rows
+
+
+class Command(BaseCommand):
+    """
+        Creates, or updates, iContact contacts from a csv or json lines file.
+    """
+    args = '<file>'
+    help = 'Imports contacts from a csv or json lines file into iContact.'
+    option_list = BaseCommand.option_list + (
+        make_option('--format', choices=FORMATS, default=None,
+            help='csv or jsonl, guessed from the file name by default.'),
+        make_option('--batch-size', type='int', default=DEFAULT_BATCH_SIZE,
+            help='Rows read and sent to iContact per request.'),
+        make_option('--list', default=None,
+            help='listId the created contacts are subscribed to.'),
+        make_option('--account', default=None,
+            help='Account in ICONTACT_ACCOUNTS to import into.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: %s' % self.args)
+        path = args[0]
+        format = options['format'] or guess_format(path)
+        try:
+            f = open_file(path)
+        except IOError as e:
+            raise CommandError(str(e))
+        with f:
+            stats = import_contacts(get_client(options['account']),
+                read_rows(f, format), batch_size=options['batch_size'],
+                list_id=options['list'], progress=self.progress)
+        self.stdout.write('\nDone: %s created, %s updated, %s failed in '
+            '%.0fs (%.1f rows/s)\n' % (stats.created, stats.updated,
+                stats.failed, stats.elapsed(), stats.rate()))
+
+    def progress(self, stats):
+        self.stdout.write('\r%s rows, %.1f rows/s' % (stats.processed,
+            stats.rate()))
+        self.stdout.flush()
@@ -0,0 +1,63 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import get_model
+
+from icontact.reconcile import Reconciler, DEFAULT_PARTITIONS, \
+    DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    """
+        Compares observed objects with the contacts on iContact, writes the
+        differences to a json lines file and optionally repairs them.
+    """
+    args = '[app_label.ModelName ...]'
+    help = 'Finds and repairs differences between local objects and iContact.'
+    option_list = BaseCommand.option_list + (
+        make_option('--output', default='icontact-diff.jsonl',
+            help='File the differences are written to.'),
+        make_option('--repair', action='store_true', default=False,
+            help='Repair the differences found.'),
+        make_option('--repair-from', default=None,
+            help='Repair the differences in a file written by a previous '
+                'run instead of comparing again.'),
+        make_option('--delete-orphans', action='store_true', default=False,
+            help='Delete contacts no local object is synced with.'),
+        make_option('--partitions', type='int', default=DEFAULT_PARTITIONS,
+            help='Number of partitions, raise it to use less memory.'),
+        make_option('--batch-size', type='int', default=DEFAULT_BATCH_SIZE,
+            help='Rows read and contacts repaired per batch.'),
+    )
+
+    def handle(self, *args, **options):
+        models = []
+        for name in args:
+            model = '.' in name and get_model(*name.split('.', 1))
+            if not model:
+                raise CommandError('Unknown model %s' % name)
+            models.append(model)
+        try:
+            reconciler = Reconciler(models=models,
+                partitions=options['partitions'],
+                batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        path = options['repair_from']
+        if path is None:
+            path = options['output']
+            with open(path, 'w') as output:
+                stats = reconciler.diff(output)
+            self.stdout.write('Compared %(local)s local objects with '
+                '%(remote)s contacts: %(missing)s missing, %(orphan)s '
+                'orphaned, %(mismatch)s mismatched, %(unlinked)s unlinked\n'
+                % stats)
+            if not options['repair']:
+                return
+        with open(path) as f:
+            repaired = reconciler.repair((json.loads(line) for line in f),
+                delete_orphans=options['delete_orphans'])
+        self.stdout.write('Repaired %(missing)s missing, %(orphan)s '
+            'orphaned, %(mismatch)s mismatched, %(unlinked)s unlinked\n'
+            % repaired)
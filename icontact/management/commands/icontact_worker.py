@@ -0,0 +1,64 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from icontact.worker import DEFAULT_KEEP_EVENTS, DEFAULT_KEEP_FAILED, \
+    SyncWorker
+
+#seconds between purges of failed jobs and event keys while the workers run
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    """
+        Drains the queue of sync jobs enqueued by deferred observers.
+
+        Observers register themselves when they are instantiated, so the
+        module that calls IContactObserver.observe needs to be imported when
+        Django starts, models.py being the usual place.
+    """
+    help = 'Pushes pending iContact sync jobs to iContact.'
+    option_list = BaseCommand.option_list + (
+        make_option('--threads', type='int', default=4,
+            help='Number of jobs to process concurrently.'),
+        make_option('--poll-interval', type='float', default=1.0,
+            help='Seconds to wait when the queue is empty.'),
+        make_option('--max-attempts', type='int', default=5,
+            help='Attempts before a job is marked as failed.'),
+        make_option('--retry-delay', type='float', default=30,
+            help='Seconds before a failed job is retried, doubled after '
+                'every attempt.'),
+        make_option('--keep-failed', type='float',
+            default=DEFAULT_KEEP_FAILED / 86400,
+            help='Days failed jobs are kept, 0 to keep them forever.'),
+        make_option('--keep-events', type='float',
+            default=DEFAULT_KEEP_EVENTS / 86400,
+            help='Days the ids of events received from iContact are kept to '
+                'skip redeliveries, 0 to keep them forever.'),
+        make_option('--once', action='store_true', default=False,
+            help='Drain the queue and exit instead of running forever.'),
+    )
+
+    def handle(self, *args, **options):
+        worker = SyncWorker(threads=options['threads'],
+            poll_interval=options['poll_interval'],
+            max_attempts=options['max_attempts'],
+            retry_delay=options['retry_delay'],
+            keep_failed=options['keep_failed'] * 86400 or None,
+            keep_events=options['keep_events'] * 86400 or None)
+        if options['once']:
+            processed = worker.run_once()
+            self.stdout.write('Processed %s jobs\n' % processed)
+            return
+        worker.start()
+        purged = 0
+        try:
+            while True:
+                if time.time() - purged > PURGE_INTERVAL:
+                    worker.purge()
+                    purged = time.time()
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping workers\n')
+            worker.stop()
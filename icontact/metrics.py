@@ -0,0 +1,200 @@
+"""
+Instrumentation of the calls made to the iContact api.
+
+Every call is reported to the receivers of icontact.signals.api_call and to
+the metrics backend named by ICONTACT_METRICS_BACKEND. When there are
+neither, clients skip the measurements altogether.
+"""
+import re
+import socket
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.importlib import import_module
+
+from icontact.conf import conf
+from icontact.signals import api_call
+
+RESOURCE_RE = re.compile(r'/c/[^/]+/([^/?]+)')
+
+
+class MetricsBackend(object):
+    """
+        Receives counters and timings, subclasses send them somewhere.
+
+        tags is a dict such as {'method': 'GET', 'status': 200}.
+    """
+
+    def increment(self, name, value=1, tags=None):
+        pass
+
+    def timing(self, name, seconds, tags=None):
+        pass
+
+
+class MemoryBackend(MetricsBackend):
+    """
+        Keeps counters and timings in memory, keyed by (name, tags), for
+        tests or to be exported by the application.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def _key(self, name, tags):
+        return (name, tuple(sorted((tags or {}).items())))
+
+    def increment(self, name, value=1, tags=None):
+        key = self._key(name, tags)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def timing(self, name, seconds, tags=None):
+        key = self._key(name, tags)
+        with self._lock:
+            self.timings.setdefault(key, []).append(seconds)
+
+    def count(self, name, **tags):
+        """
+            Returns the total of counter name over the series matching tags.
+        """
+        return sum(value for (key, series), value in self.counters.items()
+            if key == name and set(tags.items()) <= set(series))
+
+
+class StatsdBackend(MetricsBackend):
+    """
+        Sends metrics to a statsd daemon over udp, tag values are appended
+        to the metric name, e.g. icontact.requests.GET.200.
+
+        Optional settings:
+
+        ICONTACT_STATSD_HOST, ICONTACT_STATSD_PORT: address of the daemon,
+                        localhost:8125 by default.
+
+        ICONTACT_STATSD_PREFIX: prepended to every metric name.
+    """
+
+    def __init__(self, host=None, port=None, prefix=None):
+        self.address = (
+            host or conf.get('STATSD_HOST', 'localhost'),
+            port or conf.get('STATSD_PORT', 8125))
+        self.prefix = prefix or conf.get('STATSD_PREFIX', 'icontact')
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, name, tags):
+        parts = [self.prefix, name]
+        parts.extend(str(value) for key, value in sorted((tags or {}).items()))
+        return '.'.join(parts)
+
+    def _send(self, line):
+        try:
+            self.socket.sendto(line.encode('utf-8'), self.address)
+        except socket.error:
+            #metrics are best effort
+            pass
+
+    def increment(self, name, value=1, tags=None):
+        self._send('%s:%s|c' % (self._name(name, tags), value))
+
+    def timing(self, name, seconds, tags=None):
+        self._send('%s:%d|ms' % (self._name(name, tags), seconds * 1000))
+
+
+_backend = None
+_backend_loaded = False
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+        Returns the MetricsBackend named by the ICONTACT_METRICS_BACKEND
+        setting, a dotted path to a class or an instance, or None.
+    """
+    global _backend, _backend_loaded
+    if not _backend_loaded:
+        with _backend_lock:
+            path = conf.get('METRICS_BACKEND', None)
+            backend = None
+            if path:
+                module, _, name = path.rpartition('.')
+                try:
+                    backend = getattr(import_module(module), name)
+                except (ImportError, AttributeError) as e:
+                    raise ImproperlyConfigured(
+                        'Could not load metrics backend %s: %s' % (path, e))
+                if isinstance(backend, type):
+                    backend = backend()
+            _backend = backend
+            _backend_loaded = True
+    return _backend
+
+
+def set_backend(backend):
+    """
+        Replaces the metrics backend, None disables it.
+    """
+    global _backend, _backend_loaded
+    with _backend_lock:
+        _backend = backend
+        _backend_loaded = True
+
+
+def reset_backend():
+    """
+        Forgets the metrics backend, it is loaded from settings again when
+        next needed.
+    """
+    global _backend, _backend_loaded
+    with _backend_lock:
+        _backend = None
+        _backend_loaded = False
+
+
+def enabled():
+    """
+        Whether calls have to be measured at all.
+    """
+    return bool(api_call.receivers) or get_backend() is not None
+
+
+def resource(url):
+    """
+        Returns the api resource of url, e.g. contacts or subscriptions.
+    """
+    match = RESOURCE_RE.search(url)
+    return match and match.group(1) or ''
+
+
+def record(sender, method, url, response, duration, retries, bytes_sent,
+        reused=None, error=None):
+    """
+        Reports an api call, response being None if no response was
+        received.
+    """
+    status_code = None
+    bytes_received = 0
+    if response is not None:
+        status_code = response.status_code
+        bytes_received = len(getattr(response, 'content', None) or '')
+    name = resource(url)
+    api_call.send(sender=sender, method=method, url=url, resource=name,
+        status_code=status_code, duration=duration, retries=retries,
+        bytes_sent=bytes_sent, bytes_received=bytes_received, reused=reused,
+        error=error)
+    backend = get_backend()
+    if backend is None:
+        return
+    tags = {'method': method, 'resource': name}
+    backend.increment('requests', tags=dict(tags,
+        status=status_code or 'error'))
+    backend.timing('request_time', duration, tags=tags)
+    if retries:
+        backend.increment('retries', retries, tags=tags)
+    backend.increment('bytes_sent', bytes_sent, tags=tags)
+    backend.increment('bytes_received', bytes_received, tags=tags)
+    if reused is not None:
+        backend.increment(reused and 'connections_reused' or
+            'connections_opened')
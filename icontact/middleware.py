@@ -0,0 +1,32 @@
+"""
+Middleware for the icontact application.
+"""
+from icontact import coalesce
+
+
+class CoalesceMiddleware(object):
+    """
+        Coalesces the changes made to observed objects during a request, so
+        an object saved several times is synced with iContact once, after the
+        response has been built. An object created and deleted during the
+        request never reaches iContact.
+
+        Place it above django.middleware.transaction.TransactionMiddleware in
+        MIDDLEWARE_CLASSES, so changes are flushed after the transaction is
+        committed and dropped if the view raises an exception.
+    """
+
+    def process_request(self, request):
+        coalesce.begin()
+        request._icontact_coalescing = True
+
+    def process_exception(self, request, exception):
+        if getattr(request, '_icontact_coalescing', False):
+            request._icontact_coalescing = False
+            coalesce.end(commit=False)
+
+    def process_response(self, request, response):
+        if getattr(request, '_icontact_coalescing', False):
+            request._icontact_coalescing = False
+            coalesce.end()
+        return response
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+from django.db.models import Count, Max
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Removing duplicate mappings left by racing saves, keeping the
+        # newest one, so the unique index can be created. Skipped while South
+        # checks the schema changes with a dry run
+        if not db.dry_run:
+            duplicates = orm['icontact.IContact'].objects.values(
+                'content_type', 'object_id').annotate(
+                    count=Count('id'), newest=Max('id')).filter(count__gt=1)
+            for duplicate in duplicates:
+                orm['icontact.IContact'].objects.filter(
+                    content_type=duplicate['content_type'],
+                    object_id=duplicate['object_id']).exclude(
+                        id=duplicate['newest']).delete()
+
+        # Adding unique constraint on 'IContact', fields ['content_type', 'object_id']
+        db.create_unique('icontact_icontact', ['content_type_id', 'object_id'])
+
+        # Adding index on 'IContact', fields ['contact_id']
+        db.create_index('icontact_icontact', ['contact_id'])
+
+    def backwards(self, orm):
+        # Removing index on 'IContact', fields ['contact_id']
+        db.delete_index('icontact_icontact', ['contact_id'])
+
+        # Removing unique constraint on 'IContact', fields ['content_type', 'object_id']
+        db.delete_unique('icontact_icontact', ['content_type_id', 'object_id'])
+
+    models = {
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'icontact.icontact': {
+            'Meta': {'unique_together': "(('content_type', 'object_id'),)", 'object_name': 'IContact'},
+            'contact_id': ('django.db.models.fields.CharField', [], {'max_length': '50', 'db_index': 'True'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'payload': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'payload_hash': ('django.db.models.fields.CharField', [], {'max_length': '40', 'blank': 'True'})
+        },
+        'icontact.synccheckpoint': {
+            'Meta': {'object_name': 'SyncCheckpoint'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'last_pk': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '100'}),
+            'updated': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'})
+        },
+        'icontact.syncjob': {
+            'Meta': {'ordering': "('pk',)", 'object_name': 'SyncJob'},
+            'action': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'attempts': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'contact_id': ('django.db.models.fields.CharField', [], {'max_length': '50', 'blank': 'True'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'error': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0', 'db_index': 'True'})
+        }
+    }
+
+    complete_apps = ['icontact']
@@ -1,11 +1,47 @@
-from django.db import models
+import datetime
+import json
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import Q, signals
+from django.utils import timezone
 from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
 
+from icontact.caching import get_contact_id_cache
+
+#seconds after which a job still running is assumed to belong to a worker
+#that died, and is claimed again
+CLAIM_TIMEOUT = 300
+
+_id_cache = None
+
+
+def contact_id_cache():
+    """
+    Returns the ContactIdCache used by IContactManager, None if disabled.
+    """
+    global _id_cache
+    if _id_cache is None:
+        _id_cache = get_contact_id_cache() or False
+    return _id_cache or None
+
+
+def reset_contact_id_cache():
+    """
+    Drops the cache, the next lookup builds a new one from settings.
+    """
+    global _id_cache
+    _id_cache = None
+
+
 class IContactManager(models.Manager):
     """
     A custom manager for iContactContact model to get, create, update, and
     delete instances of the class.
+
+    contactIds are cached, see icontact.caching.get_contact_id_cache for the
+    settings, and forgotten whenever an IContact is deleted.
+    ContentType.objects.get_for_model is cached by Django itself.
     """
     
     def delete_contact_id(self, obj):
@@ -13,45 +49,145 @@ class IContactManager(models.Manager):
         Deletes the record for the object.
         """
         ct = ContentType.objects.get_for_model(obj)
-        try:
-            contact = self.filter(
-                content_type=ct, 
-                object_id=obj.pk)
-            contact.delete()
-        except models.ObjectDoesNotExist:
-            pass
+        self.delete_for(ct.pk, obj.pk)
+
+    def delete_for(self, content_type_id, object_id):
+        """
+        Deletes the record for an object given its content type id and
+        primary key, for objects that no longer exist.
+        """
+        self.filter(content_type=content_type_id, object_id=object_id).delete()
     
-    def get_contact_id(self, obj):
+    def get_contact(self, obj):
         """
-        Gets iContactContact instance for a object, or returns None.
+        Gets the IContact instance for a object, or returns None.
         """
         ct = ContentType.objects.get_for_model(obj)
         try:
-            contact = self.get(
-                content_type=ct, 
-                object_id=obj.pk)
-            contact_id = contact.contact_id
+            return self.get(content_type=ct, object_id=obj.pk)
         except models.ObjectDoesNotExist:
-            contact_id = None
-        return contact_id
+            return None
+
+    def get_contact_id(self, obj):
+        """
+        Gets iContactContact instance for a object, or returns None.
+        """
+        return self.get_contact_ids([obj]).get(obj)
+
+    def get_contact_ids(self, objs):
+        """
+        Returns a dict mapping each object of objs that has a contactId to
+        it, in one query per model for the ones that aren't cached.
+        """
+        keys = {}
+        for obj in objs:
+            ct = ContentType.objects.get_for_model(obj)
+            keys[(ct.pk, obj.pk)] = obj
+        found = self._lookup(keys.keys())
+        return dict((keys[key], contact_id)
+            for key, contact_id in found.items())
+
+    def get_contact_ids_for(self, model, object_ids):
+        """
+        Same as get_contact_ids for the primary keys object_ids of model,
+        returns a dict mapping primary keys to contactIds.
+        """
+        ct = ContentType.objects.get_for_model(model)
+        found = self._lookup([(ct.pk, object_id) for object_id in object_ids])
+        return dict((object_id, contact_id)
+            for (ct_id, object_id), contact_id in found.items())
+
+    def _lookup(self, keys):
+        #keys are (content type id, object id) pairs
+        cache = contact_id_cache()
+        found = {}
+        if cache is not None:
+            found = cache.get_many(keys)
+        missing = {}
+        for key in keys:
+            if key not in found:
+                missing.setdefault(key[0], []).append(key[1])
+        for content_type_id, object_ids in missing.items():
+            rows = self.filter(content_type=content_type_id,
+                object_id__in=object_ids).values_list('object_id',
+                    'contact_id')
+            for object_id, contact_id in rows:
+                key = (content_type_id, object_id)
+                found[key] = contact_id
+                if cache is not None:
+                    cache.set(key, contact_id)
+        return found
     
-    def set_contact_id(self, obj, contact_id):
+    def set_contact_id(self, obj, contact_id, payload_hash='', payload=None):
         """
-        Sets the contactId on an object.
+        Sets the contactId on an object, along with the hash and a snapshot
+        of the contact data last sent to iContact for it.
+
+        Existing records are updated in a single statement, then read back.
+        Returns the IContact.
         """
+        payload = payload and json.dumps(payload) or ''
         ct = ContentType.objects.get_for_model(obj)
-        try:
-            contact = self.get(
-                content_type=ct, 
-                object_id=obj.pk)
-            contact.contact_id = contact_id
-        except models.ObjectDoesNotExist:
-            contact = IContact(
-                content_type=ct, 
-                object_id=obj.pk,
-                contact_id=contact_id)
-        contact.save()
+        updated = self.filter(content_type=ct, object_id=obj.pk).update(
+            contact_id=contact_id,
+            payload_hash=payload_hash,
+            payload=payload)
+        contact = None
+        if not updated:
+            sid = transaction.savepoint()
+            try:
+                contact = self.create(
+                    content_type=ct,
+                    object_id=obj.pk,
+                    contact_id=contact_id,
+                    payload_hash=payload_hash,
+                    payload=payload)
+                transaction.savepoint_commit(sid)
+            except IntegrityError:
+                #created by a concurrent save since our update
+                transaction.savepoint_rollback(sid)
+                self.filter(content_type=ct, object_id=obj.pk).update(
+                    contact_id=contact_id,
+                    payload_hash=payload_hash,
+                    payload=payload)
+        cache = contact_id_cache()
+        if cache is not None:
+            cache.set((ct.pk, obj.pk), contact_id)
+        if contact is None:
+            contact = self.get(content_type=ct, object_id=obj.pk)
         return contact
+
+    def get_object_for_contact_id(self, contact_id):
+        """
+        Returns the object synced with the iContact contact contact_id, or
+        None.
+        """
+        return self.get_objects_for_contact_ids([contact_id]).get(
+            str(contact_id))
+
+    def get_objects_for_contact_ids(self, contact_ids):
+        """
+        Returns a dict mapping each contactId of contact_ids that is synced
+        with an object to the object, in one query for the mappings and one
+        per model for the objects.
+        """
+        contact_ids = [str(contact_id) for contact_id in contact_ids]
+        by_model = {}
+        rows = self.filter(contact_id__in=contact_ids).values_list(
+            'content_type', 'object_id', 'contact_id')
+        for content_type_id, object_id, contact_id in rows:
+            by_model.setdefault(content_type_id, {})[object_id] = contact_id
+        found = {}
+        for content_type_id, mapping in by_model.items():
+            model = ContentType.objects.get_for_id(
+                content_type_id).model_class()
+            if model is None:
+                #the model has been removed
+                continue
+            objects = model._default_manager.in_bulk(list(mapping.keys()))
+            for object_id, obj in objects.items():
+                found[mapping[object_id]] = obj
+        return found
     
 
 class IContact(models.Model):
@@ -64,9 +200,236 @@ class IContact(models.Model):
     object_id = models.PositiveIntegerField()
     object = generic.GenericForeignKey()
     #icontact contactId 
-    contact_id = models.CharField(max_length=50)
+    contact_id = models.CharField(max_length=50, db_index=True)
+    #IContactData.get_hash() of the data last sent, unchanged data is not
+    #sent again
+    payload_hash = models.CharField(max_length=40, blank=True)
+    #json snapshot of the contact data last sent, to only send what changed
+    payload = models.TextField(blank=True)
     #manager to get, update, and delete instances
     objects = IContactManager()
+
+    class Meta:
+        #one contact per object, also the index used by every lookup
+        unique_together = (('content_type', 'object_id'),)
     
     def __unicode__(self):
         return u"%s: %s" % (self.object, self.contact_id)
+
+    def get_payload(self):
+        """
+            Returns the contact data last sent to iContact as a dict, empty
+            if unknown.
+        """
+        if not self.payload:
+            return {}
+        return json.loads(self.payload)
+
+
+def forget_contact_id(sender, instance, **kwargs):
+    """
+    Removes a deleted IContact from the contactId cache.
+    """
+    cache = contact_id_cache()
+    if cache is not None:
+        cache.delete((instance.content_type_id, instance.object_id))
+
+signals.post_delete.connect(forget_contact_id, sender=IContact)
+
+
+class IContactEventManager(models.Manager):
+    """
+    Manager used by icontact.ingest to skip events it has already applied.
+    """
+
+    def seen(self, keys):
+        """
+        Returns the keys of keys that have been recorded, in one query.
+        """
+        return set(self.filter(key__in=list(keys)).values_list('key',
+            flat=True))
+
+    def record(self, keys):
+        """
+        Records keys as applied, in one query.
+        """
+        self.bulk_create([IContactEvent(key=key) for key in keys])
+
+    def purge(self, before):
+        """
+        Forgets the keys received before the datetime before, events
+        redelivered after that are applied again. Returns how many there
+        were.
+        """
+        old = self.filter(received__lt=before)
+        count = old.count()
+        old.delete()
+        return count
+
+
+class IContactEvent(models.Model):
+    """
+        Idempotency key of an event received from iContact, recorded in the
+        transaction that applied it so a redelivered event is a no-op.
+    """
+
+    key = models.CharField(max_length=100, unique=True)
+    received = models.DateTimeField(auto_now_add=True, db_index=True)
+    #manager to check and record keys
+    objects = IContactEventManager()
+
+    def __unicode__(self):
+        return self.key
+
+
+class SyncJobManager(models.Manager):
+    """
+    Manager used by the observer to enqueue sync jobs and by workers to claim
+    them.
+    """
+
+    def enqueue(self, action, obj, contact_id=None, account=None):
+        """
+        Records that obj needs to be synced with iContact.
+
+        The job is written in the same transaction as the save that triggered
+        it, so a rolled back save never reaches the queue.
+        """
+        ct = ContentType.objects.get_for_model(obj)
+        return self.create(
+            content_type=ct,
+            object_id=obj.pk,
+            action=action,
+            contact_id=contact_id or '',
+            account=account or '')
+
+    def pending(self):
+        """
+        Whether any job is waiting or running.
+        """
+        return self.exclude(status=SyncJob.FAILED).exists()
+
+    def pending_for(self, obj):
+        """
+        Whether a job for obj is waiting or running, using the index on
+        content_type and object_id.
+        """
+        ct = ContentType.objects.get_for_model(obj)
+        return self.filter(content_type=ct, object_id=obj.pk).exclude(
+            status=SyncJob.FAILED).exists()
+
+    def purge_failed(self, before):
+        """
+        Deletes the jobs that failed for good and were last run before the
+        datetime before, returns how many there were.
+        """
+        failed = self.filter(Q(claimed__lt=before) |
+            Q(claimed__isnull=True, created__lt=before),
+            status=SyncJob.FAILED)
+        count = failed.count()
+        failed.delete()
+        return count
+
+    def claim(self, limit=20, timeout=CLAIM_TIMEOUT):
+        """
+        Marks the oldest runnable pending job as running and returns it, or
+        returns None if there is nothing to do.
+
+        A job is runnable when its retry time has come and no older job for
+        the same object is still waiting, so jobs for one object always run
+        in the order they were enqueued.
+
+        Jobs claimed more than timeout seconds ago and still running were
+        left behind by a worker that died, they are put back in the queue
+        first.
+        """
+        now = timezone.now()
+        self.filter(status=SyncJob.RUNNING,
+            claimed__lt=now - datetime.timedelta(seconds=timeout)).update(
+            status=SyncJob.PENDING)
+        pending = self.filter(Q(run_after__isnull=True) |
+            Q(run_after__lte=now), status=SyncJob.PENDING).order_by(
+            'pk')[:limit]
+        for job in pending:
+            older = self.filter(
+                content_type=job.content_type_id,
+                object_id=job.object_id,
+                pk__lt=job.pk).exclude(status=SyncJob.FAILED)
+            if older.exists():
+                continue
+            claimed = self.filter(pk=job.pk, status=SyncJob.PENDING).update(
+                status=SyncJob.RUNNING, claimed=now)
+            if claimed:
+                job.status = SyncJob.RUNNING
+                job.claimed = now
+                return job
+        return None
+
+
+class SyncJob(models.Model):
+    """
+        A pending create, update or delete of an observed object, drained by
+        icontact.worker.SyncWorker.
+    """
+
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTIONS = (
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    )
+
+    PENDING = 0
+    RUNNING = 1
+    FAILED = 2
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    )
+
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    object = generic.GenericForeignKey()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    #contactId known when the job was enqueued, needed for deletes as the
+    #object no longer exists when the job runs
+    contact_id = models.CharField(max_length=50, blank=True)
+    #name of the account the contact belongs to, for the same reason
+    account = models.CharField(max_length=100, blank=True)
+    status = models.PositiveSmallIntegerField(choices=STATUSES,
+        default=PENDING, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    #when a worker last claimed the job
+    claimed = models.DateTimeField(null=True, blank=True)
+    #failed jobs are not retried before this time
+    run_after = models.DateTimeField(null=True, blank=True, db_index=True)
+    #manager to enqueue and claim jobs
+    objects = SyncJobManager()
+
+    class Meta:
+        ordering = ('pk',)
+        #migration 0010 also indexes (content_type, object_id), for
+        #pending_for and claim, Django 1.4 has no index_together
+
+    def __unicode__(self):
+        return u"%s %s:%s" % (self.action, self.content_type_id,
+            self.object_id)
+
+
+class SyncCheckpoint(models.Model):
+    """
+        Highest primary key a long running job, such as a backfill, has fully
+        processed, so it can resume where it stopped.
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    last_pk = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return u"%s: %s" % (self.name, self.last_pk)
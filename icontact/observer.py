@@ -3,34 +3,143 @@ Observer for iContact instances
 
 """
 import logging
+import threading
+from contextlib import contextmanager
 
-from django.db.models import signals
-
-from icontact.models import IContact
-from icontact.client import IContactClient, IContactException
+from icontact import coalesce
+from icontact.client import IContactException, IContactUnavailable
+from icontact.executor import SyncExecutor
+from icontact.registry import get_client
 
 logger = logging.getLogger(__name__)
 
+#observed model -> observer it was registered with
+_observers = {}
+#per thread depth of suppressed blocks
+_local = threading.local()
+#django's model signals and icontact.models, set by load_models
+signals = IContact = SyncJob = None
+
+
+def diff(old, new):
+    """
+    Returns the fields of the contact data new that differ from old. Every
+    field is returned when old is empty, i.e. there is no snapshot.
+
+    Empty fields are left out of contact data, fields of old missing from
+    new are returned as '' so iContact clears them.
+    """
+    if not old:
+        return dict(new)
+    changes = dict((key, value) for key, value in new.items()
+        if old.get(key) != value)
+    for key, value in old.items():
+        if key not in new and value not in (None, ''):
+            changes[key] = ''
+    return changes
+
+
+def load_models():
+    """
+    Imports the ORM, once a model is observed rather than when the observer
+    is imported.
+    """
+    global signals, IContact, SyncJob
+    if SyncJob is None:
+        from django.db.models import signals
+        from icontact.models import IContact, SyncJob
+
+
+def get_observer(model):
+    """
+    Returns the observer that is observing model, or None.
+    """
+    return _observers.get(model)
+
+
+def observed_models():
+    """
+    Returns the models currently observed.
+    """
+    return list(_observers.keys())
+
+
+@contextmanager
+def suppressed():
+    """
+    Changes made to observed objects by this thread inside the block are not
+    synced with iContact, for changes that come from iContact itself.
+    """
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _local.depth -= 1
+
+
+def is_suppressed():
+    """
+    Whether this thread is inside a suppressed block.
+    """
+    return getattr(_local, 'depth', 0) > 0
+
+
 class IContactObserver(object):
     """
         Class that utilizes icontact client to sync model with icontact service
     """
     
-    def __init__(self, client=None):
+    def __init__(self, client=None, deferred=False, account=None):
         """
         Initialize an instance of the CalendarObserver class.
+
+        When deferred is True signal handlers only enqueue a SyncJob, and the
+        calls to iContact are made later by icontact.worker.SyncWorker.
+
+        account: name of the account in ICONTACT_ACCOUNTS objects are synced
+        with, or a callable returning it for an instance. Used unless a
+        client is given, the default account by default.
         """
         self.adapters = {}
         self._client = client
+        self.deferred = deferred
+        self.account = account
+        #account of the models observed with their own
+        self.accounts = {}
+        #number of updates sent with every field, with only the changed
+        #fields, and suppressed because nothing changed, of changes merged
+        #with an earlier one by coalescing, and of changes diverted to the
+        #outbox while iContact was unavailable
+        self.stats = {'full': 0, 'partial': 0, 'suppressed': 0,
+            'coalesced': 0, 'diverted': 0}
+        self._stats_lock = threading.Lock()
     
-    def observe(self, model, adapter):
+    def observe(self, model, adapter, account=None):
         """
         Establishes a connection between the model and Google Calendar, using
         adapter to transform data.
+
+        account overrides the account of the observer for this model.
         """
+        load_models()
         self.adapters[model] = adapter
+        if account is not None:
+            self.accounts[model] = account
+        _observers[model] = self
         signals.post_save.connect(self.on_update, sender=model)
         signals.post_delete.connect(self.on_delete, sender=model)
+
+    def unobserve(self, model):
+        """
+        Stops syncing model with iContact.
+        """
+        load_models()
+        signals.post_save.disconnect(self.on_update, sender=model)
+        signals.post_delete.disconnect(self.on_delete, sender=model)
+        self.adapters.pop(model, None)
+        self.accounts.pop(model, None)
+        if _observers.get(model) is self:
+            del _observers[model]
     
     def on_update(self, **kwargs):
         """
@@ -38,38 +147,128 @@ class IContactObserver(object):
         """
         created = kwargs.get('created', False)
         if created:
-            logging.debug("Created")
-            self.create(kwargs['sender'], kwargs['instance'])
+            logger.debug("Created")
+            self.dispatch(SyncJob.CREATE, kwargs['sender'], kwargs['instance'])
             return 
-        logging.debug("Updating")
-        self.update(kwargs['sender'], kwargs['instance'])
+        logger.debug("Updating")
+        self.dispatch(SyncJob.UPDATE, kwargs['sender'], kwargs['instance'])
     
     def on_delete(self, **kwargs):
         """
         Called by Django's signal mechanism when an observed model is deleted.
         """
-        self.delete(kwargs['sender'], kwargs['instance'])
-    
-    def client(self):
+        self.dispatch(SyncJob.DELETE, kwargs['sender'], kwargs['instance'])
+
+    def dispatch(self, action, sender, instance):
         """
-        Instantiate the client class to make authenticated calls to icontact.
+        Syncs instance with iContact right away, or enqueues a SyncJob for a
+        worker to do it when the observer is deferred.
+
+        Inside icontact.coalesce.coalescing, or a request handled by
+        icontact.middleware.CoalesceMiddleware, the change is only recorded
+        and merged with the other changes made to instance, then dispatched
+        once when the block or request ends. Inside suppressed nothing is
+        synced.
+        """
+        if is_suppressed():
+            return
+        if coalesce.is_active():
+            if coalesce.record(self, action, sender, instance):
+                self.count('coalesced')
+            return
+        if not self.deferred and not self.in_outbox(instance):
+            getattr(self, action)(sender, instance)
+            return
+        self.enqueue(action, instance)
+
+    def enqueue(self, action, instance):
+        """
+        Records a SyncJob for a worker to sync instance.
+        """
+        contact_id = None
+        account = None
+        if action == SyncJob.DELETE:
+            contact_id = IContact.objects.get_contact_id(instance)
+            if contact_id is None:
+                #never reached iContact, nothing to delete
+                return
+            #the worker can't route an object that no longer exists
+            account = self.get_account(instance)
+        SyncJob.objects.enqueue(action, instance, contact_id=contact_id,
+            account=account)
+
+    def divert(self, action, instance, error):
         """
-        if self._client is None:
-            self._client = IContactClient()
-        return self._client
+        Records a change that failed because iContact is unavailable in the
+        outbox, the SyncJob queue, for a worker to replay it once iContact
+        is back.
+        """
+        logger.warning('iContact unavailable, queuing %s of %r: %s', action,
+            instance, error)
+        self.enqueue(action, instance)
+        self.count('diverted')
+
+    def in_outbox(self, instance):
+        """
+        Whether instance has changes waiting in the outbox, later changes
+        then go through it as well so they are synced in order. Checked on
+        every change, whichever process or observer queued the jobs, with
+        one indexed query.
+        """
+        return SyncJob.objects.pending_for(instance)
+
+    def count(self, key):
+        """
+        Increments one of the counters in stats.
+        """
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def get_account(self, instance=None, model=None):
+        """
+        Returns the name of the account instance, or objects of model, are
+        synced with. An account routed per instance can't be known without
+        one, the default account is used then.
+        """
+        if model is None and instance is not None:
+            model = instance.__class__
+        account = self.accounts.get(model, self.account)
+        if callable(account):
+            account = instance is not None and account(instance) or None
+        return account
+
+    def routes_per_instance(self, model):
+        """
+        Whether objects of model are synced with an account chosen per
+        instance, so the account of a model alone is not enough to find
+        their contacts.
+        """
+        return self._client is None and callable(
+            self.accounts.get(model, self.account))
+
+    def client(self, instance=None, model=None, account=None):
+        """
+        Returns the client to make authenticated calls to icontact with, the
+        one given to the observer or the one of the account of instance or
+        model, see get_account.
+        """
+        if self._client is not None:
+            return self._client
+        if account is None:
+            account = self.get_account(instance, model)
+        return get_client(account)
         
     def get_contact(self, instance):
         """
             gets a contact from icontact service
         """
         contact_id = IContact.objects.get_contact_id(instance)
-        logging.debug("contact id: {id}".format(id=contact_id))
+        logger.debug('contact id: %s', contact_id)
         try:
-            contact = self._client.get_contact(contact_id)
+            contact = self.client(instance).get_contact(contact_id)
         except IContactException:
             return None
-        logging.debug('contact retrived')
-        logging.debug(contact)
+        logger.debug('contact retrived: %s', contact)
         return contact
 
     def create(self, sender, instance):
@@ -77,19 +276,13 @@ class IContactObserver(object):
             creates a new contact on icontact's datata base as well as a
             iContact instance
         """
-        adapter = self.adapters[sender]
-        logging.debug('Adapter: {adapter}'.format(adapter=adapter))
-        client = self.client()
-        contact = adapter.get_contact_data(instance) #IcontactData instance
-        data = contact.get_data()
-        logging.debug("contact's data: %s"%data)
         try:
-            icontact = client.create_contact(payload=data)
-            contact_id = icontact['contacts'][0]['contactId']
-            subscription = client.subscribe(contact_id)
-        except IContactException:
+            self.push_create(sender, instance)
+        except IContactUnavailable as e:
+            self.divert(SyncJob.CREATE, instance, e)
+        except IContactException as e:
+            logger.warning('could not create contact for %r: %s', instance, e)
             return None
-        IContact.objects.set_contact_id(instance, contact_id)   
     
     def update(self, sender, instance):
         """
@@ -98,32 +291,117 @@ class IContactObserver(object):
         By default the client subscribes to the deault list specified in 
         settings.py
         """
-        adapter = self.adapters[sender]
-        client = self.client()
-        contact = adapter.get_contact_data(instance) #IcontactData instance
-        data = contact.get_data()
-        logging.debug(data)
-        logging.debug(data['contact'])
-        try: 
-            icontact = self.get_contact(instance)
-            contact_id = icontact['contact']['contactId']
-            client.update_contact(contact_id=contact_id, payload=data['contact'])
-        except IContactException:
+        try:
+            self.push_update(sender, instance)
+        except IContactUnavailable as e:
+            self.divert(SyncJob.UPDATE, instance, e)
+        except IContactException as e:
+            logger.warning('could not update contact for %r: %s', instance, e)
             return None
-        IContact.objects.set_contact_id(instance, contact_id)
     
     def delete(self, sender, instance):
         """
         Deletes iContact record from their service and from our database
         """
+        contact_id = IContact.objects.get_contact_id(instance)
+        if contact_id is None: return None
+        try:
+            self.client(instance).delete_contact(contact_id) #delete from icontact
+        except IContactUnavailable as e:
+            #the worker forgets the contactId once it is deleted
+            self.divert(SyncJob.DELETE, instance, e)
+            return None
+        except IContactException as e:
+            logger.warning('could not delete contact %s: %s', contact_id, e)
+        IContact.objects.delete_contact_id(instance) #delete from database
+
+    def push_create(self, sender, instance):
+        """
+        Same as create, but lets IContactException propagate so callers such
+        as the sync worker can retry. Returns the contactId.
+
+        An object that already has a contact, e.g. when a create job is
+        replayed, is updated instead of getting a second contact.
+        """
+        if IContact.objects.get_contact_id(instance) is not None:
+            return self.push_update(sender, instance)
+        return self._push_create(sender, instance)
+
+    def _push_create(self, sender, instance):
         adapter = self.adapters[sender]
-        client = self.client()
+        logger.debug('Adapter: %s', adapter)
+        client = self.client(instance)
         contact = adapter.get_contact_data(instance) #IcontactData instance
-        icontact = self.get_contact(instance)
-        if not icontact: return None
-        contact_id = icontact['contact']['contactId']
+        data = contact.get_data()
+        logger.debug("contact's data: %s", data)
+        icontact = client.create_contact(payload=data)
+        contact_id = icontact['contacts'][0]['contactId']
+        #recorded before subscribing, so a failed subscription leaves no
+        #orphan contact and a retry updates it instead of creating another
+        IContact.objects.set_contact_id(instance, contact_id,
+            payload_hash=contact.get_hash(), payload=data['contact'])
+        client.subscribe(contact_id)
+        return contact_id
+
+    def push_update(self, sender, instance):
+        """
+        Same as update, but lets IContactException propagate. Returns the
+        contactId.
+
+        The contactId stored locally is used directly, the contact is only
+        created when there is none or iContact no longer knows it, and
+        nothing is sent when the data didn't change since the last sync.
+        """
+        adapter = self.adapters[sender]
+        client = self.client(instance)
+        icontact = IContact.objects.get_contact(instance)
+        if icontact is None:
+            return self._push_create(sender, instance)
+        contact = adapter.get_contact_data(instance) #IcontactData instance
+        payload_hash = contact.get_hash()
+        if payload_hash == icontact.payload_hash:
+            logger.debug('contact unchanged')
+            self.count('suppressed')
+            return icontact.contact_id
+        data = contact.get_data()['contact']
+        changes = diff(icontact.get_payload(), data)
+        if not changes:
+            self.count('suppressed')
+            return icontact.contact_id
+        logger.debug('changed fields: %s', changes)
         try:
-            client.delete_contact(contact_id) #delete from icontact
-        except IContactException:
-            pass
-        IContact.objects.delete_contact_id(instance) #delete from database
+            client.update_contact(contact_id=icontact.contact_id,
+                payload=changes)
+        except IContactException as e:
+            if e.status_code != 404:
+                raise
+            #deleted on iContact's side
+            return self._push_create(sender, instance)
+        self.count(len(changes) < len(data) and 'partial' or 'full')
+        IContact.objects.set_contact_id(instance, icontact.contact_id,
+            payload_hash=payload_hash, payload=data)
+        return icontact.contact_id
+
+    def sync_many(self, instances, threads=None, window=None):
+        """
+        Creates or updates the contacts of many observed instances
+        concurrently, each with push_update, i.e. created then subscribed
+        for new contacts, see icontact.executor.SyncExecutor for threads and
+        window. Instances of the same object are synced in order.
+
+        Returns a BatchResult of (instance, contactId) tuples.
+        """
+        return SyncExecutor(
+            lambda instance: self.push_update(instance.__class__, instance),
+            threads=threads, window=window).run(instances)
+
+    def push_delete(self, content_type, object_id, contact_id, account=None):
+        """
+        Deletes contact_id from iContact and forgets the mapping for the
+        object, which may no longer exist. Lets IContactException propagate.
+
+        account is the one the object was routed to when it was deleted.
+        """
+        self.client(model=content_type.model_class(),
+            account=account).delete_contact(contact_id)
+        IContact.objects.delete_for(content_type.pk, object_id)
@@ -0,0 +1,240 @@
+"""
+Client side rate limiting and retries for calls to iContact.
+"""
+import calendar
+import random
+import threading
+import time
+from email.utils import parsedate_tz, mktime_tz
+
+from icontact.conf import conf
+
+#(requests, seconds) allowed per account by iContact
+DEFAULT_RATE_LIMITS = ((10000, 3600), (75000, 86400))
+DEFAULT_MAX_WAIT = 30
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30
+#statuses worth retrying, the request was not processed
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+#methods that may have changed something before failing, they are only
+#retried when iContact says the request was not processed, i.e. on a 429 or
+#a 503 with a Retry-After header
+UNSAFE_METHODS = ('POST',)
+
+
+class RateLimitExceeded(Exception):
+    """
+        Raised when a request would have to wait longer than allowed for the
+        rate limit.
+    """
+
+    def __init__(self, wait):
+        Exception.__init__(self,
+            'Rate limit exceeded, retry in %.0f seconds' % wait)
+        self.wait = wait
+
+
+class TokenBucket(object):
+    """
+        Thread-safe token bucket refilled with rate tokens per second, holding
+        at most capacity tokens.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+            Takes a token if there is one and returns 0, otherwise returns the
+            number of seconds until a token is available.
+        """
+        with self._lock:
+            now = time.time()
+            self.tokens = min(self.capacity,
+                self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class CacheWindow(object):
+    """
+        Fixed window counter kept in Django's cache, so every process using
+        the same cache backend shares the limit. Use a backend shared by the
+        whole fleet, such as memcached, for that to hold across servers.
+    """
+
+    def __init__(self, limit, period, key):
+        self.limit = limit
+        self.period = period
+        self.key = key
+
+    def try_acquire(self):
+        """
+            Counts a request in the current window and returns 0 if it is
+            within the limit, otherwise returns the number of seconds until
+            the next window.
+        """
+        from django.core.cache import cache
+        now = time.time()
+        window = int(now // self.period)
+        key = '%s:%s:%s' % (self.key, self.period, window)
+        cache.add(key, 0, self.period * 2)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            #evicted between add and incr
+            cache.add(key, 1, self.period * 2)
+            count = 1
+        if count <= self.limit:
+            return 0
+        return (window + 1) * self.period - now
+
+
+class RateLimiter(object):
+    """
+        Keeps requests for one account under iContact's limits.
+
+        limits: sequence of (requests, seconds) pairs.
+
+        key: identifies the account in the shared cache.
+
+        max_wait: longest a request waits for the limit, in seconds, before
+                RateLimitExceeded is raised.
+
+        A local token bucket spreads requests evenly over the tightest limit,
+        then every limit is checked against the counters shared through the
+        cache.
+    """
+
+    def __init__(self, limits=DEFAULT_RATE_LIMITS, key='icontact',
+            max_wait=DEFAULT_MAX_WAIT, shared=True):
+        self.max_wait = max_wait
+        rate, period = min(limits, key=lambda limit: limit[0] / float(limit[1]))
+        self.bucket = TokenBucket(rate / float(period), rate)
+        self.windows = []
+        if shared:
+            self.windows = [CacheWindow(limit, period, 'ratelimit:%s' % key)
+                for limit, period in limits]
+
+    def acquire(self):
+        """
+            Blocks until a request can be made.
+        """
+        waited = 0
+        for limiter in [self.bucket] + self.windows:
+            while True:
+                wait = limiter.try_acquire()
+                if not wait:
+                    break
+                if waited + wait > self.max_wait:
+                    raise RateLimitExceeded(wait)
+                time.sleep(wait)
+                waited += wait
+
+
+class RetryPolicy(object):
+    """
+        Decides when and after how long a failed request is retried.
+
+        Delays grow exponentially from backoff up to max_backoff seconds,
+        with full jitter so clients failing together don't retry together.
+    """
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES,
+            backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def should_retry(self, attempt, response=None, method=None):
+        """
+            Whether to retry a request of method after attempt (starting at
+            0) failed with response, or without a response on a connection
+            error.
+        """
+        if attempt >= self.max_retries:
+            return False
+        if response is None:
+            return True
+        if method in UNSAFE_METHODS:
+            return response.status_code == 429 or (
+                response.status_code == 503 and
+                'Retry-After' in response.headers)
+        return response.status_code in RETRY_STATUSES
+
+    def delay(self, attempt, response=None):
+        """
+            Seconds to wait before the next attempt, honoring the Retry-After
+            header of response if there is one.
+        """
+        retry_after = None
+        if response is not None:
+            retry_after = parse_retry_after(
+                response.headers.get('Retry-After'))
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0,
+            min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    """
+        Returns the seconds a Retry-After header value, either a number of
+        seconds or an http date, asks to wait, or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(mktime_tz(date) - calendar.timegm(time.gmtime()), 0)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(account_id):
+    """
+        Returns the RateLimiter shared by every client of account_id in the
+        process.
+
+        Optional settings:
+
+        ICONTACT_RATE_LIMITS: sequence of (requests, seconds) pairs, None to
+                        disable rate limiting.
+
+        ICONTACT_RATE_MAX_WAIT: seconds a request may wait for the limit.
+    """
+    limits = conf.get('RATE_LIMITS', DEFAULT_RATE_LIMITS)
+    if not limits:
+        return None
+    with _limiters_lock:
+        if account_id not in _limiters:
+            _limiters[account_id] = RateLimiter(limits,
+                key=str(account_id),
+                max_wait=conf.get('RATE_MAX_WAIT', DEFAULT_MAX_WAIT))
+        return _limiters[account_id]
+
+
+def get_retry_policy():
+    """
+        Returns a RetryPolicy built from the ICONTACT_MAX_RETRIES,
+        ICONTACT_BACKOFF and ICONTACT_MAX_BACKOFF settings.
+    """
+    return RetryPolicy(
+        max_retries=conf.get('MAX_RETRIES', DEFAULT_MAX_RETRIES),
+        backoff=conf.get('BACKOFF', DEFAULT_BACKOFF),
+        max_backoff=conf.get('MAX_BACKOFF', DEFAULT_MAX_BACKOFF))
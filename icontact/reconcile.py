@@ -0,0 +1,418 @@
+"""
+Two-way reconciliation between observed objects and iContact contacts.
+
+Local objects and remote contacts are streamed to disk, spread over a number
+of partition files by a hash of their contactId or email, and matched one
+partition at a time, so memory use depends on the partition size rather than
+on the number of contacts.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import zlib
+
+from django.db.models import get_model
+
+from icontact.adapter import InvalidContactData
+from icontact.backfill import iter_pages, object_pk
+from icontact.client import IContactException, chunks
+from icontact.models import IContact
+from icontact.observer import get_observer, observed_models
+
+logger = logging.getLogger(__name__)
+
+#local object iContact has no contact for
+MISSING = 'missing'
+#iContact contact no local object is synced with
+ORPHAN = 'orphan'
+#synced object and contact whose fields differ
+MISMATCH = 'mismatch'
+#object and contact with the same email, but no mapping between them
+UNLINKED = 'unlinked'
+
+DEFAULT_PARTITIONS = 64
+DEFAULT_BATCH_SIZE = 500
+#fields owned by iContact, changed by unsubscribes and bounces
+DEFAULT_IGNORE = ('status',)
+
+
+class Partitions(object):
+    """
+        count append only files of json lines, records are spread over them
+        by a stable hash of a key.
+    """
+
+    def __init__(self, directory, name, count):
+        self.paths = [os.path.join(directory, '%s.%s' % (name, i))
+            for i in range(count)]
+        self.files = [None] * count
+
+    def __len__(self):
+        return len(self.paths)
+
+    def write(self, key, record):
+        i = (zlib.crc32(key.encode('utf-8')) & 0xffffffff) % len(self.paths)
+        if self.files[i] is None:
+            self.files[i] = open(self.paths[i], 'a')
+        self.files[i].write(json.dumps(record) + '\n')
+
+    def close(self):
+        for i, f in enumerate(self.files):
+            if f is not None:
+                f.close()
+                self.files[i] = None
+
+    def read(self, i):
+        """
+            Yields the records of partition i.
+        """
+        if not os.path.exists(self.paths[i]):
+            return
+        with open(self.paths[i]) as f:
+            for line in f:
+                yield json.loads(line)
+
+
+class PartialData(object):
+    """
+        Quacks like IContactData for the fields that need to be repaired.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def get_data(self):
+        return {'contact': self.fields}
+
+
+def normalize(value):
+    if value is None:
+        return u''
+    return (u'%s' % value).strip()
+
+
+def label(model):
+    return '%s.%s' % (model._meta.app_label, model._meta.object_name.lower())
+
+
+class Reconciler(object):
+    """
+        Compares observed objects with iContact's contacts and repairs the
+        differences.
+
+        models: observed models to reconcile, all of them by default.
+
+        client: client used to fetch and repair contacts of every model, by
+                default the models are grouped by the account their
+                observer syncs them with, and each account is reconciled
+                with its own client. Models routed to an account per
+                instance can't be reconciled that way and raise ValueError.
+
+        partitions: number of partition files, each partition is loaded in
+                memory in turn.
+
+        ignore: contact fields not compared.
+    """
+
+    def __init__(self, models=None, client=None, partitions=DEFAULT_PARTITIONS,
+            batch_size=DEFAULT_BATCH_SIZE, ignore=DEFAULT_IGNORE,
+            directory=None):
+        self.models = models or observed_models()
+        if not self.models:
+            raise ValueError('no observed models to reconcile')
+        for model in self.models:
+            if get_observer(model) is None:
+                raise ValueError('%s is not observed' % model.__name__)
+        self.client = client
+        #account -> models synced with it, and the client of the account
+        self.groups = {}
+        self.clients = {}
+        for model in self.models:
+            observer = get_observer(model)
+            if client is not None:
+                account = None
+            elif observer.routes_per_instance(model):
+                raise ValueError('%s is routed to accounts per instance, '
+                    'it can only be reconciled with a client'
+                    % model.__name__)
+            else:
+                account = observer.get_account(model=model)
+            self.groups.setdefault(account, []).append(model)
+            if account not in self.clients:
+                self.clients[account] = client or observer.client(
+                    model=model)
+        #account of the differences being emitted
+        self._account = None
+        self.partitions = partitions
+        self.batch_size = batch_size
+        self.ignore = ignore
+        self.directory = directory
+        self.stats = dict((key, 0) for key in
+            ('local', 'remote', MISSING, ORPHAN, MISMATCH, UNLINKED))
+
+    def diff(self, output):
+        """
+            Writes one json line per difference to the file output, and
+            returns the stats.
+        """
+        for account, models in self.groups.items():
+            self.diff_account(account, models, output)
+        return self.stats
+
+    def diff_account(self, account, models, output):
+        """
+            Compares the objects of models with the contacts of account.
+            Differences are written with the account.
+        """
+        self._account = account
+        directory = tempfile.mkdtemp(prefix='icontact-', dir=self.directory)
+        try:
+            by_id = Partitions(directory, 'id', self.partitions)
+            by_email = Partitions(directory, 'email', self.partitions)
+            self.scan_local(by_id, by_email, models)
+            self.scan_remote(by_id, self.clients[account])
+            by_id.close()
+            for i in range(len(by_id)):
+                self.join_ids(by_id, i, by_email, output)
+            by_email.close()
+            for i in range(len(by_email)):
+                self.join_emails(by_email, i, output)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def scan_local(self, by_id, by_email, models):
+        """
+            Writes the contact data of every object of models to by_id if it
+            is mapped to a contact, and to by_email otherwise.
+        """
+        for model in models:
+            adapter = get_observer(model).adapters[model]
+            rows = adapter.bulk_queryset(model._default_manager.all())
+            for page in iter_pages(rows, self.batch_size):
+                mapped = IContact.objects.get_contact_ids_for(model,
+                    [object_pk(obj) for obj in page])
+                for obj in page:
+                    try:
+                        contact = adapter.get_bulk_contact_data(obj)
+                    except InvalidContactData as e:
+                        logger.warning('skipping %r: %s', obj, e)
+                        continue
+                    data = contact.get_data()['contact']
+                    pk = object_pk(obj)
+                    record = {'model': label(model), 'pk': pk,
+                        'email': normalize(data.get('email')).lower(),
+                        'data': data}
+                    contact_id = mapped.get(pk)
+                    if contact_id is None:
+                        by_email.write(record['email'], ['local', record])
+                    else:
+                        record['contactId'] = str(contact_id)
+                        by_id.write(record['contactId'], ['local', record])
+                    self.stats['local'] += 1
+
+    def scan_remote(self, by_id, client):
+        """
+            Writes every contact of client's account to by_id.
+        """
+        for contact in client.iter_contacts(prefetch=True):
+            if contact.get('status') == 'deleted':
+                continue
+            record = {'contactId': str(contact['contactId']),
+                'email': normalize(contact.get('email')).lower(),
+                'data': contact}
+            by_id.write(record['contactId'], ['remote', record])
+            self.stats['remote'] += 1
+
+    def compare(self, local, remote):
+        """
+            Returns the local value of the fields that differ.
+        """
+        fields = {}
+        for key, value in local.items():
+            if key in self.ignore:
+                continue
+            theirs = normalize(remote.get(key))
+            ours = normalize(value)
+            if key == 'email':
+                theirs, ours = theirs.lower(), ours.lower()
+            if theirs != ours:
+                fields[key] = value
+        return fields
+
+    def emit(self, output, kind, **entry):
+        entry['type'] = kind
+        entry['account'] = self._account
+        output.write(json.dumps(entry) + '\n')
+        self.stats[kind] += 1
+
+    def join_ids(self, by_id, i, by_email, output):
+        """
+            Matches the mapped objects and remote contacts of partition i by
+            contactId. Remote contacts without a match are written to
+            by_email to be matched by email.
+        """
+        local = {}
+        for side, record in by_id.read(i):
+            if side == 'local':
+                local[record['contactId']] = record
+        for side, record in by_id.read(i):
+            if side != 'remote':
+                continue
+            ours = local.pop(record['contactId'], None)
+            if ours is None:
+                by_email.write(record['email'], ['remote', record])
+                continue
+            fields = self.compare(ours['data'], record['data'])
+            if fields:
+                self.emit(output, MISMATCH, model=ours['model'],
+                    pk=ours['pk'], contactId=record['contactId'],
+                    fields=fields)
+        #mapped to a contact that no longer exists
+        for record in local.values():
+            self.emit(output, MISSING, model=record['model'], pk=record['pk'],
+                contactId=record['contactId'])
+
+    def join_emails(self, by_email, i, output):
+        """
+            Matches the unmapped objects and unmatched remote contacts of
+            partition i by email.
+        """
+        local = {}
+        for side, record in by_email.read(i):
+            if side == 'local':
+                local.setdefault(record['email'], []).append(record)
+        for side, record in by_email.read(i):
+            if side != 'remote':
+                continue
+            matches = local.get(record['email'])
+            if not matches:
+                self.emit(output, ORPHAN, contactId=record['contactId'],
+                    email=record['email'])
+                continue
+            ours = matches.pop(0)
+            self.emit(output, UNLINKED, model=ours['model'], pk=ours['pk'],
+                contactId=record['contactId'],
+                fields=self.compare(ours['data'], record['data']))
+        for matches in local.values():
+            for record in matches:
+                self.emit(output, MISSING, model=record['model'],
+                    pk=record['pk'])
+
+    def repair(self, entries, delete_orphans=False):
+        """
+            Repairs the differences read from entries, an iterable of the
+            dicts written by diff, in batches. Returns the number of entries
+            repaired per type.
+
+            Missing contacts are created, mismatched fields sent to iContact,
+            unlinked objects mapped to their contact, and orphaned contacts
+            deleted from iContact if delete_orphans is True.
+        """
+        repaired = dict((kind, 0) for kind in
+            (MISSING, ORPHAN, MISMATCH, UNLINKED))
+        handlers = {MISSING: self.repair_missing,
+            MISMATCH: self.repair_mismatches,
+            UNLINKED: self.repair_unlinked}
+        if delete_orphans:
+            handlers[ORPHAN] = self.repair_orphans
+        for chunk in chunks(entries, self.batch_size):
+            by_kind = {}
+            for entry in chunk:
+                by_kind.setdefault((entry.get('account'), entry['type']),
+                    []).append(entry)
+            for (account, kind), batch in by_kind.items():
+                if kind not in handlers:
+                    continue
+                client = self.client or self.clients.get(account)
+                if client is None:
+                    logger.warning('skipping %s %s differences of account %s,'
+                        ' not reconciled', len(batch), kind, account)
+                    continue
+                repaired[kind] += handlers[kind](client, batch)
+        return repaired
+
+    def load(self, entries):
+        """
+            Returns (entry, object) pairs for the entries whose object still
+            exists, with one query per model.
+        """
+        by_model = {}
+        for entry in entries:
+            by_model.setdefault(entry['model'], []).append(entry)
+        pairs = []
+        for name, batch in by_model.items():
+            model = get_model(*name.split('.'))
+            objects = model._default_manager.in_bulk(
+                [entry['pk'] for entry in batch])
+            pairs.extend([(entry, objects[entry['pk']]) for entry in batch
+                if entry['pk'] in objects])
+        return pairs
+
+    def repair_missing(self, client, entries):
+        pairs = self.load(entries)
+        contacts = []
+        owners = {}
+        for entry, obj in pairs:
+            model = obj.__class__
+            contact = get_observer(model).adapters[model].get_contact_data(obj)
+            owners[id(contact)] = obj
+            contacts.append(contact)
+        result = client.create_contacts(contacts,
+            batch_size=self.batch_size)
+        for contact, contact_id in result.results:
+            IContact.objects.set_contact_id(owners[id(contact)], contact_id,
+                payload_hash=contact.get_hash(),
+                payload=contact.get_data()['contact'])
+        for contact, message in result.errors:
+            logger.warning('could not create %s: %s', contact.email, message)
+        client.subscribe_many([contact_id for contact, contact_id
+            in result.results], batch_size=self.batch_size)
+        return len(result.results)
+
+    def repair_mismatches(self, client, entries):
+        updates = []
+        owners = {}
+        for entry, obj in self.load(entries):
+            model = obj.__class__
+            try:
+                contact = get_observer(model).adapters[model].get_contact_data(
+                    obj)
+            except InvalidContactData as e:
+                logger.warning('skipping %r: %s', obj, e)
+                continue
+            data = contact.get_data()['contact']
+            #current values, the object may have changed since the diff
+            partial = PartialData(dict((key, data.get(key, u''))
+                for key in entry['fields']))
+            owners[id(partial)] = (obj, contact)
+            updates.append((entry['contactId'], partial))
+        result = client.update_contacts(updates, batch_size=self.batch_size)
+        for (contact_id, partial), _ in result.results:
+            #the other fields matched, iContact now has the whole data
+            obj, contact = owners[id(partial)]
+            IContact.objects.set_contact_id(obj, contact_id,
+                payload_hash=contact.get_hash(),
+                payload=contact.get_data()['contact'])
+        for (contact_id, partial), message in result.errors:
+            logger.warning('could not update %s: %s', contact_id, message)
+        return len(result.results)
+
+    def repair_unlinked(self, client, entries):
+        pairs = self.load(entries)
+        for entry, obj in pairs:
+            #without a snapshot the next save sends every field
+            IContact.objects.set_contact_id(obj, entry['contactId'])
+        return len(pairs)
+
+    def repair_orphans(self, client, entries):
+        repaired = 0
+        for entry in entries:
+            try:
+                client.delete_contact(entry['contactId'])
+                repaired += 1
+            except IContactException as e:
+                logger.warning('could not delete %s: %s', entry['contactId'],
+                    e)
+        return repaired
@@ -0,0 +1,138 @@
+"""
+Clients for several iContact accounts and folders in one deployment.
+
+Accounts are named in the ICONTACT_ACCOUNTS setting::
+
+    ICONTACT_ACCOUNTS = {
+        'acme': {'API_KEY': '...', 'USERNAME': '...', 'PASSWORD': '...',
+            'ACCOUNT_ID': 1234, 'FOLDER_ID': 5678, 'DEFAULT_LIST': 42},
+    }
+
+Keys left out are read from the ICONTACT_* settings, and the 'default'
+account is built from them alone unless it is defined.
+"""
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+
+from icontact.client import IContactClient
+from icontact.conf import conf
+from icontact.session import build_pool
+
+DEFAULT_ACCOUNT = 'default'
+
+#ICONTACT_ACCOUNTS key -> IContactClient argument
+ACCOUNT_KEYS = (
+    ('API_KEY', 'api_key'),
+    ('USERNAME', 'username'),
+    ('PASSWORD', 'password'),
+    ('ACCOUNT_ID', 'account_id'),
+    ('FOLDER_ID', 'folder_id'),
+    ('DEFAULT_LIST', 'default_list'),
+)
+
+
+class ClientRegistry(object):
+    """
+        Builds one client per account the first time it is asked for, and
+        hands out the same client afterwards.
+
+        Each account other than the default one gets its own ConnectionPool,
+        so a slow account can't use up the connections of the others. Rate
+        limiters are per account id already.
+
+        accounts: dict of account settings by name, ICONTACT_ACCOUNTS by
+                default.
+
+        client_class: class of the clients built.
+    """
+
+    def __init__(self, accounts=None, client_class=IContactClient):
+        self._accounts = accounts
+        self.client_class = client_class
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def accounts(self):
+        """
+            Returns the settings of every account by name.
+        """
+        if self._accounts is None:
+            self._accounts = conf.get('ACCOUNTS', None) or {}
+        return self._accounts
+
+    def build(self, name):
+        """
+            Returns a new client for the account name.
+        """
+        config = self.accounts().get(name)
+        if config is None:
+            if name != DEFAULT_ACCOUNT:
+                raise ImproperlyConfigured(
+                    'Unknown iContact account %r, add it to ICONTACT_ACCOUNTS'
+                    % name)
+            return self.client_class()
+        kwargs = dict((argument, config[key]) for key, argument
+            in ACCOUNT_KEYS if key in config)
+        if name != DEFAULT_ACCOUNT:
+            kwargs['pool'] = build_pool()
+        return self.client_class(**kwargs)
+
+    def get_client(self, name=None):
+        """
+            Returns the client of the account name, the default account if
+            not given.
+        """
+        name = name or DEFAULT_ACCOUNT
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = self._clients[name] = self.build(name)
+        return client
+
+    def close(self):
+        """
+            Closes the pools of the clients built so far and forgets them.
+        """
+        with self._lock:
+            for client in self._clients.values():
+                if client._pool is not None:
+                    client._pool.close()
+            self._clients = {}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+        Returns the process wide ClientRegistry.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ClientRegistry()
+    return _registry
+
+
+def get_client(account=None):
+    """
+        Returns the client of account, the default account if not given.
+    """
+    return get_registry().get_client(account)
+
+
+def reset_registry():
+    """
+        Discards the process wide registry and its clients, the next call
+        builds them from the current settings.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry.close()
+        _registry = None
@@ -0,0 +1,152 @@
+"""
+Pooled http connections to iContact.
+
+Every IContactClient in a process shares one ConnectionPool, so TCP and TLS
+handshakes are paid once per connection instead of once per api call.
+"""
+import threading
+
+from icontact.conf import conf
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_TIMEOUT = 10
+
+
+class ConnectionPool(object):
+    """
+        Thread-safe pool of keep-alive connections.
+
+        A single HTTPAdapter, and therefore a single urllib3 pool manager, is
+        shared by every thread. requests.Session objects are not safe to share
+        between threads, so each thread gets its own session mounted on the
+        shared adapter.
+
+        pool_connections: number of hosts to keep connection pools for.
+
+        pool_maxsize: number of connections kept open per host.
+
+        keep_alive: when False every request is sent with "Connection: close".
+
+        timeout: seconds to wait for iContact before giving up, None waits
+                forever.
+    """
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS,
+            pool_maxsize=DEFAULT_POOL_MAXSIZE, keep_alive=True,
+            timeout=DEFAULT_TIMEOUT):
+        """
+            Instantiate an instance of the class.
+        """
+        #requests is only imported once a pool is needed
+        from requests.adapters import HTTPAdapter
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.adapter = HTTPAdapter(pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize)
+        self._local = threading.local()
+
+    def session(self):
+        """
+            Returns the requests session bound to the current thread.
+        """
+        import requests
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self.adapter)
+            session.mount('http://', self.adapter)
+            if not self.keep_alive:
+                session.headers['Connection'] = 'close'
+            self._local.session = session
+        return session
+
+    def request(self, method, url, **kwargs):
+        """
+            Sends a request through the pool, applying the default timeout
+            unless one is given.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session().request(method, url, **kwargs)
+
+    def stats(self):
+        """
+            Returns a dict with the number of connections opened, the number
+            of requests made and how many of those reused an open connection.
+        """
+        opened = 0
+        made = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                #evicted by another thread while we were iterating
+                continue
+            opened += pool.num_connections
+            made += pool.num_requests
+        return {
+            'opened': opened,
+            'requests': made,
+            'reused': max(made - opened, 0),
+        }
+
+    def close(self):
+        """
+            Closes every pooled connection.
+        """
+        self.adapter.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def build_pool():
+    """
+        Returns a new ConnectionPool configured from settings, see get_pool.
+    """
+    return ConnectionPool(
+        pool_connections=conf.get(
+            'POOL_CONNECTIONS', DEFAULT_POOL_CONNECTIONS),
+        pool_maxsize=conf.get('POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE),
+        keep_alive=conf.get('KEEP_ALIVE', True),
+        timeout=conf.get('TIMEOUT', DEFAULT_TIMEOUT))
+
+
+def get_pool():
+    """
+        Returns the process wide ConnectionPool, creating it from settings
+        the first time it is needed.
+
+        Optional settings:
+
+        ICONTACT_POOL_CONNECTIONS: number of hosts to pool connections for.
+
+        ICONTACT_POOL_MAXSIZE: connections kept open per host.
+
+        ICONTACT_KEEP_ALIVE: set to False to close connections after each
+                        request.
+
+        ICONTACT_TIMEOUT: seconds to wait for a response from iContact.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = build_pool()
+    return _pool
+
+
+def reset_pool():
+    """
+        Closes and discards the process wide pool, the next call to get_pool
+        builds a new one from the current settings.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = None
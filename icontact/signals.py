@@ -0,0 +1,10 @@
+"""
+Signals sent by django-icontact.
+"""
+from django.dispatch import Signal
+
+#sent once per api call, after its retries, with sender the client.
+#status_code and reused are None when unknown, error is the exception
+#raised if the call failed
+api_call = Signal(providing_args=['method', 'url', 'resource', 'status_code',
+    'duration', 'retries', 'bytes_sent', 'bytes_received', 'reused', 'error'])
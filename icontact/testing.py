@@ -0,0 +1,284 @@
+"""
+In-process fake of the iContact api, for tests and benchmarks that must not
+reach iContact.
+
+    fake = FakeIContact(latency=0.05, error_rate=0.01)
+    client = IContactClient(pool=fake.pool())
+
+or, for tests, fake.client().
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from icontact.breaker import CircuitBreaker
+from icontact.client import IContactClient
+from icontact.ratelimit import RateLimiter, RetryPolicy
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+#/icp/a/<account>/c/<folder>/<resource>
+RESOURCE_RE = re.compile(r'/a/[^/]+/c/[^/]+/(?P<resource>[^/]+)/?'
+    r'(?P<id>[^/]*)/?$')
+CONTACT_FIELDS = ('email', 'prefix', 'firstName', 'lastName', 'suffix',
+    'street', 'street2', 'city', 'state', 'postalCode', 'phone', 'fax',
+    'business', 'status')
+
+
+class FakeResponse(object):
+    """
+        The parts of requests.Response the client uses.
+    """
+
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+        self.content = json.dumps(data).encode('utf-8')
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+
+class FakePool(object):
+    """
+        Stands in for icontact.session.ConnectionPool, handing requests to a
+        FakeIContact instead of sending them over the network.
+    """
+
+    def __init__(self, fake):
+        self.fake = fake
+        self.requests = 0
+
+    def request(self, method, url, data=None, headers=None, params=None,
+            **kwargs):
+        self.requests += 1
+        payload = data and json.loads(data)
+        return self.fake.handle(method, urlparse(url).path, params or {},
+            payload, headers)
+
+    def stats(self):
+        return {'opened': 1, 'requests': self.requests,
+            'reused': max(self.requests - 1, 0)}
+
+    def close(self):
+        pass
+
+
+class FakeIContact(object):
+    """
+        Keeps contacts, lists and subscriptions in memory and answers
+        requests the way iContact's json api does.
+
+        latency: seconds every request takes.
+
+        error_rate: fraction of requests answered with a 503.
+
+        rate_limit: (requests, seconds) allowed, further requests are
+                answered with a 429 and a Retry-After header.
+
+        Single contacts and lists are returned with an ETag, and a 304 Not
+        Modified is answered when it matches the If-None-Match header.
+    """
+
+    def __init__(self, latency=0, error_rate=0, rate_limit=None, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.contacts = OrderedDict()
+        self.lists = OrderedDict()
+        self.subscriptions = {}
+        #(method, resource) of every request handled
+        self.log = []
+        self._window = (0, 0)
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def pool(self):
+        """
+            Returns a pool to give to IContactClient.
+        """
+        return FakePool(self)
+
+    def client(self, **kwargs):
+        """
+            Returns an IContactClient talking to the fake, with a local rate
+            limiter loose enough for tests, no retries and a circuit breaker
+            of its own, unless limiter, retry or breaker are given. Other
+            kwargs go to IContactClient.
+        """
+        kwargs.setdefault('limiter', RateLimiter(((1000, 1),), shared=False))
+        kwargs.setdefault('retry', RetryPolicy(max_retries=0, backoff=0))
+        #failures of one fake must not open the account's shared breaker
+        kwargs.setdefault('breaker', CircuitBreaker())
+        return IContactClient(pool=self.pool(), **kwargs)
+
+    def new_id(self):
+        self._next_id += 1
+        return str(self._next_id)
+
+    def add_list(self, name):
+        """
+            Creates a list and returns its listId.
+        """
+        with self._lock:
+            list_id = self.new_id()
+            self.lists[list_id] = {'listId': list_id, 'name': name}
+            return list_id
+
+    def handle(self, method, path, params, payload, headers=None):
+        """
+            Returns the FakeResponse for a request.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            match = RESOURCE_RE.search(path)
+            resource = match and match.group('resource')
+            self.log.append((method, resource))
+            if self.rate_limit is not None:
+                limit, period = self.rate_limit
+                window = int(time.time() // period)
+                start, count = self._window
+                if start != window:
+                    start, count = window, 0
+                self._window = (start, count + 1)
+                if count >= limit:
+                    retry_after = (window + 1) * period - time.time()
+                    return FakeResponse(429, {'errors': ['Rate limited']},
+                        {'Retry-After': str(int(retry_after) + 1)})
+            if self.error_rate and self.random.random() < self.error_rate:
+                return FakeResponse(503, {'errors': ['Service Unavailable']})
+            handler = getattr(self, '%s_%s' % (method.lower(), resource),
+                None)
+            if handler is None:
+                return FakeResponse(404, {'errors': ['Not Found']})
+            response = handler(match.group('id'), params, payload)
+            if method == 'GET' and match.group('id') and \
+                    response.status_code == 200:
+                etag = '"%s"' % hashlib.sha1(json.dumps(response.data,
+                    sort_keys=True).encode('utf-8')).hexdigest()
+                if (headers or {}).get('If-None-Match') == etag:
+                    return FakeResponse(304, headers={'ETag': etag})
+                response.headers['ETag'] = etag
+            return response
+
+    def _items(self, payload, key):
+        if isinstance(payload, list):
+            return payload
+        return [payload[key]]
+
+    def _save_contact(self, data):
+        contact_id = str(data.get('contactId', '')) or None
+        if contact_id is not None:
+            contact = self.contacts.get(contact_id)
+            if contact is None:
+                return None, 'contactId %s not found' % contact_id
+        elif not data.get('email') or '@' not in data['email']:
+            return None, 'Invalid email address'
+        else:
+            contact = dict((field, '') for field in CONTACT_FIELDS)
+            contact['status'] = 'normal'
+            contact['contactId'] = self.new_id()
+            self.contacts[contact['contactId']] = contact
+        for key, value in data.items():
+            if key != 'contactId':
+                contact[key] = value
+        return contact, None
+
+    def post_contacts(self, contact_id, params, payload):
+        if contact_id:
+            return self.put_contacts(contact_id, params, payload)
+        saved = []
+        warnings = []
+        for data in self._items(payload, 'contact'):
+            contact, warning = self._save_contact(data)
+            if contact is None:
+                warnings.append(warning)
+            else:
+                saved.append(dict(contact))
+        data = {'contacts': saved}
+        if warnings:
+            data['warnings'] = warnings
+        return FakeResponse(200, data)
+
+    def get_contacts(self, contact_id, params, payload):
+        if contact_id:
+            contact = self.contacts.get(contact_id)
+            if contact is None:
+                return FakeResponse(404, {'errors': ['Not Found']})
+            return FakeResponse(200, {'contact': dict(contact)})
+        filters = dict((key, value) for key, value in params.items()
+            if key not in ('offset', 'limit', 'fields'))
+        contacts = [c for c in self.contacts.values() if all(
+            str(c.get(key)) == str(value) for key, value in filters.items())]
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 20))
+        page = contacts[offset:offset + limit]
+        if params.get('fields'):
+            fields = params['fields'].split(',')
+            page = [dict((f, c.get(f)) for f in fields) for c in page]
+        else:
+            page = [dict(c) for c in page]
+        return FakeResponse(200, {'contacts': page, 'total': len(contacts)})
+
+    def put_contacts(self, contact_id, params, payload):
+        if contact_id not in self.contacts or \
+                self.contacts[contact_id]['status'] == 'deleted':
+            return FakeResponse(404, {'errors': ['Not Found']})
+        data = dict(payload.get('contact', payload), contactId=contact_id)
+        contact, warning = self._save_contact(data)
+        return FakeResponse(200, {'contact': dict(contact)})
+
+    def delete_contacts(self, contact_id, params, payload):
+        contact = self.contacts.get(contact_id)
+        if contact is None or contact['status'] == 'deleted':
+            return FakeResponse(404, {'errors': ['Not Found']})
+        contact['status'] = 'deleted'
+        return FakeResponse(200, [])
+
+    def post_subscriptions(self, subscription_id, params, payload):
+        saved = []
+        warnings = []
+        for data in self._items(payload, 'subscription'):
+            key = (str(data['listId']), str(data['contactId']))
+            if str(data['contactId']) not in self.contacts:
+                warnings.append('contactId %s not found' % key[1])
+                continue
+            current = self.subscriptions.get(key)
+            if current is not None and current['status'] == data['status']:
+                warnings.append('Already subscribed')
+                continue
+            subscription = {'subscriptionId': '%s_%s' % key,
+                'listId': key[0], 'contactId': key[1],
+                'status': data['status']}
+            self.subscriptions[key] = subscription
+            saved.append(dict(subscription))
+        data = {'subscriptions': saved}
+        if warnings:
+            data['warnings'] = warnings
+        return FakeResponse(200, data)
+
+    def get_lists(self, list_id, params, payload):
+        if list_id:
+            if list_id not in self.lists:
+                return FakeResponse(404, {'errors': ['Not Found']})
+            return FakeResponse(200, {'list': dict(self.lists[list_id])})
+        lists = [dict(l) for l in self.lists.values()]
+        return FakeResponse(200, {'lists': lists, 'total': len(lists)})
+
+    def post_lists(self, list_id, params, payload):
+        saved = []
+        for data in self._items(payload, 'list'):
+            list_id = self.new_id()
+            self.lists[list_id] = dict(data, listId=list_id)
+            saved.append(dict(self.lists[list_id]))
+        return FakeResponse(200, {'lists': saved})
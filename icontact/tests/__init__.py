@@ -1,6 +1,32 @@
+import sys
+
 from icontact.tests.client import IContactClientTests
+from icontact.tests.client import IContactBatchTests
+from icontact.tests.client import IContactPagingTests
 from icontact.tests.adapter import IContactDataTests
 from icontact.tests.adapter import IContactAdapterTests
+from icontact.tests.adapter import FieldMapAdapterTests
 from icontact.tests.models import IContactManagerTests
 from icontact.tests.models import IContactModelTests
 from icontact.tests.observer import IContactObserverTests
+from icontact.tests.observer import IContactObserverSyncTests
+from icontact.tests.session import ConnectionPoolTests
+from icontact.tests.worker import SyncWorkerTests
+from icontact.tests.backfill import BackfillTests
+from icontact.tests.ratelimit import RateLimitTests, RetryTests
+from icontact.tests.coalesce import CoalesceTests
+from icontact.tests.reconcile import ReconcilerTests
+from icontact.tests.testing import FakeIContactTests
+from icontact.tests.benchmark import BenchmarkTests
+from icontact.tests.metrics import MetricsTests
+from icontact.tests.registry import ClientRegistryTests, AccountRoutingTests
+from icontact.tests.lists import ListTests
+from icontact.tests.ingest import IngestTests
+from icontact.tests.breaker import CircuitBreakerTests, OutboxTests
+from icontact.tests.executor import SyncExecutorTests
+from icontact.tests.conf import SettingsTests
+from icontact.tests.caching import ContactCacheTests
+from icontact.tests.transfer import TransferTests
+
+if sys.version_info >= (3, 6):
+    from icontact.tests.aio import AsyncIContactClientTests
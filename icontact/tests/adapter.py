@@ -1,10 +1,15 @@
+import json
 import unittest
 
 from django.test import TestCase
 from django.conf import settings
+from django.core.management import call_command
 from django.db import IntegrityError
+from django.db.models import loading
 
-from icontact.adapter import IContactData, IContactAdapter
+from icontact.adapter import IContactData, IContactAdapter, \
+    FieldMapAdapter, InvalidContactData
+from icontact.tests.models import MyContact, MyProfile
 
 
 class IContactDataTests(TestCase):
@@ -17,12 +22,41 @@ class IContactDataTests(TestCase):
             
     def test_get_data(self):
         data = self.data.get_data()
-        self.assertEqual(14, len(data['contact']))
-        self.assertEqual(data['contact']['email'],'info@rochapps.com')
+        self.assertEqual({'email': 'info@rochapps.com', 'status': 'normal'},
+            data['contact'])
+        data['contact']['city'] = 'Durham'
+        self.assertEqual('', self.data.city)
+        self.assertFalse('city' in self.data.get_data()['contact'])
+
+    def test_slots(self):
+        self.assertRaises(AttributeError, setattr, self.data, 'extra', 1)
         
     def test_default_status(self):
         self.data = IContactData(email='info@rochapps.com')
         self.assertEqual(self.data.status, 'normal')
+
+    def test_validation(self):
+        self.assertRaises(InvalidContactData, IContactData, email='')
+        self.assertRaises(InvalidContactData, IContactData, email='rochapps')
+        self.assertRaises(InvalidContactData, IContactData,
+            email='info@rochapps.com', state='North Carolina')
+        self.assertEqual('NC', IContactData(email='info@rochapps.com',
+            state='NC').state)
+
+    def test_custom_fields(self):
+        data = IContactData(email='info@rochapps.com', first_name='victor',
+            custom={'favoriteColor': 'blue', 'empty': ''})
+        contact = data.get_data()['contact']
+        self.assertEqual('blue', contact['favoriteColor'])
+        self.assertFalse('empty' in contact)
+        self.assertEqual(contact, json.loads(data.to_json()))
+
+    def test_to_json(self):
+        data = IContactData(email='info@rochapps.com', first_name=u'V\xedctor',
+            postal_code=27713)
+        contact = json.loads(data.to_json(contact_id='7'))
+        self.assertEqual('7', contact.pop('contactId'))
+        self.assertEqual(data.get_data()['contact'], contact)
         
 
 class IContactAdapterTests(TestCase):
@@ -37,3 +71,52 @@ class IContactAdapterTests(TestCase):
         instance = 1
         self.assertRaises(NotImplementedError, self.adapter.get_contact_data,
             instance)
+
+
+class ProfileAdapter(FieldMapAdapter):
+    fields = {'email': 'contact__email', 'first_name': 'contact__first_name',
+        'city': 'city'}
+    custom = {'source': 'contact__id'}
+
+
+class FieldMapAdapterTests(TestCase):
+    """
+        Tests for declarative adapters
+    """
+
+    def setUp(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+        self.contact = MyContact.objects.create(email='info@rochapps.com',
+            first_name='victor')
+        self.profile = MyProfile.objects.create(contact=self.contact,
+            city='Durham')
+        self.adapter = ProfileAdapter()
+
+    def test_get_contact_data(self):
+        data = self.adapter.get_contact_data(self.profile)
+        self.assertEqual('info@rochapps.com', data.email)
+        self.assertEqual('victor', data.firstName)
+        self.assertEqual('Durham', data.city)
+        self.assertEqual(self.contact.pk, data.custom['source'])
+
+    def test_bulk(self):
+        with self.assertNumQueries(1):
+            rows = list(self.adapter.bulk_queryset(MyProfile.objects.all()))
+        self.assertEqual(self.profile.pk, rows[0]['pk'])
+        self.assertEqual(
+            self.adapter.get_contact_data(self.profile).get_data(),
+            self.adapter.get_bulk_contact_data(rows[0]).get_data())
+
+    def test_unset_relation(self):
+        profile = MyProfile.objects.create(city='Durham')
+        self.assertRaises(InvalidContactData, self.adapter.get_contact_data,
+            profile)
+
+    def test_defaults(self):
+        adapter = FieldMapAdapter(fields={'email': 'email'},
+            defaults={'status': 'donotcontact'})
+        self.assertEqual('donotcontact',
+            adapter.get_contact_data(self.contact).status)
+        self.assertRaises(ValueError, FieldMapAdapter, fields={'city': 'city'})
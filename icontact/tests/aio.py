@@ -0,0 +1,104 @@
+import asyncio
+import json
+import uuid
+
+from django.test import TestCase
+
+from icontact.adapter import IContactData
+from icontact.aio import AsyncIContactClient
+from icontact.client import IContactException, IContactUnavailable
+from icontact.ratelimit import RateLimiter, RetryPolicy
+
+
+class StubAsyncResponse(object):
+
+    def __init__(self, status, data):
+        self.status = status
+        self.headers = {}
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def read(self):
+        return json.dumps(self.data).encode('utf-8')
+
+
+class StubSession(object):
+    """
+        Stands in for an aiohttp.ClientSession, echoing contacts back and
+        answering 404 for contact 404.
+    """
+
+    def __init__(self, error=None):
+        self.requests = []
+        #raised instead of answering
+        self.error = error
+
+    def request(self, method, url, data=None, headers=None, params=None):
+        self.requests.append((method, url, params))
+        if self.error is not None:
+            raise self.error
+        if url.endswith('contacts/404'):
+            return StubAsyncResponse(404, {})
+        if method == 'POST':
+            contacts = [dict(c, contactId=str(i))
+                for i, c in enumerate(json.loads(data))]
+            return StubAsyncResponse(200, {'contacts': contacts})
+        return StubAsyncResponse(200, {'contact': {'contactId': '1'}})
+
+
+class AsyncIContactClientTests(TestCase):
+    """
+        Tests for the asyncio Icontact Client
+    """
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.session = StubSession()
+        self._client = AsyncIContactClient(session=self.session,
+            concurrency=2,
+            limiter=RateLimiter(key=uuid.uuid4().hex, shared=False),
+            retry=RetryPolicy(max_retries=0))
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_get_contact(self):
+        contact = self.run_async(self._client.get_contact('1'))
+        self.assertEqual('1', contact['contact']['contactId'])
+        method, url, params = self.session.requests[0]
+        self.assertEqual('GET', method)
+        self.assertEqual(self._client.prepare_url('contacts/1'), url)
+
+    def test_errors_are_mapped(self):
+        self.assertRaises(IContactException, self.run_async,
+            self._client.get_contact('404'))
+
+    def test_gather(self):
+        async def fan_out():
+            return await asyncio.gather(*[self._client.get_contact(i)
+                for i in range(10)])
+        self.assertEqual(10, len(self.run_async(fan_out())))
+
+    def test_create_contacts(self):
+        contacts = [IContactData(email='%s@rochapps.com' % i)
+            for i in range(5)]
+        result = self.run_async(self._client.create_contacts(contacts,
+            batch_size=2))
+        self.assertEqual(5, len(result.results))
+        self.assertEqual(3, len(self.session.requests))
+
+    def test_posts_are_not_retried_on_connection_errors(self):
+        self.session.error = asyncio.TimeoutError()
+        self._client.retry = RetryPolicy(max_retries=2, backoff=0)
+        self.assertRaises(IContactUnavailable, self.run_async,
+            self._client.create_contact({'contact': {'email':
+            'victor@rochapps.com'}}))
+        self.assertEqual(1, len(self.session.requests))
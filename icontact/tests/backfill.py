@@ -0,0 +1,97 @@
+from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import loading
+
+from icontact.adapter import FieldMapAdapter
+from icontact.backfill import Backfill
+from icontact.models import IContact, SyncCheckpoint
+from icontact.tests.models import MyContact
+from icontact.tests.observer import MyContactAdapter
+from icontact.tests.stubs import AccountObserver, StubClient
+from icontact.observer import IContactObserver
+
+
+class BackfillTests(TestCase):
+    """
+        Tests for backfilling an observed model
+    """
+
+    def setUp(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+        #rows created before the model is observed never reached iContact
+        self.contacts = [MyContact.objects.create(
+            email='victor%s@rochapps.com' % i) for i in range(5)]
+        self.stub = StubClient()
+        self.observer = IContactObserver(client=self.stub)
+        self.observer.observe(MyContact, MyContactAdapter())
+
+    def tearDown(self):
+        self.observer.unobserve(MyContact)
+        IContact.objects.all().delete()
+        SyncCheckpoint.objects.all().delete()
+
+    def test_run(self):
+        progress = []
+        backfill = Backfill(MyContact, batch_size=2, concurrency=1,
+            progress=progress.append)
+        stats = backfill.run()
+        self.assertEqual(5, stats.total)
+        self.assertEqual(5, stats.created)
+        self.assertEqual(3, len(progress))
+        self.assertEqual(5, IContact.objects.count())
+        self.assertEqual('victor0@rochapps.com',
+            IContact.objects.get_contact_id(self.contacts[0]))
+        self.assertEqual(self.contacts[-1].pk, backfill.checkpoint().last_pk)
+
+    def test_resume(self):
+        Backfill(MyContact, batch_size=2, concurrency=1).run()
+        stats = Backfill(MyContact, batch_size=2, concurrency=1).run()
+        self.assertEqual(0, stats.total)
+        stats = Backfill(MyContact, batch_size=2, concurrency=1).run(
+            restart=True)
+        self.assertEqual(5, stats.skipped)
+        self.assertEqual(0, stats.created)
+
+    def test_update(self):
+        IContact.objects.set_contact_id(self.contacts[0], '7')
+        stats = Backfill(MyContact, concurrency=1, update=True).run()
+        self.assertEqual(4, stats.created)
+        self.assertEqual(1, stats.updated)
+        self.assertIn(('update_contacts', '7'), self.stub.calls)
+        icontact = IContact.objects.get_contact(self.contacts[0])
+        self.assertEqual('7', icontact.contact_id)
+        self.assertEqual('victor0@rochapps.com',
+            icontact.get_payload()['email'])
+
+    def test_not_observed(self):
+        self.observer.unobserve(MyContact)
+        self.assertRaises(ValueError, Backfill, MyContact)
+
+    def test_field_map_adapter(self):
+        self.observer.observe(MyContact, FieldMapAdapter(
+            fields={'email': 'email', 'first_name': 'first_name'}))
+        stats = Backfill(MyContact, batch_size=2, concurrency=1).run()
+        self.assertEqual(5, stats.created)
+        self.assertEqual('victor4@rochapps.com',
+            IContact.objects.get_contact_id(self.contacts[4]))
+
+    def test_accounts(self):
+        self.observer.unobserve(MyContact)
+        observer = AccountObserver(
+            account=lambda contact: contact.pk % 2 and 'odd' or 'even')
+        observer.observe(MyContact, MyContactAdapter())
+        try:
+            stats = Backfill(MyContact, batch_size=2, concurrency=1).run()
+        finally:
+            observer.unobserve(MyContact)
+        self.assertEqual(5, stats.created)
+        for account, stub in observer.stubs.items():
+            emails = [call[1] for call in stub.calls
+                if call[0] == 'create_contacts']
+            self.assertEqual(set([account]), set(
+                MyContact.objects.get(email=email).pk % 2 and 'odd' or 'even'
+                for email in emails))
+        self.assertEqual(set(['odd', 'even']), set(observer.stubs))
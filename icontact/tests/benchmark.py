@@ -0,0 +1,65 @@
+from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import loading
+from django.test.utils import override_settings
+
+from icontact.benchmark import Benchmark, compare, percentile
+from icontact.models import IContact
+from icontact.observer import IContactObserver
+from icontact.tests.models import MyContact
+from icontact.tests.observer import MyContactAdapter
+
+
+class BenchmarkTests(TestCase):
+    """
+        Tests for the benchmarks
+    """
+
+    def setUp(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+
+    def tearDown(self):
+        IContact.objects.all().delete()
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(51, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(None, percentile([], 50))
+
+    def test_run(self):
+        results = Benchmark(contacts=30, batch_size=10).run()
+        self.assertEqual(3, results['methods']['get_contact']['calls'])
+        self.assertEqual(0, results['bulk']['failed'])
+        #3 batches of creates and 3 of subscriptions
+        self.assertAlmostEqual(0.2, results['bulk']['requests_per_contact'])
+        self.assertFalse('saves' in results)
+
+    @override_settings(ICONTACT_MAX_RETRIES=0)
+    def test_errors_are_counted(self):
+        methods = Benchmark(contacts=10, error_rate=1).methods()
+        self.assertEqual(1, methods['create_contact']['errors'])
+        self.assertEqual(1, methods['iter_contacts']['errors'])
+        self.assertEqual(0, methods['get_contact']['calls'])
+
+    def test_saves(self):
+        MyContact.objects.create(email='a@rochapps.com')
+        MyContact.objects.create(email='b@rochapps.com')
+        observer = IContactObserver()
+        observer.observe(MyContact, MyContactAdapter())
+        try:
+            saves = Benchmark(contacts=2, model=MyContact).saves()
+        finally:
+            observer.unobserve(MyContact)
+        #unmapped rows are created and subscribed, then left alone
+        self.assertEqual(2, saves['first']['requests_per_save'])
+        self.assertEqual(0, saves['unchanged']['requests_per_save'])
+
+    def test_compare(self):
+        rows = compare({'bulk': {'rate': 100, 'failed': 0}, 'old': 1},
+            {'bulk': {'rate': 150, 'failed': 0}, 'new': 1})
+        self.assertEqual([('bulk.failed', 0, 0, None),
+            ('bulk.rate', 100, 150, 0.5)], rows)
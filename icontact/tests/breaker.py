@@ -0,0 +1,160 @@
+import time
+
+from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import loading
+
+from icontact.breaker import CircuitBreaker, CircuitOpen
+from icontact.client import IContactException, IContactUnavailable
+from icontact.models import IContact, SyncJob
+from icontact.observer import IContactObserver
+from icontact.testing import FakeIContact
+from icontact.tests.models import MyContact
+from icontact.tests.observer import MyContactAdapter
+from icontact.worker import SyncWorker
+
+
+class CircuitBreakerTests(TestCase):
+    """
+        Tests for the circuit breaker
+    """
+
+    def test_opens_after_failures(self):
+        breaker = CircuitBreaker(2, reset_timeout=60)
+        breaker.acquire()
+        breaker.failure()
+        breaker.acquire()
+        breaker.success()
+        breaker.failure()
+        #the success reset the count
+        self.assertTrue(breaker.is_closed())
+        breaker.failure()
+        self.assertRaises(CircuitOpen, breaker.acquire)
+
+    def test_half_open(self):
+        breaker = CircuitBreaker(1, reset_timeout=0.05)
+        breaker.failure()
+        self.assertRaises(CircuitOpen, breaker.acquire)
+        time.sleep(0.06)
+        breaker.acquire()
+        #only the trial call goes through
+        self.assertRaises(CircuitOpen, breaker.acquire)
+        breaker.failure()
+        self.assertRaises(CircuitOpen, breaker.acquire)
+        time.sleep(0.06)
+        breaker.acquire()
+        breaker.success()
+        self.assertTrue(breaker.is_closed())
+        breaker.acquire()
+
+    def test_slow_calls(self):
+        breaker = CircuitBreaker(1, slow_call=0.5)
+        breaker.success(0.1)
+        self.assertTrue(breaker.is_closed())
+        breaker.success(1)
+        self.assertFalse(breaker.is_closed())
+
+    def test_client_fails_fast(self):
+        fake = FakeIContact(error_rate=1)
+        client = fake.client(breaker=CircuitBreaker(2, reset_timeout=60))
+        for i in range(2):
+            self.assertRaises(IContactUnavailable, client.get_contacts)
+        requests = len(fake.log)
+        try:
+            client.get_contacts()
+        except IContactUnavailable as e:
+            self.assertTrue(e.retry_after > 0)
+        else:
+            self.fail('circuit not open')
+        self.assertEqual(requests, len(fake.log))
+
+    def test_client_errors_keep_circuit_closed(self):
+        client = FakeIContact().client(breaker=CircuitBreaker(1))
+        self.assertRaises(IContactException, client.get_contact, '999')
+        self.assertTrue(client.breaker.is_closed())
+
+
+class OutboxTests(TestCase):
+    """
+        Tests for changes diverted to the outbox while iContact is down
+    """
+
+    def setUp(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+        self.fake = FakeIContact(error_rate=1)
+        self.breaker = CircuitBreaker(2, reset_timeout=60)
+        self.observer = IContactObserver(
+            client=self.fake.client(breaker=self.breaker))
+        self.observer.observe(MyContact, MyContactAdapter())
+
+    def tearDown(self):
+        self.observer.unobserve(MyContact)
+        IContact.objects.all().delete()
+        SyncJob.objects.all().delete()
+
+    def test_replayed_in_order(self):
+        contact = MyContact.objects.create(email='victor@rochapps.com')
+        contact.first_name = 'victor'
+        contact.save()
+        self.assertEqual([SyncJob.CREATE, SyncJob.UPDATE],
+            list(SyncJob.objects.values_list('action', flat=True)))
+        #the update went to the outbox without calling iContact
+        self.assertEqual(1, len(self.fake.log))
+        self.assertEqual(1, self.observer.stats['diverted'])
+        self.fake.error_rate = 0
+        self.breaker.reset()
+        self.assertEqual(2, SyncWorker().run_once())
+        self.assertFalse(SyncJob.objects.exists())
+        contact_id = IContact.objects.get_contact_id(contact)
+        self.assertEqual('victor', self.fake.contacts[contact_id]['firstName'])
+        #the outbox is drained, saves are synced right away again
+        contact.first_name = 'other'
+        contact.save()
+        self.assertFalse(SyncJob.objects.exists())
+        self.assertEqual('other', self.fake.contacts[contact_id]['firstName'])
+
+    def test_jobs_queued_by_another_process(self):
+        self.fake.error_rate = 0
+        contact = MyContact.objects.create(email='victor@rochapps.com')
+        #diverted by another process, this observer diverted nothing
+        SyncJob.objects.enqueue(SyncJob.UPDATE, contact)
+        contact.first_name = 'victor'
+        contact.save()
+        self.assertEqual(2, SyncJob.objects.count())
+        self.assertEqual(0, self.observer.stats['diverted'])
+
+    def test_replayed_create_updates(self):
+        self.fake.error_rate = 0
+        contact = MyContact.objects.create(email='victor@rochapps.com')
+        contact_id = IContact.objects.get_contact_id(contact)
+        contact.first_name = 'victor'
+        self.assertEqual(contact_id,
+            self.observer.push_create(MyContact, contact))
+        self.assertEqual(1, len(self.fake.contacts))
+        self.assertEqual('victor', self.fake.contacts[contact_id]['firstName'])
+
+    def test_delete_is_diverted(self):
+        self.fake.error_rate = 0
+        contact = MyContact.objects.create(email='victor@rochapps.com')
+        contact_id = IContact.objects.get_contact_id(contact)
+        self.fake.error_rate = 1
+        contact.delete()
+        job = SyncJob.objects.get()
+        self.assertEqual(contact_id, job.contact_id)
+        #kept until the worker deleted the contact
+        self.assertTrue(IContact.objects.exists())
+
+    def test_worker_waits_for_icontact(self):
+        MyContact.objects.create(email='victor@rochapps.com')
+        worker = SyncWorker()
+        self.assertEqual(1, worker.run_once())
+        job = SyncJob.objects.get()
+        self.assertEqual(SyncJob.PENDING, job.status)
+        self.assertEqual(0, job.attempts)
+        #the breaker is open now
+        self.assertFalse(self.breaker.is_closed())
+        self.assertTrue(worker.paused() > 0)
+        self.assertEqual(0, worker.run_once())
@@ -0,0 +1,73 @@
+from django.test import TestCase
+
+from icontact.adapter import IContactData
+from icontact.client import IContactException
+from icontact.testing import FakeIContact
+
+
+class ContactCacheTests(TestCase):
+    """
+        Tests for the read-through contact cache
+    """
+
+    def setUp(self):
+        self.fake = FakeIContact()
+        self.icontact = self.fake.client()
+        created = self.icontact.create_contact(IContactData(
+            email='victor@rochapps.com', first_name='victor').get_data())
+        self.contact_id = created['contacts'][0]['contactId']
+
+    def requests(self):
+        return len([r for r in self.fake.log if r == ('GET', 'contacts')])
+
+    def test_read_through(self):
+        contact = self.icontact.get_contact(self.contact_id)
+        self.assertEqual('victor', contact['contact']['firstName'])
+        #callers get copies
+        contact['contact']['firstName'] = 'changed'
+        contact = self.icontact.get_contact(self.contact_id)
+        self.assertEqual('victor', contact['contact']['firstName'])
+        self.assertEqual(1, self.requests())
+        stats = self.icontact.contact_cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(0.5, stats['hit_rate'])
+
+    def test_invalidation(self):
+        self.icontact.get_contact(self.contact_id)
+        self.icontact.update_contact(self.contact_id,
+            {'contact': {'city': 'Durham'}})
+        contact = self.icontact.get_contact(self.contact_id)
+        self.assertEqual('Durham', contact['contact']['city'])
+        self.icontact.update_contacts([(self.contact_id,
+            IContactData(email='victor@rochapps.com', city='Raleigh'))])
+        contact = self.icontact.get_contact(self.contact_id)
+        self.assertEqual('Raleigh', contact['contact']['city'])
+        self.icontact.delete_contact(self.contact_id)
+        contact = self.icontact.get_contact(self.contact_id)
+        self.assertEqual('deleted', contact['contact']['status'])
+        self.assertEqual(4, self.requests())
+        #errors are not cached
+        self.assertRaises(IContactException, self.icontact.get_contact, '999')
+        self.assertRaises(IContactException, self.icontact.get_contact, '999')
+
+    def test_etag(self):
+        self.icontact.contact_cache.ttl = 0
+        self.icontact.get_contact(self.contact_id)
+        contact = self.icontact.get_contact(self.contact_id)
+        self.assertEqual('victor', contact['contact']['firstName'])
+        self.assertEqual(1, self.icontact.contact_cache.revalidated)
+        #changed on iContact's side, the ETag no longer matches
+        self.fake.contacts[self.contact_id]['firstName'] = 'vic'
+        contact = self.icontact.get_contact(self.contact_id)
+        self.assertEqual('vic', contact['contact']['firstName'])
+        self.assertEqual(1, self.icontact.contact_cache.revalidated)
+        self.assertEqual(3, self.requests())
+
+    def test_disabled(self):
+        with self.settings(ICONTACT_CONTACT_CACHE_SIZE=0):
+            client = self.fake.client()
+        self.assertEqual(None, client.contact_cache)
+        client.get_contact(self.contact_id)
+        client.get_contact(self.contact_id)
+        self.assertEqual(2, self.requests())
@@ -10,8 +10,9 @@ from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.test.client import RequestFactory
 
+from icontact.adapter import IContactData
 from icontact.client import IContactClient
-from icontact.client import IContactException
+from icontact.client import IContactException, IContactUnavailable
 
 class IContactClientTests(TestCase):
     """
@@ -129,5 +130,152 @@ class IContactClientTests(TestCase):
         subs = client.subscribe(contact_id=contact_id)
         num_subscribtions = len(subs)
         self.assertIn('subscriptions', subs)
-        #subscribing again raises an exception
+        #subscribing again is skipped while the subscription is cached
+        self.assertEqual([], client.subscribe(contact_id)['subscriptions'])
+        #and raises an exception once iContact is asked
+        client.subscription_cache.clear()
         self.assertRaises(IContactException, client.subscribe, contact_id)
+
+
+class StubResponse(object):
+
+    def __init__(self, status_code=200, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data or {}
+        self.headers = headers or {}
+
+    def json(self):
+        return self.data
+
+
+class StubPool(object):
+    """
+        Stands in for a ConnectionPool, answering batch requests the way
+        iContact does: contacts with an email at rejected.com are left out
+        of the response and reported as warnings.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, url, data=None, headers=None, params=None):
+        payload = json.loads(data)
+        self.requests.append((method, url, payload))
+        if url.endswith('subscriptions/'):
+            return StubResponse(data={'subscriptions': payload})
+        contacts = []
+        warnings = []
+        for i, contact in enumerate(payload):
+            if contact['email'].endswith('@rejected.com'):
+                warnings.append('rejected email')
+                continue
+            contact = dict(contact)
+            contact.setdefault('contactId', str(1000 + i))
+            contacts.append(contact)
+        data = {'contacts': contacts}
+        if warnings:
+            data['warnings'] = warnings
+        return StubResponse(data=data)
+
+
+class IContactBatchTests(TestCase):
+    """
+        Tests for the batch methods of the Icontact Client
+    """
+
+    def setUp(self):
+        self.pool = StubPool()
+        self._client = IContactClient(pool=self.pool)
+
+    def test_only_unavailable_statuses_raise_unavailable(self):
+        for status_code in (500, 501, 507):
+            try:
+                self._client.process_response(StubResponse(status_code))
+            except IContactUnavailable:
+                self.fail('%s raised IContactUnavailable' % status_code)
+            except IContactException:
+                pass
+        for status_code in (502, 503, 504):
+            self.assertRaises(IContactUnavailable,
+                self._client.process_response, StubResponse(status_code))
+
+    def test_create_contacts(self):
+        contacts = [IContactData(email='%s@rochapps.com' % i)
+            for i in range(5)]
+        contacts.append(IContactData(email='bounce@rejected.com'))
+        r = self._client.create_contacts(iter(contacts), batch_size=2)
+        self.assertEqual(3, len(self.pool.requests))
+        self.assertEqual(5, len(r.results))
+        self.assertEqual(1, len(r.errors))
+        self.assertEqual(contacts[0], r.results[0][0])
+        self.assertEqual('1000', r.results[0][1])
+        self.assertEqual(contacts[5], r.errors[0][0])
+        self.assertEqual('rejected email', r.errors[0][1])
+
+    def test_update_contacts(self):
+        contacts = [('7', IContactData(email='a@rochapps.com')),
+            ('8', IContactData(email='b@rochapps.com'))]
+        r = self._client.update_contacts(contacts)
+        self.assertEqual(1, len(self.pool.requests))
+        self.assertEqual('7', self.pool.requests[0][2][0]['contactId'])
+        self.assertEqual(['7', '8'], [c for item, c in r.results])
+        self.assertFalse(r.errors)
+
+    def test_subscribe_many(self):
+        r = self._client.subscribe_many(['1', '2', '3'], list_id=5,
+            batch_size=2)
+        self.assertEqual(2, len(self.pool.requests))
+        self.assertEqual(3, len(r.results))
+        self.assertEqual(5, self.pool.requests[0][2][0]['listId'])
+
+
+class PagingPool(object):
+    """
+        Serves total contacts through contacts/ honoring offset and limit.
+    """
+
+    def __init__(self, total):
+        self.total = total
+        self.requests = []
+
+    def request(self, method, url, data=None, headers=None, params=None):
+        self.requests.append(params)
+        offset = params['offset']
+        end = min(offset + params['limit'], self.total)
+        contacts = [{'contactId': str(i)} for i in range(offset, end)]
+        return StubResponse(data={'contacts': contacts, 'total': self.total})
+
+
+class IContactPagingTests(TestCase):
+    """
+        Tests for iterating over every contact
+    """
+
+    def test_iter_contacts(self):
+        pool = PagingPool(total=7)
+        client = IContactClient(pool=pool)
+        contacts = list(client.iter_contacts(page_size=3))
+        self.assertEqual([str(i) for i in range(7)],
+            [c['contactId'] for c in contacts])
+        self.assertEqual([0, 3, 6], [p['offset'] for p in pool.requests])
+
+    def test_iter_contacts_exact_pages(self):
+        pool = PagingPool(total=6)
+        client = IContactClient(pool=pool)
+        self.assertEqual(6, len(list(client.iter_contacts(page_size=3))))
+        self.assertEqual(2, len(pool.requests))
+
+    def test_iter_contacts_prefetch(self):
+        pool = PagingPool(total=10)
+        client = IContactClient(pool=pool)
+        contacts = list(client.iter_contacts(page_size=4, prefetch=True))
+        self.assertEqual(10, len(contacts))
+        self.assertEqual(3, len(pool.requests))
+
+    def test_iter_contacts_fields_and_filters(self):
+        pool = PagingPool(total=1)
+        client = IContactClient(pool=pool)
+        list(client.iter_contacts(fields=['email', 'contactId'],
+            status='normal'))
+        self.assertEqual('email,contactId', pool.requests[0]['fields'])
+        self.assertEqual('normal', pool.requests[0]['status'])
@@ -0,0 +1,88 @@
+from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import loading
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+
+from icontact.coalesce import coalescing, is_active, merge
+from icontact.middleware import CoalesceMiddleware
+from icontact.models import IContact
+from icontact.observer import IContactObserver
+from icontact.tests.models import MyContact
+from icontact.tests.observer import MyContactAdapter
+from icontact.tests.stubs import StubClient
+
+
+class CoalesceTests(TestCase):
+    """
+        Tests for coalescing changes to observed objects
+    """
+
+    def setUp(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+        self.stub = StubClient()
+        self.observer = IContactObserver(client=self.stub)
+        self.observer.observe(MyContact, MyContactAdapter())
+
+    def tearDown(self):
+        self.observer.unobserve(MyContact)
+        IContact.objects.all().delete()
+
+    def calls(self):
+        return [call[0] for call in self.stub.calls]
+
+    def test_merge(self):
+        self.assertEqual('create', merge(None, 'create'))
+        self.assertEqual('create', merge('create', 'update'))
+        self.assertEqual(None, merge('create', 'delete'))
+        self.assertEqual('delete', merge('update', 'delete'))
+        self.assertEqual('update', merge('delete', 'create'))
+
+    def test_saves_are_coalesced(self):
+        with coalescing():
+            contact = MyContact.objects.create(email="victor@rochapps.com")
+            contact.first_name = 'victor'
+            contact.save()
+            contact.save()
+            self.assertEqual([], self.stub.calls)
+        self.assertEqual(['create_contact', 'subscribe'], self.calls())
+        self.assertEqual(2, self.observer.stats['coalesced'])
+        self.assertEqual('42', IContact.objects.get_contact_id(contact))
+
+    def test_create_and_delete_cancel_out(self):
+        with coalescing():
+            contact = MyContact.objects.create(email="victor@rochapps.com")
+            contact.delete()
+        self.assertEqual([], self.stub.calls)
+
+    def test_delete(self):
+        contact = MyContact.objects.create(email="victor@rochapps.com")
+        self.stub.calls = []
+        with coalescing():
+            contact.first_name = 'victor'
+            contact.save()
+            contact.delete()
+        self.assertEqual([('delete_contact', '42')], self.stub.calls)
+
+    def test_changes_are_dropped_on_exception(self):
+        def save():
+            with coalescing():
+                MyContact.objects.create(email="victor@rochapps.com")
+                raise ValueError
+        self.assertRaises(ValueError, save)
+        self.assertFalse(is_active())
+        self.assertEqual([], self.stub.calls)
+
+    def test_middleware(self):
+        middleware = CoalesceMiddleware()
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        contact = MyContact.objects.create(email="victor@rochapps.com")
+        contact.save()
+        self.assertEqual([], self.stub.calls)
+        middleware.process_response(request, HttpResponse())
+        self.assertEqual(['create_contact', 'subscribe'], self.calls())
+        self.assertFalse(is_active())
@@ -0,0 +1,47 @@
+from django.test import TestCase
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test.utils import override_settings
+
+from icontact.benchmark import import_time
+from icontact.conf import Settings, conf
+
+
+class SettingsTests(TestCase):
+    """
+        Tests for the cached settings and the cost of importing the
+        application
+    """
+
+    def test_get(self):
+        self.assertEqual(settings.ICONTACT_ACCOUNT_ID,
+            conf.get('ACCOUNT_ID'))
+        self.assertEqual(42, conf.get('NOT_A_SETTING', 42))
+        #an unset setting is cached without its default
+        self.assertEqual(None, conf.get('NOT_A_SETTING'))
+
+    def test_cached(self):
+        values = Settings()
+        with override_settings(ICONTACT_PAGE_SIZE=10):
+            self.assertEqual(10, values.get('PAGE_SIZE', 500))
+            settings.ICONTACT_PAGE_SIZE = 20
+            self.assertEqual(10, values.get('PAGE_SIZE', 500))
+            values.reload()
+            self.assertEqual(20, values.get('PAGE_SIZE', 500))
+
+    def test_override_settings(self):
+        self.assertEqual(None, conf.get('WEBHOOK_SECRET'))
+        with override_settings(ICONTACT_WEBHOOK_SECRET='s3cret'):
+            self.assertEqual('s3cret', conf.get('WEBHOOK_SECRET'))
+        self.assertEqual(None, conf.get('WEBHOOK_SECRET'))
+
+    def test_require(self):
+        self.assertEqual(settings.ICONTACT_API_KEY, conf.require('API_KEY'))
+        self.assertRaises(ImproperlyConfigured, conf.require,
+            'NOT_A_SETTING')
+
+    def test_import(self):
+        #imported without settings, the ORM and requests
+        result = import_time('icontact.observer', repeat=1)
+        self.assertEqual([], result['loaded'])
+        self.assertTrue(result['ms'] > 0)
@@ -0,0 +1,102 @@
+import random
+import threading
+import time
+
+from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import loading
+
+from icontact.executor import SyncExecutor
+from icontact.models import IContact
+from icontact.observer import IContactObserver
+from icontact.testing import FakeIContact
+from icontact.tests.models import MyContact
+from icontact.tests.observer import MyContactAdapter
+
+
+class Change(object):
+
+    def __init__(self, pk, step):
+        self.pk = pk
+        self.step = step
+
+
+class SyncExecutorTests(TestCase):
+    """
+        Tests for running syncs concurrently
+    """
+
+    def setUp(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most = 0
+
+    def sync(self, change):
+        with self.lock:
+            self.running += 1
+            self.most = max(self.most, self.running)
+        time.sleep(random.uniform(0, 0.002))
+        with self.lock:
+            self.running -= 1
+            self.calls.append((change.pk, change.step))
+        if change.pk == 'bad':
+            raise ValueError('rejected')
+        return 'contact-%s' % change.pk
+
+    def test_objects_keep_their_order(self):
+        changes = [Change(i % 5, i // 5) for i in range(50)]
+        result = SyncExecutor(self.sync, threads=4).run(changes)
+        self.assertEqual(50, len(result.results))
+        for pk in range(5):
+            steps = [step for key, step in self.calls if key == pk]
+            self.assertEqual(list(range(10)), steps)
+        self.assertTrue(self.most > 1)
+        self.assertTrue(self.most <= 4)
+
+    def test_window(self):
+        read = []
+
+        def changes():
+            for i in range(40):
+                #instances read ahead of the finished ones
+                read.append(len(read) - len(self.calls))
+                yield Change(i, 0)
+        SyncExecutor(self.sync, threads=2, window=3).run(changes())
+        self.assertTrue(max(read) <= 3)
+
+    def test_errors(self):
+        changes = [Change(1, 0), Change('bad', 0), Change(2, 0)]
+        result = SyncExecutor(self.sync, threads=2).run(changes)
+        self.assertEqual(set(['contact-1', 'contact-2']),
+            set(contact_id for change, contact_id in result.results))
+        self.assertEqual([(changes[1], 'rejected')], result.errors)
+
+    def test_calling_thread(self):
+        changes = [Change(i, 0) for i in range(3)]
+        result = SyncExecutor(self.sync, threads=1).run(changes)
+        self.assertEqual([0, 1, 2], [pk for pk, step in self.calls])
+        self.assertEqual(1, self.most)
+        self.assertEqual(3, len(result.results))
+
+    def test_sync_many(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+        contacts = [MyContact.objects.create(email='%s@rochapps.com' % i)
+            for i in range(3)]
+        fake = FakeIContact()
+        observer = IContactObserver(client=fake.client())
+        observer.observe(MyContact, MyContactAdapter())
+        try:
+            #the test database is only visible to the calling thread
+            result = observer.sync_many(contacts, threads=1)
+        finally:
+            observer.unobserve(MyContact)
+            IContact.objects.all().delete()
+        self.assertEqual(3, len(result.results))
+        self.assertEqual(3, len(fake.contacts))
+        self.assertEqual(3, len(fake.subscriptions))
+        self.assertEqual(sorted(fake.contacts),
+            sorted(contact_id for contact, contact_id in result.results))
@@ -0,0 +1,176 @@
+import json
+
+from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import loading
+from django.test.utils import override_settings
+
+from icontact.adapter import ReverseAdapter
+from icontact import ingest
+from icontact.ingest import EventProcessor, contact_events
+from icontact.models import IContact, IContactEvent
+from icontact.tests.models import MyContact
+from icontact.tests.observer import MyContactAdapter
+from icontact.observer import IContactObserver
+from icontact.tests.stubs import StubClient
+
+
+class MyContactReverseAdapter(ReverseAdapter):
+    fields = {'firstName': 'first_name'}
+
+    def on_bounce(self, instance, event):
+        instance.email = ''
+        return True
+
+    def on_fail(self, instance, event):
+        raise ValueError('cannot apply')
+
+
+class IngestTests(TestCase):
+    """
+        Tests for applying events received from iContact
+    """
+    urls = 'icontact.urls'
+
+    def setUp(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+        self.contacts = [MyContact.objects.create(
+            email='%s@rochapps.com' % i, first_name='first') for i in range(3)]
+        for i, contact in enumerate(self.contacts):
+            IContact.objects.set_contact_id(contact, str(i + 1))
+        self.stub = StubClient()
+        self.observer = IContactObserver(client=self.stub)
+        self.observer.observe(MyContact, MyContactAdapter())
+        self.processor = EventProcessor(
+            adapters={MyContact: MyContactReverseAdapter()})
+
+    def tearDown(self):
+        self.observer.unobserve(MyContact)
+        IContact.objects.all().delete()
+        IContactEvent.objects.all().delete()
+
+    def event(self, key, contact_id, type='update', **data):
+        return {'id': key, 'type': type, 'contactId': contact_id,
+            'data': data}
+
+    def test_apply(self):
+        result = self.processor.process([
+            self.event('a', '1', firstName='victor'),
+            self.event('b', '2', type='bounce'),
+            self.event('c', '3', firstName='first'),
+            self.event('d', '99', firstName='nobody')])
+        self.assertEqual(2, result.applied)
+        self.assertEqual(1, result.unchanged)
+        self.assertEqual(1, result.unknown)
+        self.assertEqual('victor',
+            MyContact.objects.get(pk=self.contacts[0].pk).first_name)
+        self.assertEqual('',
+            MyContact.objects.get(pk=self.contacts[1].pk).email)
+        #the changes came from iContact, they are not sent back
+        self.assertFalse(self.stub.calls)
+        #but the cached contacts are stale
+        self.assertEqual(['1', '2', '3'], sorted(self.stub.forgotten))
+        icontact = IContact.objects.get_contact(self.contacts[0])
+        self.assertEqual('victor', icontact.get_payload()['firstName'])
+
+    def test_redelivery_is_a_no_op(self):
+        events = [self.event('a', '1', firstName='victor'),
+            self.event('b', '99')]
+        self.processor.process(events)
+        MyContact.objects.filter(pk=self.contacts[0].pk).update(
+            first_name='changed')
+        with self.assertNumQueries(1):
+            result = self.processor.process(events)
+        self.assertEqual(2, result.duplicates)
+        self.assertEqual('changed',
+            MyContact.objects.get(pk=self.contacts[0].pk).first_name)
+
+    def test_batched_queries(self):
+        events = [self.event(str(i), str(i % 3 + 1), firstName='n%s' % i)
+            for i in range(30)]
+        #events, mappings, objects, a save (select and update) and a
+        #snapshot per contact, keys
+        with self.assertNumQueries(3 + 3 * 3 + 1):
+            result = self.processor.process(events)
+        self.assertEqual(30, result.applied)
+        #the last event of each contact wins
+        self.assertEqual('n27',
+            MyContact.objects.get(pk=self.contacts[0].pk).first_name)
+
+    def test_failed_event_is_retried(self):
+        events = [self.event('a', '1', type='fail'),
+            self.event('b', '2', firstName='victor')]
+        result = self.processor.process(events)
+        self.assertEqual(1, len(result.errors))
+        self.assertEqual(1, result.applied)
+        self.assertEqual(['b'], list(IContactEvent.objects.values_list(
+            'key', flat=True)))
+
+    def test_contact_events(self):
+        remote = [{'contactId': '1', 'firstName': 'polled'}]
+        result = self.processor.process(contact_events(remote))
+        self.assertEqual(1, result.applied)
+        result = self.processor.process(contact_events(remote))
+        self.assertEqual(1, result.duplicates)
+        #the same data for another contact is another event
+        result = self.processor.process(contact_events([{'contactId': '2',
+            'firstName': 'polled'}]))
+        self.assertEqual(1, result.applied)
+
+    def test_contact_events_versions(self):
+        remote = [{'contactId': '1', 'firstName': 'polled',
+            'modifiedDate': '2013-01-01 10:00:00'}]
+        self.assertEqual(1, self.processor.process(
+            contact_events(remote)).applied)
+        MyContact.objects.filter(pk=self.contacts[0].pk).update(
+            first_name='changed')
+        #changed back to data polled before, but in a later version
+        remote[0]['modifiedDate'] = '2013-01-02 10:00:00'
+        self.assertEqual(1, self.processor.process(
+            contact_events(remote)).applied)
+        self.assertEqual('polled',
+            MyContact.objects.get(pk=self.contacts[0].pk).first_name)
+
+    @override_settings(ICONTACT_WEBHOOK_SECRET='s3cret')
+    def test_events_need_an_id(self):
+        event = self.event(None, '1', firstName='victor')
+        result = self.processor.process([event])
+        self.assertEqual([(event, 'missing id')], result.errors)
+        self.assertEqual('first',
+            MyContact.objects.get(pk=self.contacts[0].pk).first_name)
+        self.assertEqual(400, self.client_post([event]).status_code)
+
+    @override_settings(ICONTACT_WEBHOOK_SECRET='s3cret')
+    def test_webhook(self):
+        ingest.register(MyContact, MyContactReverseAdapter())
+        try:
+            response = self.client_post({'events': [
+                self.event('a', '1', firstName='victor')]})
+        finally:
+            ingest.unregister(MyContact)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, json.loads(response.content)['applied'])
+        self.assertEqual(400, self.client_post('not json').status_code)
+        self.assertEqual(405, self.client.get('/webhook/').status_code)
+
+    def test_webhook_secret(self):
+        #refused until a secret is configured
+        self.assertEqual(403, self.client_post([]).status_code)
+        with self.settings(ICONTACT_WEBHOOK_SECRET='s3cret'):
+            self.assertEqual(200, self.client_post([]).status_code)
+            self.assertEqual(403, self.client_post([],
+                HTTP_X_ICONTACT_SECRET='wrong').status_code)
+            #only the header is accepted, query strings end up in logs
+            response = self.client.post('/webhook/?secret=s3cret', '[]',
+                content_type='application/json')
+            self.assertEqual(403, response.status_code)
+
+    def client_post(self, data, **extra):
+        if not isinstance(data, str):
+            data = json.dumps(data)
+        extra.setdefault('HTTP_X_ICONTACT_SECRET', 's3cret')
+        return self.client.post('/webhook/', data,
+            content_type='application/json', **extra)
@@ -0,0 +1,106 @@
+from django.test import TestCase
+
+from icontact.adapter import IContactData
+from icontact.testing import FakeIContact
+
+
+class ListTests(TestCase):
+    """
+        Tests for lists and the subscription cache
+    """
+
+    def setUp(self):
+        self.fake = FakeIContact()
+        self.icontact = self.fake.client()
+        result = self.icontact.create_contacts([IContactData(
+            email='%s@rochapps.com' % i) for i in range(5)])
+        self.contact_ids = [contact_id for contact, contact_id
+            in result.results]
+
+    def requests(self, resource):
+        return len([r for r in self.fake.log if r[1] == resource])
+
+    def test_find_list(self):
+        list_id = self.fake.add_list('newsletter')
+        self.assertEqual(list_id,
+            self.icontact.find_list('newsletter')['listId'])
+        self.assertEqual(None, self.icontact.find_list('missing'))
+        #both lookups were answered by one fetch of the lists
+        self.assertEqual(1, self.requests('lists'))
+        self.icontact.list_cache.ttl = 0
+        self.icontact.find_list('newsletter')
+        self.assertEqual(2, self.requests('lists'))
+
+    def test_get_or_create_list(self):
+        created = self.icontact.get_or_create_list('customers',
+            description='Paying customers')
+        self.assertEqual('Paying customers',
+            self.fake.lists[created['listId']]['description'])
+        self.assertEqual(created,
+            self.icontact.get_or_create_list('customers'))
+        self.assertEqual(1, len(self.fake.lists))
+        self.assertEqual('customers',
+            self.icontact.get_list(created['listId'])['name'])
+
+    def test_subscribe_is_cached(self):
+        contact_id = self.contact_ids[0]
+        self.icontact.subscribe(contact_id, list_id=1)
+        self.assertEqual({'subscriptions': []},
+            self.icontact.subscribe(contact_id, list_id=1))
+        self.assertEqual(1, self.requests('subscriptions'))
+        #another list is not
+        self.icontact.subscribe(contact_id, list_id=2)
+        self.assertEqual(2, self.requests('subscriptions'))
+
+    def test_forget_subscriptions(self):
+        contact_id = self.contact_ids[0]
+        self.icontact.subscribe(contact_id, list_id=1)
+        self.icontact.subscribe(contact_id, list_id=2)
+        self.icontact.subscribe(self.contact_ids[1], list_id=1)
+        self.icontact.forget_subscriptions([contact_id])
+        self.assertFalse(self.icontact.is_subscribed(contact_id, 1))
+        self.assertFalse(self.icontact.is_subscribed(contact_id, 2))
+        self.assertTrue(self.icontact.is_subscribed(self.contact_ids[1], 1))
+
+    def test_subscribe_many_skips_cached(self):
+        self.icontact.subscribe_many(self.contact_ids[:3], list_id=1)
+        result = self.icontact.subscribe_many(self.contact_ids, list_id=1)
+        self.assertEqual(5, len(result.results))
+        self.assertFalse(result.errors)
+        self.assertEqual(2, self.requests('subscriptions'))
+        #only the last two were sent the second time
+        self.assertEqual(5, len(self.fake.subscriptions))
+
+    def test_cache_disabled(self):
+        with self.settings(ICONTACT_SUBSCRIPTION_CACHE_SIZE=0):
+            client = self.fake.client()
+        self.assertEqual(None, client.subscription_cache)
+        client.subscribe_many(self.contact_ids, list_id=1)
+        result = client.subscribe_many(self.contact_ids, list_id=1)
+        self.assertEqual(5, len(result.errors))
+
+    def test_move_many(self):
+        self.icontact.subscribe_many(self.contact_ids, list_id=1)
+        result = self.icontact.move_many(self.contact_ids, 1, 2, batch_size=2)
+        self.assertEqual(self.contact_ids,
+            [contact_id for contact_id, _ in result.results])
+        for contact_id in self.contact_ids:
+            self.assertEqual('unsubscribed',
+                self.fake.subscriptions[('1', contact_id)]['status'])
+            self.assertEqual('normal',
+                self.fake.subscriptions[('2', contact_id)]['status'])
+        #1 + 3 chunks subscribed to 2, 3 chunks unsubscribed from 1
+        self.assertEqual(7, self.requests('subscriptions'))
+        #moving back subscribes to 1 again, the cache knows it unsubscribed
+        result = self.icontact.move_many(self.contact_ids, 2, 1)
+        self.assertEqual(5, len(result.results))
+        self.assertEqual('normal',
+            self.fake.subscriptions[('1', self.contact_ids[0])]['status'])
+
+    def test_move_many_keeps_failed(self):
+        missing = '999'
+        result = self.icontact.move_many([self.contact_ids[0], missing], 1, 2)
+        self.assertEqual([self.contact_ids[0]],
+            [contact_id for contact_id, _ in result.results])
+        self.assertEqual(missing, result.errors[0][0])
+        self.assertNotIn(('1', missing), self.fake.subscriptions)
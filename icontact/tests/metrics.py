@@ -0,0 +1,88 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from icontact import metrics
+from icontact.client import IContactClient, IContactException
+from icontact.metrics import MemoryBackend
+from icontact.ratelimit import RateLimiter, RetryPolicy
+from icontact.signals import api_call
+from icontact.testing import FakeIContact
+from icontact.tests.client import StubResponse
+from icontact.tests.ratelimit import SequencePool
+
+
+class MetricsTests(TestCase):
+    """
+        Tests for the instrumentation of api calls
+    """
+
+    def setUp(self):
+        self.fake = FakeIContact()
+        self.icontact = self.fake.client(
+            retry=RetryPolicy(max_retries=2, backoff=0))
+        self.calls = []
+
+    def tearDown(self):
+        api_call.disconnect(self.receiver)
+        metrics.reset_backend()
+
+    def receiver(self, sender, **kwargs):
+        self.calls.append(kwargs)
+
+    def test_disabled(self):
+        #SequencePool has no stats, which are only read when instrumenting
+        client = IContactClient(pool=SequencePool(StubResponse(data={})),
+            limiter=RateLimiter(((1000, 1),), shared=False))
+        metrics.set_backend(None)
+        self.assertFalse(metrics.enabled())
+        client.get_contacts()
+
+    def test_signal(self):
+        api_call.connect(self.receiver)
+        self.icontact.create_contact({'contact': {'email': 'a@rochapps.com'}})
+        self.assertRaises(IContactException, self.icontact.get_contact, '999')
+        created, missing = self.calls
+        self.assertEqual('POST', created['method'])
+        self.assertEqual('contacts', created['resource'])
+        self.assertEqual(200, created['status_code'])
+        self.assertEqual(0, created['retries'])
+        self.assertTrue(created['bytes_sent'] > 0)
+        self.assertTrue(created['bytes_received'] > 0)
+        self.assertTrue(created['duration'] >= 0)
+        self.assertEqual(None, created['error'])
+        self.assertEqual(404, missing['status_code'])
+
+    def test_retries(self):
+        api_call.connect(self.receiver)
+        pool = SequencePool(StubResponse(503), StubResponse(503),
+            StubResponse(503))
+        pool.stats = lambda: {'opened': 1}
+        self.icontact._pool = pool
+        self.assertRaises(IContactException, self.icontact.get_contacts)
+        self.assertEqual(2, self.calls[0]['retries'])
+        self.assertEqual(503, self.calls[0]['status_code'])
+        self.assertTrue(self.calls[0]['reused'])
+
+    def test_backend(self):
+        backend = MemoryBackend()
+        metrics.set_backend(backend)
+        self.icontact.create_contact({'contact': {'email': 'a@rochapps.com'}})
+        self.icontact.get_contacts()
+        self.assertEqual(2, backend.count('requests', status=200))
+        self.assertEqual(1, backend.count('requests', method='GET'))
+        self.assertEqual(1, len(backend.timings[('request_time',
+            (('method', 'GET'), ('resource', 'contacts')))]))
+        self.assertEqual(2, backend.count('connections_reused'))
+
+    @override_settings(
+        ICONTACT_METRICS_BACKEND='icontact.metrics.MemoryBackend')
+    def test_backend_setting(self):
+        metrics.reset_backend()
+        self.assertIsInstance(metrics.get_backend(), MemoryBackend)
+        self.assertIs(metrics.get_backend(), metrics.get_backend())
+
+    def test_resource(self):
+        self.assertEqual('subscriptions', metrics.resource(
+            'https://app.icontact.com/icp/a/1/c/2/subscriptions/'))
+        self.assertEqual('contacts', metrics.resource(
+            'https://app.icontact.com/icp/a/1/c/2/contacts/42'))
@@ -9,11 +9,16 @@ from django.core.management import call_command
 from django.db.models import loading
 from django.contrib.contenttypes.models import ContentType
 
-from icontact.models import IContact
+from icontact.models import IContact, reset_contact_id_cache
 
 class MyContact(models.Model):
     email = models.EmailField()
     first_name = models.CharField(max_length=20)
+
+
+class MyProfile(models.Model):
+    contact = models.ForeignKey(MyContact, null=True)
+    city = models.CharField(max_length=20)
     
 
 class IContactManagerTests(TestCase):
@@ -67,6 +72,53 @@ class IContactManagerTests(TestCase):
         self.assertEqual(icontacts.count(), 1)
 
 
+    def test_get_contact_ids(self):
+        other = MyContact.objects.create(email="info@rochapps.com")
+        unmapped = MyContact.objects.create(email="none@rochapps.com")
+        IContact.objects.set_contact_id(self.contact, '1')
+        IContact.objects.set_contact_id(other, '2')
+        reset_contact_id_cache()
+        with self.assertNumQueries(1):
+            ids = IContact.objects.get_contact_ids(
+                [self.contact, other, unmapped])
+        self.assertEqual({self.contact: '1', other: '2'}, ids)
+
+    def test_contact_id_cache(self):
+        IContact.objects.set_contact_id(self.contact, '1')
+        with self.assertNumQueries(0):
+            self.assertEqual('1',
+                IContact.objects.get_contact_id(self.contact))
+        IContact.objects.all().delete()
+        self.assertEqual(None, IContact.objects.get_contact_id(self.contact))
+
+    def test_set_contact_id_updates_in_one_statement(self):
+        IContact.objects.set_contact_id(self.contact, '1')
+        #the update, then reading back the returned record
+        with self.assertNumQueries(2):
+            icontact = IContact.objects.set_contact_id(self.contact, '2')
+        self.assertEqual('2', icontact.contact_id)
+        reset_contact_id_cache()
+        self.assertEqual('2', IContact.objects.get_contact_id(self.contact))
+
+    def test_one_contact_per_object(self):
+        ct = ContentType.objects.get_for_model(self.contact)
+        IContact.objects.set_contact_id(self.contact, '1')
+        self.assertRaises(IntegrityError, IContact.objects.create,
+            content_type=ct, object_id=self.contact.pk, contact_id='2')
+
+    def test_get_object_for_contact_id(self):
+        other = MyContact.objects.create(email="info@rochapps.com")
+        IContact.objects.set_contact_id(self.contact, '1')
+        IContact.objects.set_contact_id(other, '2')
+        self.assertEqual(self.contact,
+            IContact.objects.get_object_for_contact_id(1))
+        self.assertEqual(None, IContact.objects.get_object_for_contact_id(3))
+        with self.assertNumQueries(2):
+            objects = IContact.objects.get_objects_for_contact_ids(
+                ['1', '2', '3'])
+        self.assertEqual({'1': self.contact, '2': other}, objects)
+
+
 class IContactModelTests(TestCase):
     """
         Tests for the iCotactContact model
@@ -15,6 +15,7 @@ from icontact.tests.models import MyContact
 from icontact.adapter import IContactAdapter, IContactData
 from icontact.observer import IContactObserver
 from icontact.client import IContactClient, IContactException
+from icontact.tests.stubs import StubClient
     
 
 class MyContactAdapter(IContactAdapter):
@@ -70,3 +71,83 @@ class IContactObserverTests(TestCase):
         client = self.observer.client()
         contact = client.get_contact(contact_id)
         self.assertEqual('deleted', contact['contact']['status'])
+
+
+class IContactObserverSyncTests(TestCase):
+    """
+        Tests for the calls the observer makes to iContact
+    """
+    def setUp(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+        self.stub = StubClient()
+        self.observer = IContactObserver(client=self.stub)
+        self.observer.observe(MyContact, MyContactAdapter())
+        self.contact = MyContact.objects.create(email="victor@rochapps.com")
+        self.stub.calls = []
+
+    def tearDown(self):
+        self.observer.unobserve(MyContact)
+        IContact.objects.all().delete()
+
+    def test_update_uses_stored_contact_id(self):
+        self.contact.first_name = 'victor'
+        self.contact.save()
+        self.assertEqual([('update_contact', '42')], self.stub.calls)
+
+    def test_unchanged_update_is_skipped(self):
+        self.contact.save()
+        self.assertEqual([], self.stub.calls)
+
+    def test_only_changed_fields_are_sent(self):
+        self.contact.first_name = 'victor'
+        self.contact.save()
+        self.assertEqual([{'firstName': 'victor'}], self.stub.updates)
+        self.assertEqual(1, self.observer.stats['partial'])
+        self.contact.save()
+        self.assertEqual(1, self.observer.stats['suppressed'])
+        self.assertEqual('victor',
+            IContact.objects.get_contact(self.contact).get_payload()[
+                'firstName'])
+
+    def test_update_without_snapshot_sends_everything(self):
+        IContact.objects.set_contact_id(self.contact, '42')
+        self.contact.save()
+        self.assertEqual({'email': 'victor@rochapps.com', 'status': 'normal'},
+            self.stub.updates[0])
+        self.assertEqual(1, self.observer.stats['full'])
+
+    def test_cleared_fields_are_sent(self):
+        self.contact.first_name = 'victor'
+        self.contact.save()
+        self.contact.first_name = ''
+        self.contact.save()
+        self.assertEqual({'firstName': ''}, self.stub.updates[-1])
+
+    def test_update_creates_missing_contact(self):
+        self.stub.missing.add('42')
+        self.contact.first_name = 'victor'
+        self.contact.save()
+        self.assertEqual(['update_contact', 'create_contact', 'subscribe'],
+            [call[0] for call in self.stub.calls])
+
+    def test_update_without_contact_id_creates(self):
+        IContact.objects.delete_contact_id(self.contact)
+        self.contact.save()
+        self.assertEqual(['create_contact', 'subscribe'],
+            [call[0] for call in self.stub.calls])
+
+    def test_contact_id_is_kept_when_subscribe_fails(self):
+        IContact.objects.delete_contact_id(self.contact)
+        def subscribe(contact_id, list_id=None):
+            raise IContactException('Service Unavailable')
+        self.stub.subscribe = subscribe
+        self.assertRaises(IContactException, self.observer.push_update,
+            MyContact, self.contact)
+        self.assertEqual('42', IContact.objects.get_contact_id(self.contact))
+
+    def test_delete(self):
+        self.contact.delete()
+        self.assertEqual([('delete_contact', '42')], self.stub.calls)
+        self.assertFalse(IContact.objects.exists())
@@ -0,0 +1,126 @@
+import uuid
+
+from django.test import TestCase
+from requests.exceptions import ConnectionError
+
+from icontact.client import IContactClient, IContactException
+from icontact.ratelimit import TokenBucket, CacheWindow, RateLimiter, \
+    RateLimitExceeded, RetryPolicy, parse_retry_after
+from icontact.tests.client import StubResponse
+
+
+class SequencePool(object):
+    """
+        Answers requests with the given responses in order, raising the ones
+        that are exceptions.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    def request(self, method, url, data=None, headers=None, params=None):
+        self.requests += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class RateLimitTests(TestCase):
+    """
+        Tests for the rate limiters
+    """
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertEqual(0, bucket.try_acquire())
+        self.assertEqual(0, bucket.try_acquire())
+        wait = bucket.try_acquire()
+        self.assertTrue(0 < wait <= 1)
+
+    def test_cache_window(self):
+        window = CacheWindow(limit=2, period=3600, key=uuid.uuid4().hex)
+        self.assertEqual(0, window.try_acquire())
+        self.assertEqual(0, window.try_acquire())
+        self.assertTrue(window.try_acquire() > 0)
+        #another process sharing the cache sees the same count
+        other = CacheWindow(limit=2, period=3600, key=window.key)
+        self.assertTrue(other.try_acquire() > 0)
+
+    def test_rate_limiter_max_wait(self):
+        limiter = RateLimiter(limits=((1, 3600),), key=uuid.uuid4().hex,
+            max_wait=0)
+        limiter.acquire()
+        self.assertRaises(RateLimitExceeded, limiter.acquire)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(None, parse_retry_after(None))
+        self.assertEqual(120, parse_retry_after('120'))
+        self.assertEqual(0, parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'))
+        self.assertEqual(None, parse_retry_after('soon'))
+
+    def test_retry_policy(self):
+        policy = RetryPolicy(max_retries=2, backoff=1, max_backoff=3)
+        self.assertTrue(policy.should_retry(0))
+        self.assertTrue(policy.should_retry(1, StubResponse(503)))
+        self.assertFalse(policy.should_retry(1, StubResponse(404)))
+        self.assertFalse(policy.should_retry(2, StubResponse(503)))
+        #creates are only retried when iContact didn't process them
+        self.assertFalse(policy.should_retry(0, StubResponse(500), 'POST'))
+        self.assertFalse(policy.should_retry(0, StubResponse(503), 'POST'))
+        self.assertTrue(policy.should_retry(0, StubResponse(429), 'POST'))
+        self.assertTrue(policy.should_retry(0, StubResponse(503,
+            headers={'Retry-After': '1'}), 'POST'))
+        for attempt in range(5):
+            self.assertTrue(0 <= policy.delay(attempt) <= 3)
+        response = StubResponse(503, headers={'Retry-After': '2'})
+        self.assertEqual(2, policy.delay(0, response))
+
+
+class RetryTests(TestCase):
+    """
+        Tests for retries made by the Icontact Client
+    """
+
+    def make_client(self, *responses):
+        self.pool = SequencePool(*responses)
+        return IContactClient(pool=self.pool,
+            limiter=RateLimiter(key=uuid.uuid4().hex, shared=False),
+            retry=RetryPolicy(max_retries=2, backoff=0))
+
+    def test_retries_server_errors(self):
+        client = self.make_client(StubResponse(503), ConnectionError('reset'),
+            StubResponse(200, {'contact': {'contactId': '1'}}))
+        contact = client.get_contact('1')
+        self.assertEqual('1', contact['contact']['contactId'])
+        self.assertEqual(3, self.pool.requests)
+
+    def test_gives_up(self):
+        client = self.make_client(StubResponse(503), StubResponse(503),
+            StubResponse(503))
+        self.assertRaises(IContactException, client.get_contact, '1')
+        self.assertEqual(3, self.pool.requests)
+
+    def test_posts_are_not_retried_on_server_errors(self):
+        client = self.make_client(StubResponse(503), StubResponse(200,
+            {'contacts': [{'contactId': '1'}]}))
+        self.assertRaises(IContactException, client.create_contact,
+            {'contact': {'email': 'victor@rochapps.com'}})
+        self.assertEqual(1, self.pool.requests)
+
+    def test_posts_are_not_retried_on_connection_errors(self):
+        client = self.make_client(ConnectionError('reset'), StubResponse(200,
+            {'contacts': [{'contactId': '1'}]}))
+        self.assertRaises(IContactException, client.create_contact,
+            {'contact': {'email': 'victor@rochapps.com'}})
+        self.assertEqual(1, self.pool.requests)
+
+    def test_client_errors_are_not_retried(self):
+        client = self.make_client(StubResponse(404))
+        self.assertRaises(IContactException, client.get_contact, '1')
+        self.assertEqual(1, self.pool.requests)
+
+    def test_connection_errors_raise_icontact_exception(self):
+        client = self.make_client(*[ConnectionError('refused')] * 3)
+        self.assertRaises(IContactException, client.get_contact, '1')
@@ -0,0 +1,116 @@
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+import json
+
+from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import loading
+
+from icontact.models import IContact
+from icontact.observer import IContactObserver
+from icontact.reconcile import Reconciler
+from icontact.tests.models import MyContact
+from icontact.tests.observer import MyContactAdapter
+from icontact.tests.stubs import AccountObserver, StubClient
+
+
+class ReconcilerTests(TestCase):
+    """
+        Tests for reconciling local objects with iContact
+    """
+
+    def setUp(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+        self.synced = MyContact.objects.create(email='a@rochapps.com')
+        self.changed = MyContact.objects.create(email='b@rochapps.com',
+            first_name='victor')
+        self.gone = MyContact.objects.create(email='c@rochapps.com')
+        self.unlinked = MyContact.objects.create(email='d@rochapps.com')
+        self.new = MyContact.objects.create(email='e@rochapps.com')
+        IContact.objects.set_contact_id(self.synced, '1')
+        IContact.objects.set_contact_id(self.changed, '2')
+        IContact.objects.set_contact_id(self.gone, '3')
+        self.stub = StubClient()
+        self.stub.remote = [
+            {'contactId': '1', 'email': 'a@rochapps.com'},
+            {'contactId': '2', 'email': 'b@rochapps.com', 'firstName': 'vic'},
+            {'contactId': '4', 'email': 'D@rochapps.com'},
+            {'contactId': '5', 'email': 'f@rochapps.com'},
+            {'contactId': '6', 'email': 'g@rochapps.com',
+                'status': 'deleted'},
+        ]
+        self.observer = IContactObserver(client=self.stub)
+        self.observer.observe(MyContact, MyContactAdapter())
+        self.reconciler = Reconciler(models=[MyContact], client=self.stub,
+            partitions=3, batch_size=2)
+
+    def tearDown(self):
+        self.observer.unobserve(MyContact)
+        IContact.objects.all().delete()
+
+    def diff(self):
+        output = StringIO()
+        stats = self.reconciler.diff(output)
+        entries = [json.loads(line) for line in
+            output.getvalue().splitlines()]
+        return stats, entries
+
+    def test_diff(self):
+        stats, entries = self.diff()
+        self.assertEqual(5, stats['local'])
+        self.assertEqual(4, stats['remote'])
+        by_type = {}
+        for entry in entries:
+            by_type.setdefault(entry['type'], []).append(entry)
+        self.assertEqual([{'firstName': 'victor'}],
+            [e['fields'] for e in by_type['mismatch']])
+        self.assertEqual(set([self.gone.pk, self.new.pk]),
+            set(e['pk'] for e in by_type['missing']))
+        self.assertEqual([(self.unlinked.pk, '4')],
+            [(e['pk'], e['contactId']) for e in by_type['unlinked']])
+        self.assertEqual(['5'], [e['contactId'] for e in by_type['orphan']])
+
+    def test_repair(self):
+        stats, entries = self.diff()
+        repaired = self.reconciler.repair(entries)
+        self.assertEqual(2, repaired['missing'])
+        self.assertEqual(1, repaired['mismatch'])
+        self.assertEqual(1, repaired['unlinked'])
+        self.assertEqual(0, repaired['orphan'])
+        self.assertIn(('update_contacts', '2'), self.stub.calls)
+        #the snapshot follows the repaired contact
+        contact = MyContactAdapter().get_contact_data(self.changed)
+        self.assertEqual(contact.get_hash(),
+            IContact.objects.get_contact(self.changed).payload_hash)
+        self.assertEqual('4', IContact.objects.get_contact_id(self.unlinked))
+        self.assertEqual('e@rochapps.com',
+            IContact.objects.get_contact_id(self.new))
+
+    def test_accounts(self):
+        stats, entries = self.diff()
+        self.assertEqual(set([None]), set(e['account'] for e in entries))
+        self.observer.unobserve(MyContact)
+        observer = AccountObserver(account='acme')
+        observer.observe(MyContact, MyContactAdapter())
+        try:
+            reconciler = Reconciler(models=[MyContact])
+            self.assertEqual({'acme': [MyContact]}, reconciler.groups)
+            self.assertTrue(reconciler.clients['acme'] is
+                observer.stubs['acme'])
+            #routed per instance, one account's contacts can't be compared
+            #with every object
+            observer.account = lambda instance: 'acme'
+            self.assertRaises(ValueError, Reconciler, models=[MyContact])
+        finally:
+            observer.unobserve(MyContact)
+            self.observer.observe(MyContact, MyContactAdapter())
+
+    def test_repair_orphans(self):
+        stats, entries = self.diff()
+        self.reconciler.repair(entries, delete_orphans=True)
+        self.assertIn(('delete_contact', '5'), self.stub.calls)
@@ -0,0 +1,99 @@
+from django.test import TestCase
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db.models import loading
+from django.test.utils import override_settings
+
+from icontact.client import IContactClient
+from icontact.models import IContact, SyncJob
+from icontact.observer import IContactObserver
+from icontact.registry import ClientRegistry, get_client, reset_registry
+from icontact.session import get_pool
+from icontact.tests.models import MyContact
+from icontact.tests.observer import MyContactAdapter
+
+ACCOUNTS = {
+    'acme': {'ACCOUNT_ID': 99, 'FOLDER_ID': 7, 'DEFAULT_LIST': 3},
+    'globex': {'ACCOUNT_ID': 98, 'FOLDER_ID': 6},
+}
+
+
+class ClientRegistryTests(TestCase):
+    """
+        Tests for the clients of several accounts
+    """
+
+    def tearDown(self):
+        reset_registry()
+
+    def test_default_account(self):
+        client = get_client()
+        self.assertIs(client, get_client('default'))
+        self.assertEqual(settings.ICONTACT_ACCOUNT_ID, client.account_id)
+        self.assertIs(get_pool(), client.pool)
+
+    def test_accounts(self):
+        registry = ClientRegistry(accounts=ACCOUNTS)
+        client = registry.get_client('acme')
+        self.assertIs(client, registry.get_client('acme'))
+        self.assertEqual(99, client.account_id)
+        self.assertEqual(3, client.default_list)
+        self.assertEqual(settings.ICONTACT_API_KEY, client.api_key)
+        self.assertTrue('/a/99/c/7/contacts/' in
+            client.prepare_url('contacts/'))
+        other = registry.get_client('globex')
+        self.assertIsNot(client.pool, other.pool)
+        self.assertIsNot(get_pool(), client.pool)
+        self.assertRaises(ImproperlyConfigured, registry.get_client, 'initech')
+
+    def test_settings_are_read_when_created(self):
+        with self.settings(ICONTACT_ACCOUNT_ID=1234):
+            self.assertEqual(1234, IContactClient().account_id)
+
+    def test_headers_are_built_once(self):
+        client = IContactClient()
+        self.assertEqual(client._get_headers(), client._headers)
+
+
+class AccountRoutingTests(TestCase):
+    """
+        Tests for routing observed objects to accounts
+    """
+
+    def setUp(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+
+    def tearDown(self):
+        reset_registry()
+        IContact.objects.all().delete()
+        SyncJob.objects.all().delete()
+
+    @override_settings(ICONTACT_ACCOUNTS=ACCOUNTS)
+    def test_get_account(self):
+        contact = MyContact(email='a@acme.com')
+        observer = IContactObserver(account='globex')
+        self.assertEqual('globex', observer.get_account(contact))
+        observer.accounts[MyContact] = lambda instance: \
+            instance.email.split('@')[1].split('.')[0]
+        self.assertEqual('acme', observer.get_account(contact))
+        self.assertEqual(None, observer.get_account(model=MyContact))
+        self.assertEqual(99, observer.client(contact).account_id)
+        self.assertIs(get_client(), observer.client(model=MyContact))
+
+    @override_settings(ICONTACT_ACCOUNTS=ACCOUNTS)
+    def test_deferred_delete_keeps_account(self):
+        observer = IContactObserver(deferred=True)
+        observer.observe(MyContact, MyContactAdapter(), account='acme')
+        try:
+            contact = MyContact.objects.create(email='a@acme.com')
+            IContact.objects.set_contact_id(contact, '7')
+            contact.delete()
+        finally:
+            observer.unobserve(MyContact)
+        job = SyncJob.objects.get(action=SyncJob.DELETE)
+        self.assertEqual('acme', job.account)
+        self.assertEqual('', SyncJob.objects.get(
+            action=SyncJob.CREATE).account)
@@ -0,0 +1,58 @@
+import threading
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from icontact.client import IContactClient
+from icontact.session import ConnectionPool, get_pool, reset_pool
+
+
+class ConnectionPoolTests(TestCase):
+    """
+        Tests for the shared connection pool
+    """
+
+    def tearDown(self):
+        reset_pool()
+
+    def test_get_pool_is_shared(self):
+        self.assertIs(get_pool(), get_pool())
+        client = IContactClient()
+        other = IContactClient()
+        self.assertIs(client.pool, other.pool)
+        self.assertIs(client.pool, get_pool())
+
+    def test_reset_pool(self):
+        pool = get_pool()
+        reset_pool()
+        self.assertIsNot(pool, get_pool())
+
+    @override_settings(ICONTACT_POOL_MAXSIZE=3, ICONTACT_TIMEOUT=2,
+        ICONTACT_KEEP_ALIVE=False)
+    def test_pool_settings(self):
+        reset_pool()
+        pool = get_pool()
+        self.assertEqual(3, pool.pool_maxsize)
+        self.assertEqual(2, pool.timeout)
+        self.assertEqual('close', pool.session().headers['Connection'])
+
+    def test_session_per_thread(self):
+        pool = ConnectionPool()
+        sessions = []
+        thread = threading.Thread(
+            target=lambda: sessions.append(pool.session()))
+        thread.start()
+        thread.join()
+        self.assertIs(pool.session(), pool.session())
+        self.assertIsNot(pool.session(), sessions[0])
+        #both sessions talk through the same adapter
+        self.assertIs(pool.session().get_adapter('https://'),
+            sessions[0].get_adapter('https://'))
+
+    def test_stats(self):
+        pool = ConnectionPool()
+        stats = pool.stats()
+        self.assertEqual(0, stats['opened'])
+        self.assertEqual(0, stats['reused'])
+        client = IContactClient(pool=pool)
+        self.assertEqual(stats, client.connection_stats())
@@ -0,0 +1,97 @@
+from icontact.client import BatchResult, IContactException
+from icontact.observer import IContactObserver
+
+
+class StubClient(object):
+    """
+        Records calls instead of talking to iContact.
+    """
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        #contactIds iContact answers 404 for
+        self.missing = set()
+        #payloads sent to update_contact
+        self.updates = []
+        #contacts returned by iter_contacts
+        self.remote = []
+        #contactIds dropped from the caches, which sends nothing
+        self.forgotten = []
+
+    def create_contact(self, payload=None):
+        self.calls.append(('create_contact', payload))
+        if self.fail:
+            raise IContactException('Service Unavailable')
+        return {'contacts': [{'contactId': '42'}]}
+
+    def subscribe(self, contact_id, list_id=None):
+        self.calls.append(('subscribe', contact_id))
+        return {'subscriptions': []}
+
+    def get_contact(self, contact_id):
+        self.calls.append(('get_contact', contact_id))
+        return {'contact': {'contactId': contact_id}}
+
+    def update_contact(self, contact_id, payload=None):
+        self.calls.append(('update_contact', contact_id))
+        if contact_id in self.missing:
+            raise IContactException('Not Found', status_code=404)
+        self.updates.append(payload)
+        return {'contact': {'contactId': contact_id}}
+
+    def delete_contact(self, contact_id):
+        self.calls.append(('delete_contact', contact_id))
+        return []
+
+    def create_contacts(self, contacts, batch_size=None):
+        result = BatchResult()
+        for contact in contacts:
+            self.calls.append(('create_contacts', contact.email))
+            if self.fail:
+                result.errors.append((contact, 'Service Unavailable'))
+            else:
+                result.results.append((contact, contact.email))
+        return result
+
+    def update_contacts(self, contacts, batch_size=None):
+        result = BatchResult()
+        for item in contacts:
+            self.calls.append(('update_contacts', item[0]))
+            result.results.append((item, item[0]))
+        return result
+
+    def subscribe_many(self, contact_ids, list_id=None, batch_size=None):
+        result = BatchResult()
+        for contact_id in contact_ids:
+            self.calls.append(('subscribe_many', contact_id))
+            result.results.append((contact_id, contact_id))
+        return result
+
+    def iter_contacts(self, fields=None, page_size=None, prefetch=False,
+            **filters):
+        self.calls.append(('iter_contacts', None))
+        return iter(self.remote)
+
+    def forget_contacts(self, contact_ids):
+        self.forgotten.extend(contact_ids)
+
+    def forget_subscriptions(self, contact_ids):
+        pass
+
+
+class AccountObserver(IContactObserver):
+    """
+        Observer syncing with a StubClient per account, found in stubs.
+    """
+
+    def __init__(self, *args, **kwargs):
+        IContactObserver.__init__(self, *args, **kwargs)
+        self.stubs = {}
+
+    def client(self, instance=None, model=None, account=None):
+        if account is None:
+            account = self.get_account(instance, model)
+        if account not in self.stubs:
+            self.stubs[account] = StubClient()
+        return self.stubs[account]
@@ -0,0 +1,88 @@
+from django.test import TestCase
+
+from icontact.adapter import IContactData
+from icontact.client import IContactException
+from icontact.ratelimit import RetryPolicy
+from icontact.testing import FakeIContact
+
+
+class FakeIContactTests(TestCase):
+    """
+        Tests for the fake iContact api
+    """
+
+    def setUp(self):
+        self.fake = FakeIContact()
+        self.icontact = self.make_client(self.fake)
+
+    def make_client(self, fake, retries=0):
+        return fake.client(retry=RetryPolicy(max_retries=retries, backoff=0))
+
+    def test_contact_lifecycle(self):
+        data = IContactData(email='victor@rochapps.com', first_name='victor')
+        created = self.icontact.create_contact(data.get_data())
+        contact_id = created['contacts'][0]['contactId']
+        contact = self.icontact.get_contact(contact_id)['contact']
+        self.assertEqual('victor', contact['firstName'])
+        self.icontact.update_contact(contact_id,
+            {'contact': {'city': 'Durham'}})
+        contact = self.icontact.get_contact(contact_id)['contact']
+        self.assertEqual('Durham', contact['city'])
+        self.assertEqual('victor', contact['firstName'])
+        self.assertFalse(self.icontact.delete_contact(contact_id))
+        self.assertEqual('deleted',
+            self.icontact.get_contact(contact_id)['contact']['status'])
+        self.assertRaises(IContactException, self.icontact.delete_contact,
+            contact_id)
+        self.assertRaises(IContactException, self.icontact.get_contact, '999')
+
+    def test_batches(self):
+        contacts = [IContactData(email='a@rochapps.com'),
+            IContactData(email='b@rochapps.com')]
+        #skips the validation of IContactData
+        contacts[1].email = 'invalid'
+        result = self.icontact.create_contacts(contacts)
+        self.assertEqual(1, len(result.results))
+        self.assertEqual('invalid', result.errors[0][0].email)
+        contact_id = result.results[0][1]
+        result = self.icontact.subscribe_many([contact_id], list_id=1)
+        self.assertEqual([(contact_id, contact_id)], result.results)
+        #a client that doesn't know the subscription sends it again
+        client = self.make_client(self.fake)
+        result = client.subscribe_many([contact_id], list_id=1)
+        self.assertEqual('Already subscribed', result.errors[0][1])
+
+    def test_paging(self):
+        self.icontact.create_contacts([IContactData(
+            email='%s@rochapps.com' % i) for i in range(7)])
+        contacts = list(self.icontact.iter_contacts(page_size=3))
+        self.assertEqual(7, len(contacts))
+        self.assertEqual(3, len([r for r in self.fake.log
+            if r == ('GET', 'contacts')]))
+        contacts = list(self.icontact.iter_contacts(fields=['email'],
+            email='3@rochapps.com'))
+        self.assertEqual([{'email': '3@rochapps.com'}], contacts)
+
+    def test_lists(self):
+        list_id = self.fake.add_list('newsletter')
+        self.assertEqual('newsletter', self.fake.lists[list_id]['name'])
+
+    def test_rate_limit(self):
+        fake = FakeIContact(rate_limit=(2, 3600))
+        client = self.make_client(fake)
+        client.get_contacts()
+        client.get_contacts()
+        try:
+            client.get_contacts()
+        except IContactException as e:
+            self.assertEqual(429, e.status_code)
+        else:
+            self.fail('rate limit not enforced')
+
+    def test_error_rate(self):
+        fake = FakeIContact(error_rate=0.5, seed=1)
+        client = self.make_client(fake, retries=20)
+        for i in range(10):
+            client.get_contacts()
+        self.assertTrue(len(fake.log) > 10)
+        self.assertEqual(len(fake.log), client.connection_stats()['requests'])
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import loading
+
+from icontact.adapter import FieldMapAdapter, IContactData
+from icontact.models import IContact
+from icontact.observer import IContactObserver
+from icontact.testing import FakeIContact
+from icontact.tests.models import MyContact
+from icontact.tests.stubs import StubClient
+from icontact.transfer import CSV, JSONL, contact_data, export_local, \
+    export_remote, get_writer, import_contacts, open_file, read_rows
+
+
+class TransferTests(TestCase):
+    """
+        Tests for exporting and importing contacts
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.fake = FakeIContact()
+        self.icontact = self.fake.client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def export(self, name, format, columns=None):
+        with open_file(self.path(name), 'w') as f:
+            return export_remote(self.icontact, get_writer(f, format, columns),
+                page_size=2)
+
+    def load(self, name, format):
+        with open_file(self.path(name)) as f:
+            return list(read_rows(f, format))
+
+    def test_round_trip(self):
+        self.icontact.create_contacts([IContactData(
+            email='victor%s@rochapps.com' % i, first_name=u'V\xedctor',
+            custom={'plan': 'gold'}) for i in range(5)])
+        stats = self.export('contacts.csv', CSV)
+        self.assertEqual(5, stats.processed)
+        self.assertEqual(5, len(self.load('contacts.csv', CSV)))
+        self.export('contacts.jsonl', JSONL)
+        rows = self.load('contacts.jsonl', JSONL)
+        self.assertEqual(u'V\xedctor', rows[0]['firstName'])
+        self.assertEqual('gold', rows[0]['plan'])
+        #rows with a contactId update it, the others are created
+        rows[0]['city'] = 'Durham'
+        del rows[1]['contactId']
+        rows[1]['email'] = 'new@rochapps.com'
+        rows[2]['email'] = 'invalid'
+        progress = []
+        stats = import_contacts(self.icontact, iter(rows[:3]), batch_size=2,
+            progress=progress.append)
+        self.assertEqual(3, stats.processed)
+        self.assertEqual(1, stats.created)
+        self.assertEqual(1, stats.updated)
+        self.assertEqual(1, stats.failed)
+        self.assertEqual(2, len(progress))
+        self.assertEqual('Durham',
+            self.fake.contacts[rows[0]['contactId']]['city'])
+        self.assertEqual(6, len(self.fake.contacts))
+
+    def test_import_csv(self):
+        list_id = self.fake.add_list('newsletter')
+        with open(self.path('contacts.csv'), 'w') as f:
+            f.write('email,firstName,plan\n')
+            for i in range(3):
+                f.write('victor%s@rochapps.com,victor,gold\n' % i)
+        with open_file(self.path('contacts.csv')) as f:
+            stats = import_contacts(self.icontact, read_rows(f, CSV),
+                list_id=list_id)
+        self.assertEqual(3, stats.created)
+        self.assertEqual(3, len(self.fake.subscriptions))
+        contact = list(self.fake.contacts.values())[0]
+        self.assertEqual('victor', contact['firstName'])
+        self.assertEqual('gold', contact['plan'])
+
+    def test_read_only_fields(self):
+        contact_id, contact = contact_data({'contactId': 7,
+            'email': 'victor@rochapps.com', 'createDate': '2013-01-01',
+            'bounceCount': '0', 'plan': 'gold'})
+        self.assertEqual('7', contact_id)
+        self.assertEqual({'plan': 'gold'}, contact.custom)
+
+    def test_columns(self):
+        self.icontact.create_contact(IContactData(
+            email='victor@rochapps.com', first_name='victor').get_data())
+        self.export('contacts.csv', CSV, columns=['email', 'firstName'])
+        with open(self.path('contacts.csv')) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(['email,firstName', 'victor@rochapps.com,victor'],
+            lines)
+
+    def test_export_local(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+        contacts = [MyContact.objects.create(
+            email='victor%s@rochapps.com' % i) for i in range(3)]
+        observer = IContactObserver(client=StubClient())
+        observer.observe(MyContact, FieldMapAdapter(fields={'email': 'email'}))
+        try:
+            IContact.objects.set_contact_id(contacts[0], '7')
+            with open_file(self.path('local.jsonl'), 'w') as f:
+                stats = export_local(MyContact, get_writer(f, JSONL),
+                    batch_size=2)
+        finally:
+            observer.unobserve(MyContact)
+            IContact.objects.all().delete()
+        self.assertEqual(3, stats.processed)
+        rows = self.load('local.jsonl', JSONL)
+        self.assertEqual({'contactId': '7', 'email': 'victor0@rochapps.com',
+            'status': 'normal'}, rows[0])
+        self.assertFalse('contactId' in rows[1])
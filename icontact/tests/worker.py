@@ -0,0 +1,139 @@
+import datetime
+
+from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import loading
+from django.utils import timezone
+
+from icontact.models import IContact, IContactEvent, SyncJob
+from icontact.tests.models import MyContact
+from icontact.tests.observer import MyContactAdapter
+from icontact.observer import IContactObserver
+from icontact.worker import SyncWorker
+from icontact.tests.stubs import StubClient
+
+
+class SyncWorkerTests(TestCase):
+    """
+        Tests for deferred observers and the sync worker
+    """
+
+    def setUp(self):
+        settings.INSTALLED_APPS += ('icontact.tests',)
+        loading.cache.loaded = False
+        call_command('syncdb', verbosity=0)
+        self.stub = StubClient()
+        self.observer = IContactObserver(client=self.stub, deferred=True)
+        self.observer.observe(MyContact, MyContactAdapter())
+
+    def tearDown(self):
+        self.observer.unobserve(MyContact)
+        IContact.objects.all().delete()
+        SyncJob.objects.all().delete()
+
+    def test_save_enqueues(self):
+        contact = MyContact.objects.create(email="victor@rochapps.com")
+        self.assertFalse(self.stub.calls)
+        jobs = SyncJob.objects.all()
+        self.assertEqual(1, jobs.count())
+        self.assertEqual(SyncJob.CREATE, jobs[0].action)
+        self.assertEqual(contact.pk, jobs[0].object_id)
+
+    def test_run_once(self):
+        contact = MyContact.objects.create(email="victor@rochapps.com")
+        contact.save()
+        processed = SyncWorker().run_once()
+        self.assertEqual(2, processed)
+        self.assertEqual('42', IContact.objects.get_contact_id(contact))
+        self.assertFalse(SyncJob.objects.exists())
+
+    def test_delete(self):
+        contact = MyContact.objects.create(email="victor@rochapps.com")
+        SyncWorker().run_once()
+        contact.delete()
+        job = SyncJob.objects.get()
+        self.assertEqual('42', job.contact_id)
+        SyncWorker().run_once()
+        self.assertIn(('delete_contact', '42'), self.stub.calls)
+        self.assertFalse(IContact.objects.exists())
+
+    def test_jobs_for_one_object_run_in_order(self):
+        contact = MyContact.objects.create(email="victor@rochapps.com")
+        contact.save()
+        first = SyncJob.objects.claim()
+        self.assertEqual(SyncJob.CREATE, first.action)
+        #the update has to wait for the create to finish
+        self.assertEqual(None, SyncJob.objects.claim())
+
+    def test_failed_jobs_are_retried(self):
+        self.stub.fail = True
+        MyContact.objects.create(email="victor@rochapps.com")
+        worker = SyncWorker(max_attempts=2, retry_delay=0)
+        worker.run_once()
+        job = SyncJob.objects.get()
+        self.assertEqual(SyncJob.FAILED, job.status)
+        self.assertEqual(2, job.attempts)
+
+    def test_failed_jobs_wait(self):
+        self.stub.fail = True
+        MyContact.objects.create(email="victor@rochapps.com")
+        self.assertEqual(1, SyncWorker(retry_delay=60).run_once())
+        job = SyncJob.objects.get()
+        self.assertEqual(SyncJob.PENDING, job.status)
+        self.assertEqual(1, job.attempts)
+        self.assertTrue(job.run_after > timezone.now())
+        #not retried before its time
+        self.assertEqual(None, SyncJob.objects.claim())
+        SyncJob.objects.update(run_after=timezone.now())
+        self.assertEqual(job.pk, SyncJob.objects.claim().pk)
+
+    def test_failed_jobs_are_purged(self):
+        self.stub.fail = True
+        MyContact.objects.create(email="victor@rochapps.com")
+        worker = SyncWorker(max_attempts=1, keep_failed=60)
+        worker.run_once()
+        self.assertEqual(SyncJob.FAILED, SyncJob.objects.get().status)
+        self.assertEqual(0, worker.purge())
+        SyncJob.objects.update(claimed=timezone.now() -
+            datetime.timedelta(seconds=120))
+        self.assertEqual(1, worker.purge())
+        self.assertFalse(SyncJob.objects.exists())
+
+    def test_event_keys_are_purged(self):
+        IContactEvent.objects.record(['a', 'b'])
+        worker = SyncWorker(keep_events=60)
+        self.assertEqual(0, worker.purge())
+        IContactEvent.objects.filter(key='a').update(
+            received=timezone.now() - datetime.timedelta(seconds=120))
+        self.assertEqual(1, worker.purge())
+        self.assertEqual(['b'], list(IContactEvent.objects.values_list(
+            'key', flat=True)))
+
+    def test_crashed_jobs_are_failed(self):
+        class CrashingWorker(SyncWorker):
+            def process(self, job):
+                raise ValueError('crash')
+        MyContact.objects.create(email="victor@rochapps.com")
+        self.assertEqual(1, CrashingWorker(retry_delay=60).run_once())
+        job = SyncJob.objects.get()
+        self.assertEqual(SyncJob.PENDING, job.status)
+        self.assertEqual('crashed', job.error)
+        self.assertEqual(1, job.attempts)
+
+    def test_stale_jobs_are_claimed_again(self):
+        MyContact.objects.create(email="victor@rochapps.com")
+        job = SyncJob.objects.claim()
+        self.assertEqual(None, SyncJob.objects.claim())
+        #the worker running it died
+        SyncJob.objects.update(claimed=timezone.now() -
+            datetime.timedelta(seconds=600))
+        self.assertEqual(job.pk, SyncJob.objects.claim(timeout=300).pk)
+
+    def test_invalid_data_is_not_retried(self):
+        MyContact.objects.create(email="victor")
+        SyncWorker(max_attempts=5).run_once()
+        job = SyncJob.objects.get()
+        self.assertEqual(SyncJob.FAILED, job.status)
+        self.assertEqual(1, job.attempts)
+        self.assertFalse(self.stub.calls)
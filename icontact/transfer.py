@@ -0,0 +1,273 @@
+"""
+Exports of contacts, from iContact or from observed models, to csv or json
+lines files, and imports of such files into iContact.
+
+Rows are read, converted and written one batch at a time, files are read line
+by line, so memory use doesn't grow with the number of contacts.
+"""
+import csv
+import json
+import logging
+import os
+import re
+
+from icontact.adapter import FIELDS, IContactData, InvalidContactData, \
+    string_types
+from icontact.backfill import BackfillStats, iter_pages, object_pk
+from icontact.client import chunks
+from icontact.ingest import VERSION_FIELDS
+from icontact.models import IContact
+from icontact.observer import get_observer
+
+logger = logging.getLogger(__name__)
+
+CSV = 'csv'
+JSONL = 'jsonl'
+FORMATS = (CSV, JSONL)
+#columns of csv files unless others are given
+DEFAULT_COLUMNS = ('contactId',) + FIELDS
+DEFAULT_BATCH_SIZE = 500
+
+#the csv module of python 2 only reads and writes bytes
+CSV_BYTES = str is bytes
+
+#fields of exported contacts set by iContact, they can't be imported
+READ_ONLY_FIELDS = ('createDate', 'bounceCount') + VERSION_FIELDS
+
+#iContact field -> IContactData argument, e.g. firstName -> first_name
+ARGUMENTS = dict((field, re.sub('([A-Z])',
+    lambda m: '_' + m.group(1).lower(), field)) for field in FIELDS)
+
+
+def guess_format(path):
+    """
+        Returns the format of path from its extension, csv unless it is
+        .jsonl or .json.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.json'):
+        return JSONL
+    return CSV
+
+
+def open_file(path, mode='r'):
+    """
+        Opens path to read or write csv or json lines.
+    """
+    if CSV_BYTES:
+        return open(path, mode + 'b')
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+class CSVWriter(object):
+    """
+        Writes contacts to a csv file, one column per field of columns.
+    """
+
+    def __init__(self, f, columns=None):
+        self.columns = columns or DEFAULT_COLUMNS
+        self.writer = csv.writer(f)
+        self.writer.writerow([self.cell(column) for column in self.columns])
+
+    def cell(self, value):
+        if value is None:
+            return ''
+        if not isinstance(value, string_types):
+            value = str(value)
+        if CSV_BYTES and not isinstance(value, bytes):
+            value = value.encode('utf-8')
+        return value
+
+    def write(self, contact):
+        self.writer.writerow([self.cell(contact.get(column))
+            for column in self.columns])
+
+
+class JSONLinesWriter(object):
+    """
+        Writes contacts to a file as one json object per line.
+    """
+
+    def __init__(self, f, columns=None):
+        self.f = f
+        self.columns = columns
+
+    def write(self, contact):
+        if self.columns:
+            contact = dict((column, contact[column])
+                for column in self.columns if column in contact)
+        self.f.write(json.dumps(contact, sort_keys=True) + '\n')
+
+
+def get_writer(f, format, columns=None):
+    if format == JSONL:
+        return JSONLinesWriter(f, columns)
+    return CSVWriter(f, columns)
+
+
+def read_csv(f):
+    """
+        Yields the rows of a csv file with a header as dicts.
+    """
+    for row in csv.DictReader(f):
+        if CSV_BYTES:
+            row = dict((key and key.decode('utf-8'),
+                isinstance(value, str) and value.decode('utf-8') or value)
+                for key, value in row.items())
+        yield row
+
+
+def read_jsonl(f):
+    """
+        Yields the objects of a json lines file, blank lines are skipped.
+    """
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_rows(f, format):
+    if format == JSONL:
+        return read_jsonl(f)
+    return read_csv(f)
+
+
+def contact_data(row):
+    """
+        Returns (contactId or None, IContactData) for a row keyed by iContact
+        field names, other keys are custom fields. Empty values and the
+        READ_ONLY_FIELDS of exported contacts are left out.
+
+        Raises InvalidContactData for rows iContact would reject.
+    """
+    contact_id = None
+    kwargs = {}
+    custom = {}
+    for key, value in row.items():
+        if key is None or value is None or value == '' or \
+                key in READ_ONLY_FIELDS:
+            #None keys hold the cells of csv rows longer than the header
+            continue
+        if key == 'contactId':
+            contact_id = str(value)
+        elif key in ARGUMENTS:
+            kwargs[ARGUMENTS[key]] = value
+        else:
+            custom[key] = value
+    return contact_id, IContactData(kwargs.pop('email', None), custom=custom,
+        **kwargs)
+
+
+def export_remote(client, writer, fields=None, page_size=None,
+        progress=None, every=DEFAULT_BATCH_SIZE):
+    """
+        Writes every contact of the client's folder with writer, fetching
+        pages of page_size in the background. Returns BackfillStats.
+
+        fields: contact fields to fetch, all by default.
+
+        progress: callable receiving the stats every every contacts.
+    """
+    stats = BackfillStats()
+    for contact in client.iter_contacts(fields=fields, page_size=page_size,
+            prefetch=True):
+        writer.write(contact)
+        stats.processed += 1
+        if progress is not None and not stats.processed % every:
+            progress(stats)
+    if progress is not None:
+        progress(stats)
+    return stats
+
+
+def export_local(model, writer, batch_size=DEFAULT_BATCH_SIZE,
+        progress=None):
+    """
+        Writes the contact data of every row of an observed model with
+        writer, built by the adapter it is observed with, along with its
+        contactId when it has been synced. Returns BackfillStats, rows the
+        adapter rejects are counted as failed.
+
+        Rows are read in pages of batch_size through the adapter's
+        bulk_queryset, see icontact.backfill.Backfill.
+
+        progress: callable receiving the stats after every page.
+    """
+    observer = get_observer(model)
+    if observer is None:
+        raise ValueError('%s is not observed' % model.__name__)
+    adapter = observer.adapters[model]
+    queryset = adapter.bulk_queryset(model._default_manager.all())
+    stats = BackfillStats(total=model._default_manager.count())
+    for page in iter_pages(queryset, batch_size):
+        contact_ids = IContact.objects.get_contact_ids_for(model,
+            [object_pk(row) for row in page])
+        for row in page:
+            try:
+                contact = adapter.get_bulk_contact_data(row)
+            except InvalidContactData as e:
+                logger.warning('could not export %r: %s', row, e)
+                stats.failed += 1
+                continue
+            data = contact.get_data()['contact']
+            contact_id = contact_ids.get(object_pk(row))
+            if contact_id is not None:
+                data['contactId'] = contact_id
+            writer.write(data)
+        stats.processed += len(page)
+        if progress is not None:
+            progress(stats)
+    return stats
+
+
+def import_contacts(client, rows, batch_size=DEFAULT_BATCH_SIZE,
+        list_id=None, progress=None):
+    """
+        Creates the contacts of rows, see contact_data, in batch requests of
+        batch_size, rows with a contactId update that contact instead.
+        Returns BackfillStats.
+
+        Only one batch of rows is held at a time, so rows can be read from a
+        file of any size.
+
+        list_id: list created contacts are subscribed to.
+
+        progress: callable receiving the stats after every batch.
+    """
+    stats = BackfillStats()
+    for chunk in chunks(rows, batch_size):
+        contacts = []
+        updates = []
+        for row in chunk:
+            try:
+                contact_id, contact = contact_data(row)
+            except InvalidContactData as e:
+                logger.warning('could not import %r: %s', row, e)
+                stats.failed += 1
+                continue
+            if contact_id is None:
+                contacts.append(contact)
+            else:
+                updates.append((contact_id, contact))
+        if contacts:
+            result = client.create_contacts(contacts, batch_size=batch_size)
+            stats.created += len(result.results)
+            stats.failed += len(result.errors)
+            for contact, message in result.errors:
+                logger.warning('could not create %s: %s', contact.email,
+                    message)
+            if list_id is not None and result.results:
+                subscribed = client.subscribe_many([contact_id for contact,
+                    contact_id in result.results], list_id=list_id,
+                    batch_size=batch_size)
+                for contact_id, message in subscribed.errors:
+                    logger.warning('could not subscribe %s: %s', contact_id,
+                        message)
+        if updates:
+            result = client.update_contacts(updates, batch_size=batch_size)
+            stats.updated += len(result.results)
+            stats.failed += len(result.errors)
+        stats.processed += len(chunk)
+        if progress is not None:
+            progress(stats)
+    return stats
@@ -0,0 +1,5 @@
+from django.conf.urls import patterns, url
+
+urlpatterns = patterns('icontact.views',
+    url(r'^webhook/$', 'webhook', name='icontact_webhook'),
+)
@@ -0,0 +1,45 @@
+"""
+Views of the icontact application.
+"""
+import json
+
+from django.http import HttpResponse, HttpResponseBadRequest, \
+    HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from icontact.conf import conf
+from icontact.ingest import EventProcessor
+
+
+@csrf_exempt
+@require_POST
+def webhook(request):
+    """
+    Receives events from iContact as a json list, or an object with an
+    events list, and applies them with icontact.ingest.EventProcessor.
+
+    Requests must carry ICONTACT_WEBHOOK_SECRET in the X-IContact-Secret
+    header, every request is refused while the setting isn't set.
+
+    Responds with the counts of the IngestResult as json.
+    """
+    secret = conf.get('WEBHOOK_SECRET', None)
+    if not secret or not constant_time_compare(
+            request.META.get('HTTP_X_ICONTACT_SECRET', ''), secret):
+        return HttpResponseForbidden()
+    try:
+        events = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid json')
+    if isinstance(events, dict):
+        events = events.get('events', [events])
+    if not isinstance(events, list) or \
+            not all(isinstance(event, dict) for event in events):
+        return HttpResponseBadRequest('Expected a list of events')
+    if not all(event.get('id') for event in events):
+        return HttpResponseBadRequest('Events need an id')
+    result = EventProcessor().process(events)
+    return HttpResponse(json.dumps(result.as_dict()),
+        content_type='application/json')
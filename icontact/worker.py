@@ -0,0 +1,219 @@
+"""
+Background workers draining the SyncJob queue filled by deferred observers.
+"""
+import datetime
+import logging
+import threading
+import time
+
+from django.db import connection
+from django.utils import timezone
+
+from icontact.models import IContactEvent, SyncJob
+from icontact.observer import get_observer
+from icontact.adapter import InvalidContactData
+from icontact.client import IContactException, IContactUnavailable
+
+logger = logging.getLogger(__name__)
+
+#longest wait before a failed job is retried, in seconds
+MAX_RETRY_DELAY = 3600
+#seconds jobs that failed for good are kept for inspection
+DEFAULT_KEEP_FAILED = 7 * 24 * 3600
+#seconds the keys of events received from iContact are kept, events
+#redelivered later are applied again
+DEFAULT_KEEP_EVENTS = 30 * 24 * 3600
+
+
+class SyncWorker(object):
+    """
+        Pool of threads that claim SyncJobs and push them to iContact.
+
+        threads: number of jobs processed concurrently.
+
+        poll_interval: seconds a thread sleeps when the queue is empty.
+
+        max_attempts: failed jobs are retried until they have been attempted
+                    this many times, then left in the FAILED state.
+
+        retry_delay: seconds before a failed job is retried, doubled after
+                    every attempt up to MAX_RETRY_DELAY.
+
+        keep_failed: seconds jobs left in the FAILED state are kept before
+                    purge deletes them, None to keep them forever.
+
+        keep_events: seconds the keys of the events icontact.ingest applied
+                    are kept before purge deletes them, None to keep them
+                    forever.
+
+        Jobs that fail because iContact is unavailable, e.g. while its
+        circuit breaker is open, go back to the queue without counting as an
+        attempt, and the worker pauses until iContact may be back.
+    """
+
+    def __init__(self, threads=4, poll_interval=1.0, max_attempts=5,
+            retry_delay=30, keep_failed=DEFAULT_KEEP_FAILED,
+            keep_events=DEFAULT_KEEP_EVENTS):
+        """
+            Instantiate an instance of the class.
+        """
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.keep_failed = keep_failed
+        self.keep_events = keep_events
+        self._stop = threading.Event()
+        self._threads = []
+        #time before which iContact is not expected to be reachable
+        self.paused_until = 0
+
+    def process(self, job):
+        """
+            Runs a claimed job. Successful jobs are deleted, failed ones go
+            back to the queue or are marked as FAILED.
+        """
+        model = job.content_type.model_class()
+        observer = get_observer(model)
+        if observer is None:
+            self._fail(job, 'model is not observed', retry=False)
+            return False
+        try:
+            if job.action == SyncJob.DELETE:
+                observer.push_delete(job.content_type, job.object_id,
+                    job.contact_id, account=job.account or None)
+            else:
+                try:
+                    instance = model._default_manager.get(pk=job.object_id)
+                except model.DoesNotExist:
+                    #deleted since, a delete job takes care of iContact
+                    job.delete()
+                    return True
+                if job.action == SyncJob.CREATE:
+                    observer.push_create(model, instance)
+                else:
+                    observer.push_update(model, instance)
+        except InvalidContactData as e:
+            #retrying won't fix the data
+            self._fail(job, str(e), retry=False)
+            return False
+        except IContactUnavailable as e:
+            self._postpone(job, e)
+            return False
+        except IContactException as e:
+            self._fail(job, str(e))
+            return False
+        job.delete()
+        return True
+
+    def run_job(self, job):
+        """
+            Runs a claimed job with process, a job that crashes is failed
+            instead of being left running.
+        """
+        try:
+            return self.process(job)
+        except Exception:
+            logger.exception('sync job %s crashed', job.pk)
+            self._fail(job, 'crashed')
+            return False
+
+    def _fail(self, job, error, retry=True):
+        job.attempts += 1
+        job.error = error
+        if retry and job.attempts < self.max_attempts:
+            job.status = SyncJob.PENDING
+            delay = min(self.retry_delay * 2 ** (job.attempts - 1),
+                MAX_RETRY_DELAY)
+            job.run_after = timezone.now() + datetime.timedelta(
+                seconds=delay)
+        else:
+            job.status = SyncJob.FAILED
+        logger.warning('sync job %s failed (attempt %s): %s',
+            job.pk, job.attempts, error)
+        job.save()
+
+    def _postpone(self, job, error):
+        job.status = SyncJob.PENDING
+        job.error = str(error)
+        job.save()
+        self.paused_until = time.time() + (error.retry_after or
+            self.poll_interval)
+        logger.warning('sync job %s postponed: %s', job.pk, error)
+
+    def purge(self):
+        """
+            Deletes the jobs that failed more than keep_failed seconds ago
+            and the event keys received more than keep_events seconds ago,
+            returns how many there were.
+        """
+        now = timezone.now()
+        purged = 0
+        if self.keep_failed is not None:
+            purged += SyncJob.objects.purge_failed(now -
+                datetime.timedelta(seconds=self.keep_failed))
+        if self.keep_events is not None:
+            purged += IContactEvent.objects.purge(now -
+                datetime.timedelta(seconds=self.keep_events))
+        return purged
+
+    def paused(self):
+        """
+            Seconds left before iContact may be reachable again, 0 if it
+            should be.
+        """
+        return max(self.paused_until - time.time(), 0)
+
+    def run_once(self):
+        """
+            Processes jobs in the calling thread until the queue is empty, or
+            iContact is unavailable, and returns the number of jobs
+            processed.
+        """
+        self.purge()
+        processed = 0
+        while not self.paused():
+            job = SyncJob.objects.claim()
+            if job is None:
+                return processed
+            self.run_job(job)
+            processed += 1
+        return processed
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                paused = self.paused()
+                if paused:
+                    self._stop.wait(paused)
+                    continue
+                job = SyncJob.objects.claim()
+                if job is None:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                self.run_job(job)
+        finally:
+            #each thread has its own database connection
+            connection.close()
+
+    def start(self):
+        """
+            Starts the worker threads.
+        """
+        self._stop.clear()
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._run,
+                name='icontact-worker-%s' % i)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """
+            Asks the worker threads to finish their current job and waits for
+            them.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
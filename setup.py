@@ -1,18 +1,45 @@
-from distutils.core import setup
+import sys
+
+try:
+    from setuptools import setup
+    from setuptools.command.build_py import build_py
+except ImportError:
+    from distutils.core import setup
+    from distutils.command.build_py import build_py
+
+#modules written for Python 3 only, which Python 2 can't even byte-compile
+PY3_MODULES = ('icontact.aio',)
+
+
+class BuildPy(build_py):
+
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info[0] >= 3:
+            return modules
+        return [(pkg, module, filename) for pkg, module, filename in modules
+            if '%s.%s' % (pkg, module) not in PY3_MODULES]
+
+
 setup(
     name = "django-icontact",
-    packages = ["icontact", ],
+    packages = ["icontact", "icontact.management",
+        "icontact.management.commands", "icontact.migrations"],
     version = "0.3.0",
     description = "A Django application allowing developers to synchronise instances of their models with iContact.",
     author = "RochApps, LLC",
     author_email = "info@rochapps.com",
     url = "http://rochapps.com/",
+    cmdclass = {'build_py': BuildPy},
+    extras_require = {
+        #icontact.aio, on Python 3.6+
+        'async': ['aiohttp'],
+    },
     classifiers = [
         'Environment :: Web Environment',
         'Framework :: Django',
         'Intended Audience :: Developers',
         'Operating System :: OS Independent',
-        'Programming Language :: Python :: 2.6',
         'Programming Language :: Python :: 2.7',
         'Topic :: Internet :: WWW/HTTP',
         'Topic :: Internet :: WWW/HTTP :: Dynamic Content',